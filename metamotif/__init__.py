@@ -1,2 +1,15 @@
 # %%
-from . import alignment, utils, visualize
\ No newline at end of file
+import importlib
+
+__version__ = '0.6.0'
+
+# submodules are imported on first access (e.g. metamotif.visualize imports matplotlib)
+_submodules = ['alignment', 'cache', 'database', 'io', 'kernels', 'kmers', 'profiling', 'search', 'similarity', 'utils', 'visualize']
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(list(globals()) + _submodules)
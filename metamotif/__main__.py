@@ -1,17 +1,51 @@
 # %%
 #import argh
+import importlib
+
 import click
 
+from metamotif import __version__
+
 # %%
-from metamotif.bin import search
+# subcommands as name -> (module:attribute, short help), imported only when run
+COMMANDS = {
+    'search': ('metamotif.bin.search:main', 'Search sequences for high-scoring subsequences.'),
+    'run': ('metamotif.bin.run:main', 'Discover motifs, from search to aligned motifs, without intermediate files.'),
+    'annotate': ('metamotif.bin.annotate:main', 'Annotate motifs with their most similar reference motifs of a database.'),
+    'merge': ('metamotif.bin.merge:main', 'Merge the outputs of sharded metamotif search runs.'),
+    'kmers': ('metamotif.bin.kmers:main', 'Count k-mers across outputs of metamotif search.'),
+    'bench': ('metamotif.bin.bench:main', 'Benchmark metamotif search on synthetic sequences with planted motifs.'),
+}
+
+class LazyGroup(click.Group):
+    """Click group that imports the module of a subcommand only when the subcommand is invoked."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands and name not in self.commands:
+            module_name, attribute = self.lazy_commands[name][0].split(':')
+            self.add_command(getattr(importlib.import_module(module_name), attribute), name=name)
+        return super().get_command(ctx, name)
+
+    def format_commands(self, ctx, formatter):
+        # use the short help of the registry, such that --help does not import any subcommand
+        rows = [(name, self.lazy_commands[name][1] if name in self.lazy_commands else self.commands[name].get_short_help_str()) for name in self.list_commands(ctx)]
+        if len(rows) > 0:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
 
 # %%
-@click.group()
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+@click.version_option(version=__version__, prog_name='metamotif')
 def main():
     pass
 
-# %%
-main.add_command(search.main, name='search')
 # %%
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,8 @@
 # %%
 import logging
-import copy
 
 import numpy as np
 
-from metamotif.utils import pad_matrix
-
 # %%
 class SeededMotifAlignment:
     # def __init__(self, seed, size=5, min_agreement=3):
@@ -33,7 +30,7 @@ class SeededMotifAlignment:
     def pwm(self):
         return self.pam / self.support
     
-    def align(self, kmer):
+    def align(self, kmer, weight=1):
         assert len(kmer) == self.size
         
         agreement_max_idx, agreement_max_val = None, 0
@@ -46,59 +43,148 @@ class SeededMotifAlignment:
         if agreement_max_val < self.min_agreement:
             return False
         else:
-            self.pam[agreement_max_idx:(agreement_max_idx + self.size)] += kmer
-            self.support += 1
+            self.pam[agreement_max_idx:(agreement_max_idx + self.size)] += weight * kmer
+            self.support += weight
             return True
 
+    def align_batch(self, kmers, weights=None):
+        """Aligns a stack of k-mers at once, equivalent to calling align on each k-mer in order.
+
+        Args:
+            kmers (np.ndarray): One-hot encoded k-mers of shape (n_kmers, size, 4).
+            weights (np.ndarray, optional): Weights (e.g. counts) of k-mers. Defaults to None, i.e. weight 1.
+
+        Returns:
+            np.ndarray: Boolean mask of shape (n_kmers, ) of k-mers added to the alignment.
+        """
+
+        kmers = np.asarray(kmers, dtype=np.float32)
+        assert kmers.ndim == 3 and kmers.shape[1] == self.size
+
+        # agreement of each k-mer with each offset of the padded seed, shape (n_kmers, n_offsets)
+        windows = np.lib.stride_tricks.sliding_window_view(self.padded_seed, (self.size, 4))[:, 0]
+        agreement = np.einsum('nkc,wkc->nw', kmers, windows)
+
+        # argmax picks the first offset of maximal agreement (as align does)
+        offsets = np.argmax(agreement, axis=1)
+        aligned = agreement[np.arange(len(kmers)), offsets] >= self.min_agreement
+        if self.min_agreement <= 0:
+            # align only accepts k-mers with positive agreement
+            aligned &= agreement[np.arange(len(kmers)), offsets] > 0
+
+        # add aligned k-mers in bulk, per offset
+        weights = np.ones(len(kmers), dtype=np.int64) if weights is None else np.asarray(weights)
+        for i in np.unique(offsets[aligned]):
+            selected = aligned & (offsets == i)
+            self.pam[i:(i + self.size)] += np.einsum('n,nkc->kc', weights[selected].astype(np.float32), kmers[selected])
+        self.support += weights[aligned].sum().item()
+        return aligned
+
 # %%
 class VariableLengthSeededMotifAlignment:
+    """Alignment of variable-length k-mers to a seed, accumulated in a PFM.
+
+    As in previous versions, the seed is the PFM itself until the PFM is first extended (i.e. aligned motifs are added 
+    to the seed), after which the seed is fixed. Hence, alignment decisions depend on previously aligned motifs while 
+    the seed is aliased (see seed_aliased).
+    """
+
     def __init__(self, seed):
         # seed
-        self.seed = copy.deepcopy(seed)
+        self.seed = np.array(seed)
         
-        # alignment
-        self.pfm = self.seed
+        # alignment, where the PFM is stored in a buffer with (geometrically growing) slack on both sides, 
+        # initially the seed itself (the first extension reallocates the buffer, after which the seed is fixed)
+        self._buffer = self.seed
+        self._pfm_start, self._pfm_stop = 0, len(self.seed)
         self.pfm_seed_offset = 0
         self.support = 1
+
+    @property
+    def pfm(self):
+        return self._buffer[self._pfm_start:self._pfm_stop]
+
+    @pfm.setter
+    def pfm(self, pfm):
+        self._buffer = np.array(pfm)
+        self._pfm_start, self._pfm_stop = 0, len(self._buffer)
     
     @property
     def pwm(self):
         return self.pfm / self.support
+
+    @property
+    def seed_aliased(self):
+        """Whether the seed is (still) the PFM, i.e. changes with each aligned motif."""
+        return self.seed is self._buffer
+
+    def _extend_pfm(self, left=0, right=0):
+        # extends the PFM by zero rows, reallocating the buffer (with slack) only if the current slack is too small
+        if left > self._pfm_start or right > (len(self._buffer) - self._pfm_stop):
+            size = (self._pfm_stop - self._pfm_start) + left + right
+            buffer = np.zeros(shape=(2 * size, self._buffer.shape[1]), dtype=self._buffer.dtype)
+            start = (len(buffer) - size) // 2 + left
+            buffer[start:(start + self._pfm_stop - self._pfm_start)] = self.pfm
+            self._buffer, self._pfm_start, self._pfm_stop = buffer, start, start + self._pfm_stop - self._pfm_start
+        self._pfm_start -= left
+        self._pfm_stop += right
+
+    def _alignment_scores(self, motif_long, motif_short, sim_fn=None):
+        # scores of all offsets of motif_short along motif_long, padded on both sides by len(motif_short) - 1 (i.e. a min. overlap of 1)
+        if sim_fn is None:
+            # sum of products, i.e. the full cross-correlation summed over channels
+            return np.sum([np.correlate(motif_long[:, c], motif_short[:, c], mode='full') for c in range(motif_long.shape[1])], axis=0)
+
+        padding_length = len(motif_short) - 1
+        motif_long = np.pad(motif_long, [[padding_length, padding_length], [0, 0]])
+        return np.array([sim_fn(motif_long[i:(i+len(motif_short))], motif_short) for i in range(len(motif_long) - len(motif_short) + 1)])
     
-    def align(self, motif, sim_fn = lambda x, y: np.sum(x * y), min_score = None):
-        motif = copy.deepcopy(motif)
+    def align(self, motif, sim_fn = None, min_score = None, weight = 1):
+        """Aligns a motif to the seed and adds it to the PFM.
+
+        With weight > 1, this is equivalent to aligning the motif weight times in a row (if it is accepted once, it is 
+        accepted again, as scores of (non-negative) motifs only increase while the seed is aliased).
+
+        Args:
+            motif (np.ndarray): One-hot encoded (or frequency) motif of shape (length, 4).
+            sim_fn (callable, optional): Similarity of two equal-length matrices. Defaults to None, i.e. the sum of their product.
+            min_score (float, optional): Minimum score of the best offset. Defaults to None.
+            weight (int, optional): Weight (e.g. count) of the motif. Defaults to 1.
+
+        Returns:
+            Score of the (first) best offset, or False if it is below min_score.
+        """
+
+        motif = np.asarray(motif)
         assert len(motif) > 1
 
+        max_score = None
+        while weight > 0:
+            # while the seed is aliased, the offset may change with each copy, afterwards the remaining copies are added at once
+            n = 1 if self.seed_aliased else weight
+            score = self._align(motif, sim_fn, min_score if max_score is None else None, n)
+            if score is False:
+                return False
+            max_score = score if max_score is None else max_score
+            weight -= n
+        return max_score
+
+    def _align(self, motif, sim_fn, min_score, weight):
+
         # assign short and long motif
         motif_long, motif_short = (motif, self.seed) if len(motif) > len(self.seed) else (self.seed, motif)
-        
-        # add padding to long motif
         padding_length =  len(motif_short) - 1 # hard-coded min overlap of 1
-        motif_long = pad_matrix(motif_long, padding_left=padding_length, padding_right=padding_length)
 
-        # scan motif_long for best alignment of motif_short
-        max_score = -np.inf
-        max_score_offset = None
-        for i in range(len(motif_long) - len(motif_short) + 1):
-            # take subsequence from motif_long (of length of motif_short) at offset i
-            motif_long_subseq = motif_long[i:(i+len(motif_short))]
-
-            # compute alignment score
-            alignment_score = sim_fn(motif_long_subseq, motif_short)
-
-            if alignment_score > max_score:
-                max_score = alignment_score
-                max_score_offset = i
+        # scan motif_long for best alignment of motif_short (the first offset of max. score)
+        scores = self._alignment_scores(motif_long, motif_short, sim_fn=sim_fn)
+        max_score_offset = int(np.argmax(scores))
+        max_score = scores[max_score_offset]
         
         # break if score is too low
         if min_score is not None:
             if max_score < min_score:
                 return False
-        
-        # align motif_short to motif_long
         logging.debug(f'{max_score_offset=}, {max_score=}')
-        motif_aligned = motif_long
-        motif_aligned[max_score_offset:(max_score_offset+len(motif_short))] += motif_short
 
         # now, we can find the offset of the aligned motif relative to the seed
         if len(motif) > len(self.seed):
@@ -108,25 +194,104 @@ class VariableLengthSeededMotifAlignment:
             # if the non-seed motif is the shorter sequence, it's the offset of the alignment, minus the padding
             offset_to_seed = max_score_offset - padding_length
 
-        
-        # --> using the offset, we can add the aligned motif to the PFM
-        logging.debug(f'{self.pfm_seed_offset=}, {offset_to_seed=}, {len(motif)=}, {len(self.pfm)=}')
-
-        # first, we need to check if we need to left-pad the current PFM (if the motif starts BEFORE the seed)
-        if (self.pfm_seed_offset + offset_to_seed) < 0:
-            logging.debug(f'pad-left: {-(self.pfm_seed_offset + offset_to_seed)}')
-            self.pfm = pad_matrix(self.pfm, padding_left = -(self.pfm_seed_offset + offset_to_seed))
-            # ... and update the offset!
-            self.pfm_seed_offset += -(self.pfm_seed_offset + offset_to_seed)
-        
-        # next, we need to check if we need to right-pad the current PFM
-        if (len(self.pfm) - self.pfm_seed_offset - offset_to_seed) < len(motif):
-            logging.debug(f'pad-right: {len(motif) - (len(self.pfm) - self.pfm_seed_offset - offset_to_seed)}')
-            # in this case, we need to right-pad the current PFM
-            self.pfm = pad_matrix(self.pfm, padding_right = len(motif) - (len(self.pfm) - self.pfm_seed_offset - offset_to_seed))
+        # --> using the offset, we can add the aligned motif to the PFM, after extending it on the left 
+        # (if the motif starts BEFORE the PFM) and/or right (if the motif ends AFTER the PFM)
+        motif_start = self.pfm_seed_offset + offset_to_seed
+        pad_left, pad_right = max(0, -motif_start), max(0, motif_start + len(motif) - len(self.pfm))
+        if pad_left > 0 or pad_right > 0:
+            self._extend_pfm(left=pad_left, right=pad_right)
+            self.pfm_seed_offset += pad_left
+            motif_start += pad_left
+
+        self.pfm[motif_start:(motif_start + len(motif))] += weight * motif
+        self.support += weight
+
+        return max_score
+
+# %%
+def _new_seeded_alignments(kmer, count, min_agreement):
+    # the k-mer seeds a new alignment, which its duplicates align to, unless the k-mer does not align to itself 
+    # (as then, no alignment accepts it), in which case each duplicate seeds its own alignment
+    alignment = SeededMotifAlignment(kmer, min_agreement=min_agreement)
+    if count > 1 and not alignment.align(kmer, weight=count-1):
+        return [alignment] + [SeededMotifAlignment(kmer, min_agreement=min_agreement) for _ in range(count - 1)]
+    return [alignment]
+
+def find_seeded_motifs(kmers, counts=None, min_agreement=3):
+    """Greedily aligns equal-length k-mers (in order) to the first alignment that accepts them, or seeds a new alignment with them.
+
+    The first k-mer seeds the first alignment (and is then aligned to it, like all other k-mers). Each alignment aligns 
+    all remaining k-mers at once (see SeededMotifAlignment.align_batch), which is equivalent to aligning k-mers one by one.
+
+    Args:
+        kmers (np.ndarray): One-hot encoded k-mers of shape (n_kmers, size, 4).
+        counts (np.ndarray, optional): Counts of (distinct) k-mers, see metamotif.kmers.aggregate_kmers. Defaults to None, i.e. 1.
+        min_agreement (int, optional): See SeededMotifAlignment. Defaults to 3.
+
+    Returns:
+        list: SeededMotifAlignments, in order of creation.
+    """
+
+    remaining = np.asarray(kmers)
+    remaining_counts = np.ones(len(remaining), dtype=np.int64) if counts is None else np.asarray(counts)
+    seeded_alignments = [SeededMotifAlignment(remaining[0], min_agreement=min_agreement)]
+    aligned = seeded_alignments[0].align_batch(remaining, weights=remaining_counts)
+    remaining, remaining_counts = remaining[~aligned], remaining_counts[~aligned]
+    while len(remaining) > 0:
+        seeded_alignments += _new_seeded_alignments(remaining[0], int(remaining_counts[0]), min_agreement)
+        aligned = seeded_alignments[-1].align_batch(remaining[1:], weights=remaining_counts[1:])
+        remaining, remaining_counts = remaining[1:][~aligned], remaining_counts[1:][~aligned]
+    return seeded_alignments
+
+def find_variable_length_motifs(kmers, counts=None, min_agreement=3, min_frac_agreement=.5, order=None):
+    """Greedily aligns k-mers (in order) to the first alignment that accepts them, or seeds a new alignment with them.
+
+    A k-mer is accepted if its best alignment score is at least max(min_agreement, min_frac_agreement * min(len(kmer), len(seed))).
+    The first k-mer seeds the first alignment (and is not aligned to it). Since seeds change while they are aliased
+    (see VariableLengthSeededMotifAlignment), results depend on the order of k-mers: with order, k-mers are aligned 
+    one by one in this order (e.g. the order of hits, for the same results as aligning the list of all hits), with 
+    counts, each k-mer is aligned count times in a row. Rejections of a distinct k-mer are remembered (until the seed 
+    of the alignment changes), such that duplicates are not realigned.
+
+    Args:
+        kmers (list): One-hot encoded (distinct) k-mers of shape (length, 4).
+        counts (np.ndarray, optional): Counts of (distinct) k-mers, see metamotif.kmers.aggregate_kmers. Defaults to None, i.e. 1.
+        min_agreement (int, optional): Minimum alignment score. Defaults to 3.
+        min_frac_agreement (float, optional): Minimum alignment score, relative to the overlap. Defaults to .5.
+        order (np.ndarray, optional): Indices of k-mers in the order to align them (overrides counts). Defaults to None.
+
+    Returns:
+        list: VariableLengthSeededMotifAlignments, in order of creation.
+    """
+
+    if order is None:
+        order = np.repeat(np.arange(len(kmers)), 1 if counts is None else counts)
+    order = np.asarray(order)
+    if len(order) == 0:
+        return []
 
-        # finally, we can add the aligned motif to the PFM (using the offset of the seed and the offset of the motive relative to the seed)
-        self.pfm[(self.pfm_seed_offset + offset_to_seed):(self.pfm_seed_offset + offset_to_seed + len(motif))] += motif
-        self.support += 1
+    # runs of the same k-mer are aligned at once (see VariableLengthSeededMotifAlignment.align)
+    run_starts = np.flatnonzero(np.r_[True, order[1:] != order[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, len(order)])
 
-        return max_score
\ No newline at end of file
+    seeded_alignments, rejected = [], []
+    for index, count in zip(order[run_starts].tolist(), run_lengths.tolist()):
+        kmer = kmers[index]
+        while count > 0:
+            for alignment, alignment_rejected in zip(seeded_alignments, rejected):
+                if index in alignment_rejected:
+                    continue
+                score_threshold = max(min_agreement, min_frac_agreement * min(len(kmer), len(alignment.seed)))
+                seed_aliased = alignment.seed_aliased
+                if alignment.align(kmer, min_score = score_threshold, weight = count):
+                    if seed_aliased:
+                        # the seed may have changed
+                        alignment_rejected.clear()
+                    count = 0
+                    break
+                alignment_rejected.add(index)
+            else:
+                seeded_alignments.append(VariableLengthSeededMotifAlignment(kmer))
+                rejected.append(set())
+                count -= 1
+    return seeded_alignments
@@ -1 +1,10 @@
-from . import search
\ No newline at end of file
+# %%
+import importlib
+
+# commands are imported on first access, see metamotif.__main__
+_submodules = ['search', 'bench', 'annotate', 'kmers', 'run', 'merge']
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
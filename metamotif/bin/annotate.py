@@ -0,0 +1,57 @@
+# %%
+from pathlib import Path
+
+import click
+import numpy as np
+
+from metamotif.database import MotifDatabase
+from metamotif.utils import read_motif_tsv
+
+# %%
+def load_query_motifs(filepaths):
+    """Loads query motifs from motif TSVs (see metamotif.utils.write_motif_tsv) or TRANSFAC/MEME files.
+
+    Returns:
+        tuple: List of motif ids and list of PWMs.
+    """
+
+    ids, pwms = [], []
+    for filepath in filepaths:
+        if str(filepath).endswith('.tsv'):
+            pwm, _, _ = read_motif_tsv(filepath)
+            ids.append(Path(filepath).stem)
+            pwms.append(pwm)
+        else:
+            motifs = MotifDatabase.parse(filepath)
+            ids += list(motifs.ids)
+            pwms += [np.asarray(motifs[i]) for i in range(len(motifs))]
+    return ids, pwms
+
+# %%
+@click.command()
+@click.argument('motifs', nargs=-1, required=True, metavar='<motif.tsv|motifs.meme|motifs.transfac>...')
+@click.option('-d', '--database', required=True, help='Reference motifs, as TRANSFAC or MEME file, or .npz store.')
+@click.option('-o', '--output', default='-', show_default=True)
+@click.option('-k', '--top-k', type=click.IntRange(min=1), default=5, show_default=True)
+@click.option('--min-size', type=click.IntRange(min=1), default=3, show_default=True, help='Minimum overlap of aligned motifs.')
+@click.option('--max-length-difference', type=int, default=None, help='Only score reference motifs with a length difference of at most this.')
+@click.option('--max-ic-difference', type=float, default=None, help='Only score reference motifs with a mean information content (bits) differing by at most this.')
+@click.option('--cache-dir', default=None, help='Cache of parsed databases. Defaults to ~/.cache/metamotif/motif-databases.')
+@click.option('--no-cache', is_flag=True, default=False, help='Always parse the database.')
+def main(motifs, database, output, top_k, min_size, max_length_difference, max_ic_difference, cache_dir, no_cache):
+    """Annotates motifs with their most similar reference motifs of a database."""
+
+    database = MotifDatabase.load(database, cache_dir=(False if no_cache else cache_dir))
+    query_ids, query_pwms = load_query_motifs(motifs)
+    matches, similarities = database.match(query_pwms, top_k=top_k, min_size=min_size, max_length_difference=max_length_difference, max_ic_difference=max_ic_difference)
+
+    with click.open_file(output, 'w') as fout:
+        for query_id, query_pwm, query_matches, query_similarities in zip(query_ids, query_pwms, matches, similarities):
+            for rank, (match, similarity) in enumerate(zip(query_matches, query_similarities)):
+                if match < 0:
+                    break
+                print(f'{query_id}\t{rank+1}\t{database.ids[match]}\t{similarity:.4f}\t{len(query_pwm)}\t{database.lengths[match]}', file=fout)
+
+# %%
+if __name__ == '__main__':
+    main()
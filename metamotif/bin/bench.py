@@ -0,0 +1,229 @@
+# %%
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+
+# %%
+def make_planted_dataset(directory, n_sequences=1000, sequence_length=200, motif='ACTAAC', n_motifs=2, noise=0.1, seed=0):
+    """Writes a synthetic dataset of random sequences with planted motifs to directory.
+
+    Scores are Gaussian noise, plus a uniform random boost on the positions of the planted motif instances.
+
+    Returns:
+        tuple: Paths to the FASTA file and the scores (.npy) file.
+    """
+
+    rng = np.random.default_rng(seed)
+    sequences = rng.choice(np.array(list('ACGT')), size=(n_sequences, sequence_length))
+    scores = rng.normal(0, noise, size=(n_sequences, sequence_length))
+    for i in range(n_sequences):
+        for position in rng.integers(0, sequence_length - len(motif) + 1, size=n_motifs):
+            sequences[i, position:(position + len(motif))] = list(motif)
+            scores[i, position:(position + len(motif))] += rng.uniform(3 * noise, 10 * noise)
+
+    fasta, scores_npy = Path(directory) / 'sequences.fasta', Path(directory) / 'scores.npy'
+    with open(fasta, 'w') as f:
+        for i in range(n_sequences):
+            print(f'>seq{i}\n{"".join(sequences[i])}', file=f)
+    np.save(scores_npy, scores)
+    return str(fasta), str(scores_npy)
+
+# %%
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024**2 if platform.system() == 'Darwin' else 1024)
+
+def _dataset_key(case):
+    return case['n_sequences'], case['sequence_length'], case['seed']
+
+def prepare_datasets(cases, directory):
+    """Writes the dataset of each distinct (n_sequences, sequence_length, seed) of cases to directory and sets the paths 
+    (fasta, scores) of each case. Datasets are generated in a separate process, such that neither this process nor the 
+    processes of benchmarked cases (see run_case) hold the generated data in memory."""
+
+    datasets = {}
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        for case in cases:
+            key = _dataset_key(case)
+            if key not in datasets:
+                dataset_directory = Path(directory) / 'dataset-{}-{}-{}'.format(*key)
+                dataset_directory.mkdir()
+                datasets[key] = pool.apply(make_planted_dataset, (str(dataset_directory), ), dict(n_sequences=key[0], sequence_length=key[1], seed=key[2]))
+            case['fasta'], case['scores'] = datasets[key]
+
+def run_case(case):
+    """Benchmarks a single case (dict of dataset paths, see prepare_datasets, and search parameters). Meant to run in a fresh 
+    process, such that peak memory is per case (and, since datasets are generated beforehand, that of the search only)."""
+
+    import gin
+    from metamotif.bin.search import main as search_main
+    from metamotif.search import threshold_cache
+
+    with tempfile.TemporaryDirectory() as directory:
+        fasta, scores_npy = case['fasta'], case['scores']
+        config = Path(directory) / 'search.config.gin'
+        config.write_text(''.join(f'search.{name} = {case[name]!r}\n' for name in ['sig_p', 'seed_size', 'max_size', 'threshold_method', 'backend']))
+        output, profile = str(Path(directory) / 'kmers.tsv'), str(Path(directory) / 'profile.json')
+
+        # time end-to-end runs, with per-stage timers and counters from the profiler (see metamotif.profiling)
+        runs = []
+        for _ in range(case['repeats']):
+            gin.clear_config()
+            threshold_cache.clear()
+            t = time.perf_counter()
+            search_main([fasta, scores_npy, '-c', str(config), '-o', output, '--seed', str(case['seed']), '--profile', profile], standalone_mode=False)
+            seconds = time.perf_counter() - t
+            with open(profile) as f:
+                runs.append((seconds, json.load(f)))
+
+        # report the fastest repeat
+        seconds, stats = min(runs, key=lambda run: run[0])
+        result = {name: value for name, value in case.items() if name not in ('fasta', 'scores')}
+        result['seconds'] = {'end_to_end': seconds, **stats['seconds']}
+        result['counters'] = stats['counters']
+        result['sequences_per_second'] = case['n_sequences'] / seconds
+        result['n_kmers'] = stats['counters'].get('kmers_emitted', 0)
+        result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+# %%
+def compare_backends(n_sequences=1000, sequence_length=200, seed=0, backend='numba'):
+    """Compares the hits of search_batch with the given backend to those of the reference 'numpy' backend on a planted dataset.
+
+    Returns:
+        list: Search parameters (dicts) of all combinations of extension and threshold method for which hits differ.
+    """
+
+    from metamotif.search import search_batch, threshold_cache
+
+    with tempfile.TemporaryDirectory() as directory:
+        _, scores_npy = make_planted_dataset(directory, n_sequences=n_sequences, sequence_length=sequence_length, seed=seed)
+        scores = np.load(scores_npy)
+
+    mismatches = []
+    for extension, threshold_method in itertools.product(['legacy', 'window'], ['sampling', 'exact']):
+        hits = []
+        for backend_ in ['numpy', backend]:
+            # seeded thresholds are independent of the order in which they are computed (see ThresholdCache)
+            threshold_cache.clear()
+            threshold_cache.seed = seed
+            hits.append(search_batch(scores, extension=extension, threshold_method=threshold_method, backend=backend_))
+        if not np.array_equal(*hits):
+            mismatches.append({'extension': extension, 'threshold_method': threshold_method})
+    return mismatches
+
+# %%
+def startup_seconds(args=('--help', ), repeats=5):
+    """Returns the fastest wall time of repeats fresh `python -m metamotif` invocations with args (e.g. --help)."""
+
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'metamotif', *args], check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+# %%
+def _case_key(case):
+    return tuple(case.get(name, 'numpy') for name in ['n_sequences', 'sequence_length', 'seed_size', 'max_size', 'sig_p', 'threshold_method', 'backend'])
+
+def compare_reports(report, previous):
+    """Returns a list of (case, end-to-end runtime ratio current / previous) of all cases present in both reports."""
+
+    previous_cases = {_case_key(case): case for case in previous['cases']}
+    comparison = []
+    for case in report['cases']:
+        if _case_key(case) in previous_cases:
+            previous_seconds = previous_cases[_case_key(case)]['seconds']['end_to_end']
+            comparison.append((case, case['seconds']['end_to_end'] / previous_seconds))
+    return comparison
+
+def _parse_list(value, type_):
+    return [type_(x) for x in value.split(',')]
+
+def _versions():
+    from metamotif import __version__
+    from metamotif.kernels import numba
+    return {'metamotif': __version__, 'numpy': np.__version__, 'numba': numba.__version__ if numba is not None else None, 'python': platform.python_version()}
+
+# %%
+@click.command()
+@click.option('--n-sequences', default='1000', show_default=True, help='Comma-separated list of numbers of sequences.')
+@click.option('--sequence-length', default='200', show_default=True, help='Comma-separated list of sequence lengths.')
+@click.option('--seed-size', default='2', show_default=True, help='Comma-separated list of search.seed_size values.')
+@click.option('--max-size', default='20', show_default=True, help='Comma-separated list of search.max_size values.')
+@click.option('--sig-p', default='0.01', show_default=True, help='Comma-separated list of search.sig_p values.')
+@click.option('--threshold-method', default='sampling', show_default=True, help='Comma-separated list of search.threshold_method values.')
+@click.option('--backend', default='numpy', show_default=True, help="Comma-separated list of search.backend values ('numpy', 'numba').")
+@click.option('--check-backends', is_flag=True, help="Fail unless the 'numba' backend finds the same hits as the 'numpy' backend.")
+@click.option('--repeats', type=click.IntRange(min=1), default=3, show_default=True, help='Repeats per case, the fastest is reported.')
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('-o', '--output', default=None, help='Path of the JSON report.')
+@click.option('--compare', default=None, help='JSON report of a previous run to compare against.')
+@click.option('--max-slowdown', type=float, default=None, help='Fail if any case is slower than in --compare by more than this factor (e.g. 1.1).')
+@click.option('--max-startup', type=float, default=None, help='Fail if `metamotif --help` takes longer than this many seconds.')
+def main(n_sequences, sequence_length, seed_size, max_size, sig_p, threshold_method, backend, check_backends, repeats, seed, output, compare, max_slowdown, max_startup):
+    """Benchmarks metamotif search on synthetic sequences with planted motifs."""
+
+    if check_backends:
+        # equivalence of the compiled kernel and the reference implementation
+        from metamotif.kernels import numba
+        if numba is None:
+            raise click.ClickException('--check-backends requires numba.')
+        mismatches = compare_backends(n_sequences=_parse_list(n_sequences, int)[0], sequence_length=_parse_list(sequence_length, int)[0], seed=seed)
+        if len(mismatches) > 0:
+            raise click.ClickException(f"Backend 'numba' differs from 'numpy' for: {mismatches}")
+        click.echo("backends: 'numba' and 'numpy' find identical hits")
+
+    grid = itertools.product(_parse_list(n_sequences, int), _parse_list(sequence_length, int), _parse_list(seed_size, int), _parse_list(max_size, int), _parse_list(sig_p, float), _parse_list(threshold_method, str), _parse_list(backend, str))
+    cases = [dict(n_sequences=n, sequence_length=l, seed_size=s, max_size=m, sig_p=p, threshold_method=t, backend=b, repeats=repeats, seed=seed) for n, l, s, m, p, t, b in grid]
+
+    # run each case in a fresh process, such that peak memory is measured per case
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_datasets(cases, directory)
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            for result in pool.imap(run_case, cases):
+                click.echo(f"n_sequences={result['n_sequences']} sequence_length={result['sequence_length']} seed_size={result['seed_size']} max_size={result['max_size']} sig_p={result['sig_p']} threshold_method={result['threshold_method']} backend={result['backend']}: " +
+                           f"{result['seconds']['end_to_end']:.3f}s ({result['sequences_per_second']:.1f} sequences/s, {result['peak_rss_mb']:.0f} MB) | " +
+                           ' '.join(f'{stage}={seconds:.3f}s' for stage, seconds in result['seconds'].items() if stage != 'end_to_end'))
+                results.append(result)
+            pool.close()
+            pool.join()
+
+    # time of a fresh CLI invocation that runs no subcommand (see the lazy command registry in metamotif.__main__)
+    startup = startup_seconds(repeats=repeats)
+    click.echo(f'startup (metamotif --help): {startup:.3f}s')
+
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'versions': _versions(), 'startup_seconds': startup, 'cases': results}
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if compare is not None:
+        with open(compare) as f:
+            previous = json.load(f)
+        slowest = 0.0
+        for case, ratio in compare_reports(report, previous):
+            click.echo(f'{_case_key(case)}: {ratio:.2f}x runtime of previous run')
+            slowest = max(slowest, ratio)
+        if max_slowdown is not None and slowest > max_slowdown:
+            raise click.ClickException(f'Slowdown of {slowest:.2f}x exceeds --max-slowdown {max_slowdown}.')
+
+    if max_startup is not None and startup > max_startup:
+        raise click.ClickException(f'Startup time of {startup:.3f}s exceeds --max-startup {max_startup}.')
+
+# %%
+if __name__ == '__main__':
+    main()
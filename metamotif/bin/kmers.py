@@ -0,0 +1,28 @@
+# %%
+import click
+
+from metamotif.kmers import count_kmers
+from metamotif.utils import sequence2onehot, matrix_to_transfac
+
+# %%
+@click.command()
+@click.argument('hits', nargs=-1, required=True, metavar='<kmers.tsv|kmers.tsv.gz|kmers.npz|kmers.parquet>...')
+@click.option('-o', '--output', default='-', show_default=True)
+@click.option('--output-format', type=click.Choice(['tsv', 'transfac']), default='tsv', show_default=True, help='Table of k-mer, count and frequency, or one TRANSFAC count matrix per k-mer.')
+@click.option('--min-count', type=int, default=1, show_default=True)
+@click.option('--alphabet', default='ACGT', show_default=True, help='Alphabet of TRANSFAC matrices.')
+@click.option('--chunk-size', type=int, default=1_000_000, show_default=True, help='Number of hits read at once.')
+def main(hits, output, output_format, min_count, alphabet, chunk_size):
+    """Counts k-mers across one or more outputs (e.g. shards) of metamotif search."""
+
+    counter = count_kmers(hits, chunk_size=chunk_size)
+    with click.open_file(output, 'w') as fout:
+        for i, (kmer, count) in enumerate(counter.most_common(min_count=min_count)):
+            if output_format == 'tsv':
+                print(f'{kmer}\t{count}\t{count / counter.total:.6g}', file=fout)
+            else:
+                print(matrix_to_transfac(sequence2onehot(kmer, sigma=alphabet) * count, id=i, alphabet=alphabet), end='', file=fout)
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+# %%
+import os
+
+import click
+
+from metamotif.io import merge_hits, infer_hit_format, HIT_WRITERS
+
+# %%
+@click.command()
+@click.argument('shards', metavar='<shard-0> <shard-1> ...', nargs=-1, required=True)
+@click.option('-o', '--output', required=True)
+@click.option('--output-format', type=click.Choice(list(HIT_WRITERS)), default=None, help='Format of the shards (and merged output). Defaults to the format inferred from the file extension of the first shard.')
+def main(shards, output, output_format):
+    """Merges the outputs of metamotif search --shard i/n, given in shard order (i = 0, ..., n-1)."""
+
+    if output_format is None:
+        output_format = infer_hit_format(shards[0])
+    incomplete = [shard for shard in shards if os.path.exists(f'{shard}.checkpoint')]
+    if len(incomplete) > 0:
+        raise click.UsageError(f'Shards are incomplete (resume them via metamotif search --resume): {", ".join(incomplete)}')
+    try:
+        merge_hits(shards, output, output_format)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# %%
+import contextlib
+from pathlib import Path
+
+import click
+import gin
+import tqdm
+
+from metamotif.alignment import find_seeded_motifs, find_variable_length_motifs
+from metamotif.bin.search import iter_search
+from metamotif.io import load_scores, kmer_sequences, open_hit_writer, HIT_WRITERS
+from metamotif.kmers import KmerAggregator
+from metamotif.utils import sequence2onehot, sequences2onehot, write_motif_tsv
+
+# %%
+def write_motifs(motifs, output_directory, total_support, min_support=100, max_motifs=5, logos=True):
+    """Writes the (up to) max_motifs alignments with the highest support (of at least min_support) as motif TSVs (and logos)."""
+
+    output_path = Path(output_directory) / 'motif-{i}'
+    output_path.parent.mkdir(exist_ok=True, parents=True)
+    output_path = str(output_path)
+    for i, motif in enumerate(sorted(motifs, key = lambda x: x.support, reverse=True)):
+        if i >= max_motifs:
+            break
+        if motif.support < min_support:
+            break
+
+        write_motif_tsv(motif.pwm, filepath=(output_path.format(i=i) + '.tsv'), meta_info={'support': motif.support})
+        if logos:
+            from metamotif.visualize import plot_motif
+            fig = plot_motif(motif.pwm, ylab = 'Occupancy', title=f'{motif.support}/{total_support}')
+            fig.savefig((output_path.format(i=i) + '.pdf'), bbox_inches='tight')
+            fig.savefig((output_path.format(i=i) + '.png'), bbox_inches='tight')
+
+# %%
+@click.command()
+@click.argument('fasta', metavar='<sequences.fasta>')
+@click.argument('scores', metavar='<scores.npy|scores.npz>')
+@click.option('-c', '--config', default=None)
+@click.option('-o', '--output-directory', required=True)
+@click.option('--hits', default=None, help='Also write hits of the search to this file (see metamotif search).')
+@click.option('--hits-format', type=click.Choice(list(HIT_WRITERS)), default='tsv', show_default=True)
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Number of sequences searched at once.')
+@click.option('--background', type=click.Choice(['sequence', 'global']), default='sequence', show_default=True, help='Null distribution of significance thresholds: per sequence or computed once from all scores.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True, help='Number of worker processes.')
+@click.option('--seed', type=int, default=None, help='Seed for null sampling.')
+@click.option('--alignment', type=click.Choice(['variable-length', 'seeded']), default='variable-length', show_default=True, help='Alignment of k-mers (seeded requires k-mers of equal length, see --kmer-length).')
+@click.option('--kmer-length', type=int, default=None, help='Only align k-mers of this length.')
+@click.option('--min-support', type=int, default=100, show_default=True)
+@click.option('--max-motifs', type=int, default=5, show_default=True)
+@click.option('--min-alignment-agreement', type=int, default=3, show_default=True)
+@click.option('--min-alignment-agreement-frac', type=float, default=.5, show_default=True)
+@click.option('--logos/--no-logos', default=True, show_default=True, help='Plot motif logos (PDF and PNG).')
+def main(fasta, scores, config, output_directory, hits, hits_format, batch_size, background, jobs, seed, alignment, kmer_length, min_support, max_motifs, min_alignment_agreement, min_alignment_agreement_frac, logos):
+    """Discovers motifs, by searching sequences and aligning the k-mers of hits, without intermediate files."""
+
+    if config is not None:
+        gin.parse_config_file(config)
+
+    # search, streaming the k-mers of hits into the aggregation (and, optionally, a hits file)
+    scores = load_scores(scores)
+    aggregator = KmerAggregator()
+    with (open_hit_writer(hits, hits_format) if hits is not None else contextlib.nullcontext()) as writer, tqdm.tqdm(total=len(scores)) as pbar:
+        for chunk_start, batch_records, chunk_hits in iter_search(fasta, scores, batch_size=batch_size, background=background, jobs=jobs, seed=seed, config=config):
+            if writer is not None:
+                writer.write(batch_records, chunk_hits, index_offset=chunk_start)
+            kmers = kmer_sequences(batch_records, chunk_hits)
+            if kmer_length is not None:
+                selected = (chunk_hits['stop'] - chunk_hits['start']) == kmer_length
+                kmers, chunk_hits = [kmer for kmer, s in zip(kmers, selected) if s], chunk_hits[selected]
+            aggregator.update(kmers, chunk_hits['score'])
+            pbar.update(len(batch_records))
+
+    # k-mers are aligned in order of the scores of hits (descending), compared as numbers
+    kmers, counts, _, order = aggregator.aggregate(return_order=True)
+    if len(kmers) == 0:
+        raise click.ClickException('No hits found.')
+
+    # align k-mers and write motifs
+    if alignment == 'seeded':
+        if len(set(map(len, kmers))) > 1:
+            raise click.UsageError('Seeded alignment requires k-mers of equal length, see --kmer-length.')
+        motifs = find_seeded_motifs(sequences2onehot(kmers), counts, min_agreement=min_alignment_agreement)
+    else:
+        motifs = find_variable_length_motifs([sequence2onehot(kmer) for kmer in kmers], order=order, min_agreement=min_alignment_agreement, min_frac_agreement=min_alignment_agreement_frac)
+    write_motifs(motifs, output_directory, total_support=aggregator.total, min_support=min_support, max_motifs=max_motifs, logos=logos)
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,329 @@
 # %%
+import collections
+import json
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
 import click
 import gin
 import tqdm
 import numpy as np
-from Bio import SeqIO
 
-from metamotif.search import search
+from metamotif.cache import ResultCache, parse_size
+from metamotif.io import RaggedScores, load_scores, iter_record_chunks, open_hit_writer, HIT_WRITERS
+from metamotif.profiling import profiler
+from metamotif.search import search_batch, search_segments, search_tiles, window_tiles, search_config, background_thresholds, threshold_cache
+
+# %%
+# per-process search state, set by _init_worker (or directly, for serial runs)
+_worker = {}
+
+def _init_worker(scores_source, config, seed, thresholds, profile):
+    if config is not None:
+        gin.parse_config_file(config)
+    threshold_cache.seed = seed
+    profiler.enabled = profile
+
+    if scores_source[0] == 'file':
+        _, filename = scores_source
+        _worker['scores'] = load_scores(filename)
+    elif scores_source[0] == 'object':
+        _, _worker['scores'] = scores_source
+    else:
+        _, shm_name, shape, dtype = scores_source
+        _worker['shm'] = shared_memory.SharedMemory(name=shm_name)
+        _worker['scores'] = np.ndarray(shape, dtype=dtype, buffer=_worker['shm'].buf)
+    _worker['thresholds'] = thresholds
+
+def _search_chunk(chunk):
+    if isinstance(chunk, np.ndarray):
+        # tiles of windows, see search_tiled_chunks
+        return search_tiles(_worker['scores'], chunk, thresholds=_worker['thresholds'])
+    chunk_start, chunk_stop = chunk
+    chunk_scores = _worker['scores'][chunk_start:chunk_stop]
+    if isinstance(chunk_scores, RaggedScores):
+        return search_segments(list(chunk_scores), thresholds=_worker['thresholds'])
+    return search_batch(chunk_scores, thresholds=_worker['thresholds'])
+
+def _search_chunk_with_stats(chunk):
+    # hits and the profiler stats of the worker process (since the last chunk)
+    return _search_chunk(chunk), profiler.pop_stats()
+
+def _imap_merge_stats(pool, chunks):
+    for hits, stats in pool.imap(_search_chunk_with_stats, chunks):
+        profiler.merge(stats)
+        yield hits
+
+def search_chunks(scores, chunks, jobs=1, config=None, seed=None, thresholds=None):
+    """Searches chunks (start, stop) of rows of the score matrix, using a pool of jobs processes if jobs > 1.
+
+    Workers memory-map the scores if they are memory-mapped (see load_scores), otherwise a score matrix is placed
+    in shared memory once, so that workers do not receive copies of it.
+
+    Profiler stats of workers are merged into the profiler of the calling process.
+
+    Yields:
+        np.ndarray: Hits (see search_batch) of each chunk, in the order of chunks.
+    """
+
+    threshold_cache.seed = seed
+    if jobs == 1:
+        _worker.update(scores=scores, thresholds=thresholds)
+        yield from map(_search_chunk, chunks)
+        return
+
+    if getattr(scores, 'filename', None) is not None:
+        scores_source = ('file', scores.filename)
+    elif isinstance(scores, RaggedScores):
+        scores_source = ('object', scores)
+    else:
+        scores_source = None
+    
+    if scores_source is not None:
+        with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(scores_source, config, seed, thresholds, profiler.enabled)) as pool:
+            yield from _imap_merge_stats(pool, chunks)
+        return
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, scores.nbytes))
+    try:
+        np.ndarray(scores.shape, dtype=scores.dtype, buffer=shm.buf)[:] = scores
+        with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(('shm', shm.name, scores.shape, scores.dtype), config, seed, thresholds, profiler.enabled)) as pool:
+            yield from _imap_merge_stats(pool, chunks)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _sequence_lengths(scores):
+    return scores.lengths if isinstance(scores, RaggedScores) else np.full(len(scores), scores.shape[1])
+
+def _window_chunks(lengths, start, stop, window_size, batch_size):
+    # chunks (start, stop) of consecutive sequences of (about) batch_size windows, or single sequences of more windows
+    chunks, chunk_start, n_windows = [], start, 0
+    for i, n in enumerate(np.maximum(1, -(-lengths[start:stop] // window_size)).tolist(), start):
+        n_windows += n
+        if n_windows >= batch_size:
+            chunks.append((chunk_start, i + 1))
+            chunk_start, n_windows = i + 1, 0
+    if chunk_start < stop:
+        chunks.append((chunk_start, stop))
+    return chunks
+
+def search_tiled_chunks(scores, chunks, window_size, overlap, batch_size=1000, **kwargs):
+    """Searches chunks (start, stop) of sequences in overlapping windows (see search_tiles), in batches of up to batch_size windows.
+
+    Batches of windows are searched via search_chunks (kwargs are passed on), such that memory is bounded by the window size 
+    rather than the length of sequences, and windows of one long sequence are searched in parallel. 
+
+    Yields:
+        np.ndarray: Hits (see search_batch) of each chunk, in the order of chunks.
+    """
+
+    lengths = _sequence_lengths(scores)
+    # (start of the chunk, whether it is the chunk's last batch) of each batch, such that chunks are consumed lazily
+    batch_chunks = collections.deque()
+
+    def iter_batches():
+        for chunk_start, chunk_stop in chunks:
+            tiles = window_tiles(lengths[chunk_start:chunk_stop], window_size, overlap)
+            tiles[:, 0] += chunk_start
+            tiles_starts = range(0, max(len(tiles), 1), batch_size)
+            for tiles_start in tiles_starts:
+                batch_chunks.append((chunk_start, tiles_start == tiles_starts[-1]))
+                yield tiles[tiles_start:(tiles_start + batch_size)]
+
+    chunk_batches_hits = []
+    for batch_hits in search_chunks(scores, iter_batches(), **kwargs):
+        chunk_start, is_last = batch_chunks.popleft()
+        chunk_batches_hits.append(batch_hits)
+        if is_last:
+            hits = np.concatenate(chunk_batches_hits)
+            hits['index'] -= chunk_start
+            yield hits
+            chunk_batches_hits = []
+
+def iter_search(fasta, scores, batch_size=1000, background=None, jobs=1, seed=None, config=None, start=0, stop=None, cache=None, window=None, window_overlap=None):
+    """Searches all sequences (or sequences start to stop) in chunks of batch_size sequences (see search_chunks).
+
+    Since thresholds do not depend on how sequences are chunked (see ThresholdCache), searching a range of sequences 
+    yields the same hits for these sequences as searching all sequences (with background='global', thresholds are 
+    always computed from the scores of all sequences).
+
+    Args:
+        fasta (str): Path to FASTA file.
+        scores (np.ndarray or RaggedScores): Scores, see load_scores.
+        background (str, optional): 'sequence' (per-sequence null distributions) or 'global' (one null distribution of all scores). 
+            Defaults to None, i.e. 'sequence', or 'global' if window is given.
+        start (int, optional): Index of the first sequence to search. Defaults to 0.
+        stop (int, optional): Index after the last sequence to search. Defaults to None (all sequences).
+        cache (ResultCache, optional): Cache of the hits of chunks (see metamotif.cache). Defaults to None (no caching).
+        window (int, optional): If given, sequences are searched in windows of this size (see search_tiled_chunks), with thresholds 
+            from the global background, and batch_size is the number of windows searched at once. Defaults to None (whole sequences).
+        window_overlap (int, optional): Overlap of windows, at least (and by default) search.max_size + search.extend_flanks.
+
+    Raises:
+        ValueError: If window is given with background='sequence', or window_overlap is too small (raised by the call, 
+            rather than on iteration).
+
+    Returns:
+        iterator: Tuples of the index of the first sequence of a chunk, FASTA records of the chunk and their hits (see search_batch), 
+            ordered by sequence and start, with or without windows.
+    """
+
+    if window is not None:
+        if background == 'sequence':
+            raise ValueError('Windows are searched with thresholds from the global background, i.e. require background=\'global\'.')
+        params = search_config()
+        min_overlap = params['max_size'] + params['extend_flanks']
+        window_overlap = min_overlap if window_overlap is None else window_overlap
+        if window_overlap < min_overlap:
+            raise ValueError(f'Window overlap must be at least search.max_size + search.extend_flanks = {min_overlap}, got {window_overlap}.')
+    if background is None:
+        background = 'sequence' if window is None else 'global'
+    return _iter_search(fasta, scores, batch_size, background, jobs, seed, config, start, stop, cache, window, window_overlap)
+
+def _iter_search(fasta, scores, batch_size, background, jobs, seed, config, start, stop, cache, window, window_overlap):
+    # see iter_search, with validated arguments
+    thresholds = None
+    if background == 'global':
+        params = search_config()
+        with profiler.timer('thresholds'):
+            thresholds = background_thresholds((scores.values if isinstance(scores, RaggedScores) else scores), sizes=range(params['seed_size'], params['max_size'] + 1, 2), sig_p=params['sig_p'], seed=seed, method=params['threshold_method'])
+
+    stop = len(scores) if stop is None else min(stop, len(scores))
+    if window is None:
+        chunks = [(chunk_start, min(chunk_start + batch_size, stop)) for chunk_start in range(start, stop, batch_size)]
+    else:
+        chunks = _window_chunks(_sequence_lengths(scores), start, stop, window, batch_size)
+    if window is None:
+        search_fn = lambda chunks_: search_chunks(scores, chunks_, jobs=jobs, config=config, seed=seed, thresholds=thresholds)
+    else:
+        search_fn = lambda chunks_: search_tiled_chunks(scores, chunks_, window, window_overlap, batch_size=batch_size, jobs=jobs, config=config, seed=seed, thresholds=thresholds)
+
+    if cache is None:
+        hits_chunks = search_fn(chunks)
+    else:
+        # chunks are keyed by their scores and sequences, and everything else hits depend on
+        params = {'search': search_config(), 'seed': seed, 'background': background, 'thresholds': thresholds, 'window': window, 'window_overlap': window_overlap}
+        def iter_keys():
+            # keys are computed lazily, alongside the search (see ResultCache.iter_cached)
+            for (chunk_start, chunk_stop), records in zip(chunks, iter_record_chunks(fasta, chunks)):
+                with profiler.timer('cache'):
+                    key = cache.chunk_key(scores[chunk_start:chunk_stop], [str(record.seq) for record in records], params)
+                yield key
+        hits_chunks = cache.iter_cached(chunks, iter_keys(), search_fn)
+    hits_chunks = profiler.timed(hits_chunks, 'search')
+    records_chunks = profiler.timed(iter_record_chunks(fasta, chunks), 'parse')
+    for (chunk_start, _), hits, batch_records in zip(chunks, hits_chunks, records_chunks):
+        # hits of a sequence are ordered by position, since windows find them in a different order than whole sequences
+        hits = hits[hits['index'] < len(batch_records)]
+        yield chunk_start, batch_records, hits[np.lexsort((hits['start'], hits['index']))]
+
+# %%
+def parse_shard(ctx, param, value):
+    # click callback, parses 'i/n' into (i, n)
+    if value is None:
+        return None
+    try:
+        i, n = [int(x) for x in value.split('/')]
+    except ValueError:
+        raise click.BadParameter('expected i/n, e.g. 0/4')
+    if not (n >= 1 and 0 <= i < n):
+        raise click.BadParameter('expected 0 <= i < n')
+    return i, n
+
+def shard_range(n_sequences, i, n):
+    """Returns the range (start, stop) of sequences of shard i of n, i.e. the i-th of n contiguous, near-equal parts."""
+
+    return (i * n_sequences) // n, ((i + 1) * n_sequences) // n
+
+def read_checkpoint(filepath):
+    with open(filepath) as f:
+        return json.load(f)
+
+def write_checkpoint(filepath, checkpoint):
+    # write to a temporary file first, such that an interrupted write never leaves a corrupt checkpoint
+    tmp_filepath = f'{filepath}.tmp'
+    with open(tmp_filepath, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_filepath, filepath)
 
 # %%
 @click.command()
 @click.argument('fasta', metavar='<sequences.fasta>')
-@click.argument('scores', metavar='<scores.npy>') # help='A numpy array of shape (n_sequences, sequence_length).'
+@click.argument('scores', metavar='<scores.npy|scores.npz>') # help='A numpy array of shape (n_sequences, sequence_length), or a .npz with flat scores and offsets of variable-length sequences.'
 @click.option('-c', '--config', default=None)
 @click.option('-o', '--output', default=None)
+@click.option('--output-format', type=click.Choice(list(HIT_WRITERS)), default='tsv', show_default=True, help='TSV (optionally gzip-compressed), or columnar .npz/Parquet (requires pyarrow).')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Number of sequences searched at once.')
+@click.option('--background', type=click.Choice(['sequence', 'global']), default=None, help='Null distribution of significance thresholds: per sequence or computed once from all scores. Defaults to sequence, or to global with --window (which requires it).')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True, help='Number of worker processes.')
+@click.option('--seed', type=int, default=None, help='Seed for null sampling. Output is reproducible for a given seed, regardless of --jobs.')
+@click.option('--profile', default=None, metavar='<profile.json>', help='Write per-stage timers and counters to a JSON file.')
+@click.option('--shard', default=None, metavar='i/n', callback=parse_shard, help='Search only the i-th (0-based) of n contiguous parts of the sequences. Combine shard outputs via metamotif merge.')
+@click.option('--checkpoint', is_flag=True, help='After each batch, record the progress in <output>.checkpoint (TSV output only).')
+@click.option('--resume', is_flag=True, help='Resume an interrupted run from <output>.checkpoint, if present (implies --checkpoint).')
+@click.option('--window', type=click.IntRange(min=1), default=None, help='Search long sequences (e.g. chromosome-wide scores) in overlapping windows of this size, with thresholds from the global background (i.e. not with --background sequence). --batch-size is then the number of windows searched at once.')
+@click.option('--window-overlap', type=int, default=None, help='Overlap of windows, at least (and by default) search.max_size + search.extend_flanks.')
+@click.option('--cache-dir', default=None, help='Cache hits of each batch in this directory, and reuse them in later runs on the same scores, sequences and search config.')
+@click.option('--cache-size', default='10G', show_default=True, help='Max. size of the cache directory, least recently used batches are evicted.')
 # @click.option('--alphabet', default='ACGT')
-def main(fasta, scores, config, output):
+def main(fasta, scores, config, output, output_format, batch_size, background, jobs, seed, profile, shard, checkpoint, resume, window, window_overlap, cache_dir, cache_size):
+    checkpoint = checkpoint or resume
+    if checkpoint and (output is None or output_format != 'tsv'):
+        raise click.UsageError('--checkpoint and --resume require --output and --output-format tsv.')
     if config is not None:
         gin.parse_config_file(config)
-    
-    with open(output, 'w') as fout:
-        # for i, (sequence_oh, scores_oh) in enumerate(np.load(data)):
-        for record, scores_ in tqdm.tqdm(zip(SeqIO.parse(fasta, 'fasta'), np.load(scores))):
-            # print(scores_.shape)
-            for (kmer_start, kmer_stop) in search(scores_):
-                kmer_seq = str(record.seq[kmer_start:kmer_stop])
-                kmer_score = np.sum(scores_[kmer_start:kmer_stop])
-                
-                print(f'{record.id}\t{kmer_seq}\t{kmer_score:.4f}\t{kmer_start}\t{kmer_stop}\t{kmer_stop-kmer_start}', file=fout)
+    if profile is not None:
+        profiler.enabled = True
+        profiler.reset()
+
+    if window is not None and background == 'sequence':
+        raise click.UsageError('--window requires thresholds from the global background, i.e. cannot be combined with --background sequence.')
+
+    scores_filepath, scores = scores, load_scores(scores)
+    cache = ResultCache(cache_dir, max_size=parse_size(cache_size)) if cache_dir is not None else None
+    shard_start, stop = shard_range(len(scores), *shard) if shard is not None else (0, len(scores))
+    start = shard_start
+
+    # the checkpoint identifies the run, and records the next sequence to search and the size of the output written so far
+    checkpoint_filepath = f'{output}.checkpoint'
+    run_info = {'fasta': os.path.abspath(fasta), 'scores': os.path.abspath(scores_filepath), 'config': config, 'background': background, 'seed': seed, 'shard': list(shard) if shard is not None else None, 'window': window, 'window_overlap': window_overlap}
+    append = False
+    if resume and os.path.exists(checkpoint_filepath):
+        previous = read_checkpoint(checkpoint_filepath)
+        if previous['run'] != run_info:
+            raise click.UsageError(f'{checkpoint_filepath} belongs to a different run: {previous["run"]}')
+        start, append = previous['next_index'], True
+
+    try:
+        results = iter_search(fasta, scores, batch_size=batch_size, background=background, jobs=jobs, seed=seed, config=config, start=start, stop=stop, cache=cache, window=window, window_overlap=window_overlap)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--window-overlap')
+
+    if append:
+        with open(output, 'r+b') as f:
+            # discard rows written after the checkpoint
+            f.truncate(previous['output_size'])
+
+    writer = open_hit_writer(output, output_format, append=True) if append else open_hit_writer(output, output_format)
+    with writer, tqdm.tqdm(total=(stop - shard_start), initial=(start - shard_start)) as pbar:
+        for chunk_start, batch_records, hits in results:
+            with profiler.timer('output'):
+                writer.write(batch_records, hits, index_offset=chunk_start)
+                if checkpoint:
+                    write_checkpoint(checkpoint_filepath, {'run': run_info, 'next_index': chunk_start + len(batch_records), 'output_size': writer.tell()})
+            profiler.count('sequences', len(batch_records))
+            pbar.update(len(batch_records))
+
+    if checkpoint and os.path.exists(checkpoint_filepath):
+        # the run is complete
+        os.remove(checkpoint_filepath)
+
+    if profile is not None:
+        profiler.dump(profile)
+        profiler.enabled = False
 
 # %%
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
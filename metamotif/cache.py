@@ -0,0 +1,164 @@
+# %%
+import collections
+import hashlib
+import itertools
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from metamotif import __version__
+from metamotif.io import RaggedScores
+from metamotif.profiling import profiler
+
+# %%
+def default_cache_dir(name):
+    """Returns the default directory of the cache name, i.e. $XDG_CACHE_HOME/metamotif/<name> (or ~/.cache/metamotif/<name>)."""
+
+    return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'metamotif' / name
+
+def parse_size(size):
+    """Parses a size in bytes, optionally with a suffix K, M, G or T (powers of 1024), e.g. '500M'."""
+
+    size = str(size).strip().upper().rstrip('B')
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+# %%
+class ResultCache:
+    """On-disk cache of the hits of search chunks, keyed by the content of a chunk (see chunk_key).
+
+    Each entry is one .npy file of hits (see search_batch). Entries are written atomically, such that concurrent
+    runs may share a cache directory. The last access of an entry is recorded as its modification time, and, if the
+    total size of entries exceeds max_size bytes, least recently used entries are evicted.
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = Path(directory if directory is not None else default_cache_dir('search-results'))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    @staticmethod
+    def chunk_key(scores, sequences, params):
+        """Hashes the scores and sequences of a chunk and the (JSON-serializable) search parameters into a key.
+
+        Args:
+            scores (np.ndarray or RaggedScores): Scores of the chunk.
+            sequences (list): Sequences (str) of the chunk.
+            params (dict): Effective search parameters (see search_config), seed, thresholds, etc.
+        """
+
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps({'version': __version__, **params}, sort_keys=True, default=str).encode())
+        if isinstance(scores, RaggedScores):
+            h.update(np.ascontiguousarray(scores.lengths).tobytes())
+            scores = scores.values[scores.offsets[0]:scores.offsets[-1]]
+        h.update(f'{scores.dtype}{scores.shape}'.encode())
+        # hash (memory-mapped) scores in blocks, such that long sequences are not read into memory at once
+        scores = np.reshape(scores, -1)
+        for block_start in range(0, len(scores), 2**22):
+            h.update(np.ascontiguousarray(scores[block_start:(block_start + 2**22)]).tobytes())
+        h.update('\n'.join(sequences).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.directory / f'{key}.npy'
+
+    def __contains__(self, key):
+        try:
+            # mark as recently used
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, key):
+        """Returns the hits of key, or None if not cached (or evicted)."""
+
+        try:
+            hits = np.load(self._path(key))
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        self.__contains__(key)
+        return hits
+
+    def put(self, key, hits):
+        tmp_path = self.directory / f'{key}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, hits)
+        os.replace(tmp_path, self._path(key))
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def evict(self, max_size):
+        """Removes least recently used entries until their total size is at most max_size bytes."""
+
+        entries = []
+        for path in self.directory.glob('*.npy'):
+            if path.name.endswith('.tmp.npy'):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            profiler.count('cache_evicted')
+
+    def iter_cached(self, chunks, keys, compute):
+        """Yields the hits of chunks, loading cached chunks and computing all others via compute (in order).
+
+        Keys are consumed lazily, i.e. the key of a chunk is only computed (e.g. by hashing its scores, see chunk_key) once
+        compute or the caller reaches the chunk, rather than in a pass over all chunks before the search. compute is only
+        called if a chunk is missing (e.g. without starting worker processes, if all chunks are cached).
+
+        Args:
+            chunks (iterable): Chunks, e.g. (start, stop) tuples.
+            keys (iterable): Key of each chunk (see chunk_key), e.g. a generator.
+            compute (callable): Function of an iterable of chunks, returning an iterable of their hits (e.g. search_chunks).
+        """
+
+        # looked up chunks (chunk, key, is_cached) in order, appended as compute consumes missing chunks
+        looked_up = collections.deque()
+
+        def iter_missing():
+            for chunk, key in zip(chunks, keys):
+                is_cached = key in self
+                profiler.count('cache_hits' if is_cached else 'cache_misses')
+                looked_up.append((chunk, key, is_cached))
+                if not is_cached:
+                    yield chunk
+
+        def iter_computed():
+            missing = iter_missing()
+            for chunk in missing:
+                yield from compute(itertools.chain([chunk], missing))
+
+        computed, computed_hits = iter_computed(), collections.deque()
+        while True:
+            if len(looked_up) == 0 or (not looked_up[0][2] and len(computed_hits) == 0):
+                # looks up chunks up to (at least) the next missing one, or all remaining chunks
+                hits = next(computed, None)
+                if hits is not None:
+                    computed_hits.append(hits)
+                elif len(looked_up) == 0:
+                    return
+            chunk, key, is_cached = looked_up.popleft()
+            hits = self.get(key) if is_cached else computed_hits.popleft()
+            if hits is None:
+                # evicted (e.g. by a concurrent run) since the lookup
+                hits, is_cached = next(iter(compute([chunk]))), False
+            if not is_cached:
+                self.put(key, hits)
+            yield hits
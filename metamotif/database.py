@@ -0,0 +1,198 @@
+# %%
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from metamotif.cache import default_cache_dir
+from metamotif.io import load_npz_array
+from metamotif.similarity import _prepare_pwms, _group_similarity
+from metamotif.utils import transfac_to_matrix
+
+# %%
+def iter_transfac(filepath, alphabet='ACGT'):
+    """Yields (id, count matrix) of all motifs of a TRANSFAC file (see metamotif.utils.transfac_to_matrix)."""
+
+    with open(filepath) as f:
+        record = []
+        for line in f:
+            record.append(line)
+            if line.startswith('//'):
+                yield _transfac_id(record), transfac_to_matrix(''.join(record), alphabet=alphabet)
+                record = []
+        if any(line.split()[:1] in (['P0'], ['PO']) for line in record):
+            yield _transfac_id(record), transfac_to_matrix(''.join(record), alphabet=alphabet)
+
+def _transfac_id(record):
+    # ID (or, if missing, accession) of a TRANSFAC record
+    fields = {}
+    for line in record:
+        key, _, value = line.strip().partition(' ')
+        if key in ('ID', 'AC') and key not in fields and len(value.strip()) > 0:
+            fields[key] = value.strip()
+    return fields.get('ID', fields.get('AC', ''))
+
+def iter_meme(filepath):
+    """Yields (id, letter-probability matrix) of all motifs of a MEME file."""
+
+    with open(filepath) as f:
+        motif_id, width, rows = None, None, None
+        for line in f:
+            fields = line.split()
+            if len(fields) == 0:
+                continue
+            if fields[0] == 'MOTIF':
+                motif_id = fields[1] if len(fields) > 1 else ''
+            elif line.startswith('letter-probability matrix'):
+                values = line.split(':', 1)[1].replace('= ', '=').split()
+                width = int(dict(value.split('=') for value in values if '=' in value)['w'])
+                rows = []
+            elif rows is not None:
+                rows.append([float(x) for x in fields])
+                if len(rows) == width:
+                    yield motif_id, np.array(rows, dtype=np.float64).reshape(width, -1)
+                    width, rows = None, None
+
+# %%
+def normalize_pwm(matrix):
+    """Normalizes each position of a count (or probability) matrix to sum to 1, where all-zero positions remain zero."""
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    row_sums = np.sum(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, row_sums, out=np.zeros_like(matrix), where=(row_sums != 0))
+
+def information_content(pwm):
+    """Returns the information content (in bits, w.r.t. a uniform background) of each position of a PWM."""
+
+    pwm = np.asarray(pwm, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plogp = np.where(pwm > 0, pwm * np.log2(pwm), 0)
+    return np.where(np.sum(pwm, axis=-1) > 0, np.log2(pwm.shape[-1]) + np.sum(plogp, axis=-1), 0)
+
+class MotifDatabase:
+    """Reference motifs, stored as PWMs (rows normalized to sum to 1) in one packed array of concatenated PWMs and CSR-style offsets.
+
+    The PWM of the i-th motif is values[offsets[i]:offsets[i+1]]. Parsed databases are cached on disk as uncompressed
+    .npz files, from which values are memory-mapped (see load).
+    """
+
+    def __init__(self, ids, values, offsets, filename=None):
+        self.ids = np.asarray(ids, dtype=np.str_)
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.filename = filename
+        self._groups = None
+
+    @classmethod
+    def from_matrices(cls, ids, matrices):
+        """Creates a database from count (or probability) matrices, normalizing each position to sum to 1."""
+
+        matrices = [np.asarray(matrix, dtype=np.float64).reshape(-1, 4) for matrix in matrices]
+        offsets = np.cumsum([0] + [len(matrix) for matrix in matrices])
+        values = normalize_pwm(np.concatenate(matrices) if len(matrices) > 0 else np.zeros((0, 4)))
+        return cls(list(ids), values, offsets)
+
+    @classmethod
+    def parse(cls, filepath, format=None):
+        """Parses a TRANSFAC or MEME file (format 'transfac' or 'meme', by default inferred from the file content)."""
+
+        if format is None:
+            with open(filepath) as f:
+                format = 'meme' if any(line.startswith('MEME version') for line in f) else 'transfac'
+        motifs = list(iter_meme(filepath) if format == 'meme' else iter_transfac(filepath))
+        return cls.from_matrices([motif_id for motif_id, _ in motifs], [matrix for _, matrix in motifs])
+
+    @classmethod
+    def load(cls, filepath, format=None, cache_dir=None, mmap_mode='r'):
+        """Loads a database, either from a .npz store (see save), or by parsing a TRANSFAC/MEME file.
+
+        Parsed databases are cached in cache_dir (by default ~/.cache/metamotif/motif-databases), keyed by the file content,
+        such that later loads skip parsing. Set cache_dir to False to disable caching.
+        """
+
+        if str(filepath).endswith('.npz'):
+            return cls(load_npz_array(filepath, 'ids', mmap_mode=None), load_npz_array(filepath, 'values', mmap_mode=mmap_mode), load_npz_array(filepath, 'offsets', mmap_mode=None), filename=str(filepath))
+        if cache_dir is False:
+            return cls.parse(filepath, format=format)
+
+        with open(filepath, 'rb') as f:
+            key = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        cache_path = Path(cache_dir if cache_dir is not None else default_cache_dir('motif-databases')) / f'{Path(filepath).name}.{format or "auto"}.{key}.npz'
+        if not cache_path.exists():
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file first, such that concurrent jobs never read a partially written cache
+            tmp_path = cache_path.with_name(f'{cache_path.stem}.{os.getpid()}.tmp.npz')
+            cls.parse(filepath, format=format).save(tmp_path)
+            os.replace(tmp_path, cache_path)
+        return cls.load(cache_path, mmap_mode=mmap_mode)
+
+    def save(self, filepath):
+        np.savez(filepath, ids=self.ids, values=np.asarray(self.values), offsets=self.offsets)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def information_content(self):
+        """Mean information content (bits per position) of each motif."""
+
+        lengths = self.lengths
+        ic = np.add.reduceat(information_content(self.values), self.offsets[:-1]) if len(self.values) > 0 else np.zeros(len(self))
+        return np.divide(ic, lengths, out=np.zeros(len(self)), where=(lengths > 0))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.values[self.offsets[index]:self.offsets[index+1]]
+
+    def _prepared_groups(self, eps):
+        # motifs grouped by length, prepared once for similarity scoring (see metamotif.similarity)
+        if self._groups is None or self._groups[0] != eps:
+            self._groups = (eps, _prepare_pwms([self[i] for i in range(len(self))], eps))
+        return self._groups[1]
+
+    def match(self, pwms, top_k=5, min_size=3, max_length_difference=None, max_ic_difference=None, eps=1e-7, max_block_size=2**22):
+        """Finds the top_k most similar database motifs of each query PWM (see metamotif.similarity.similarity_matrix).
+
+        Query PWMs are normalized like database motifs (see normalize_pwm). Before scoring, database motifs are prefiltered 
+        (per query) by length and mean information content, if given.
+
+        Args:
+            pwms (list): Query PWMs (or count matrices) of shape (length, 4).
+            top_k (int, optional): Number of matches per query. Defaults to 5.
+            min_size (int, optional): Minimum overlap size. Defaults to 3.
+            max_length_difference (int, optional): Max. absolute length difference of query and database motif. Defaults to None (no filter).
+            max_ic_difference (float, optional): Max. absolute difference of mean information content (bits). Defaults to None (no filter).
+
+        Returns:
+            tuple: Indices of matched database motifs (-1 if fewer than top_k matches), and their similarities (NaN), both of shape (len(pwms), top_k).
+        """
+
+        pwms = [normalize_pwm(np.reshape(pwm, (-1, 4))) for pwm in pwms]
+        groups = self._prepared_groups(eps)
+        ic = self.information_content
+        matches, similarities = np.full((len(pwms), top_k), -1, dtype=np.int64), np.full((len(pwms), top_k), np.nan)
+        for q, (query_indices, *query_group) in _prepare_pwms(pwms, eps).items():
+            query_ic = np.mean(information_content(query_group[0]), axis=1) if q > 0 else np.zeros(len(query_indices))
+            query_similarities = np.full((len(query_indices), len(self)), np.nan)
+            for length, (indices, *group) in groups.items():
+                if max_length_difference is not None and abs(length - q) > max_length_difference:
+                    continue
+                if max_ic_difference is None:
+                    query_similarities[:, indices] = _group_similarity(query_group, group, min_size, eps, max_block_size)
+                    continue
+                # per query, score only database motifs of similar information content
+                candidates = np.abs(query_ic[:, None] - ic[indices][None, :]) <= max_ic_difference
+                for i in np.flatnonzero(candidates.any(axis=1)):
+                    selected = np.flatnonzero(candidates[i])
+                    query_similarities[i, indices[selected]] = _group_similarity([x[i:(i+1)] for x in query_group], [x[selected] for x in group], min_size, eps, max_block_size)[0]
+
+            # top-k by similarity (NaN last), ties broken by database order
+            order = np.argsort(-np.nan_to_num(query_similarities, nan=-np.inf), axis=1, kind='stable')[:, :top_k]
+            order_similarities = np.take_along_axis(query_similarities, order, axis=1)
+            matches[query_indices, :order.shape[1]] = np.where(np.isnan(order_similarities), -1, order)
+            similarities[query_indices, :order.shape[1]] = order_similarities
+        return matches, similarities
@@ -0,0 +1,445 @@
+# %%
+import collections
+import gzip
+import itertools
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+import numpy as np
+from Bio import SeqIO
+
+from metamotif.utils import encode_sequences
+
+# %%
+def load_npz_array(filepath, key, mmap_mode='r'):
+    """Loads an array from a .npz file, memory-mapping it if it is stored uncompressed (see np.savez).
+
+    Args:
+        filepath (str): Path to .npz file.
+        key (str): Name of the array.
+        mmap_mode (str, optional): Memory-map mode. Defaults to 'r'. If None, or if the array is compressed, the array is read into memory.
+
+    Returns:
+        np.ndarray: Array (np.memmap, if memory-mapped).
+    """
+
+    with zipfile.ZipFile(filepath) as zf:
+        info = zf.getinfo(key + '.npy')
+    if mmap_mode is None or info.compress_type != zipfile.ZIP_STORED:
+        with np.load(filepath) as npz:
+            return npz[key]
+
+    with open(filepath, 'rb') as f:
+        # skip the local file header (30 bytes + file name + extra field) of the zip member
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', f.read(4))
+        f.seek(name_length + extra_length, 1)
+
+        # read the .npy header of the member
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filepath, dtype=dtype, mode=mmap_mode, shape=shape, order=('F' if fortran_order else 'C'), offset=offset)
+
+# %%
+class RaggedScores:
+    """Scores of variable-length sequences, stored as one flat array of concatenated scores and CSR-style offsets. 
+    
+    Scores of the i-th sequence are values[offsets[i]:offsets[i+1]]. Indexing with an integer returns these 
+    scores (as a view), indexing with a slice returns the RaggedScores of the selected sequences. 
+    """
+
+    def __init__(self, values, offsets, filename=None):
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.filename = filename
+
+    @classmethod
+    def from_list(cls, scores):
+        offsets = np.cumsum([0] + [len(scores_) for scores_ in scores])
+        values = np.concatenate(scores) if len(scores) > 0 else np.zeros(0)
+        return cls(values, offsets)
+
+    @classmethod
+    def load(cls, filepath, mmap_mode='r'):
+        """Loads ragged scores from a .npz file with arrays 'scores' and 'offsets' (memory-mapping 'scores', see load_npz_array)."""
+
+        return cls(load_npz_array(filepath, 'scores', mmap_mode=mmap_mode), load_npz_array(filepath, 'offsets', mmap_mode=None), filename=filepath)
+
+    def save(self, filepath):
+        np.savez(filepath, scores=self.values, offsets=self.offsets)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            assert step == 1, 'Only contiguous slices are supported.'
+            return RaggedScores(self.values, self.offsets[start:(max(start, stop) + 1)], filename=self.filename)
+        if index < 0:
+            index += len(self)
+        return self.values[self.offsets[index]:self.offsets[index+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+# %%
+def load_scores(filepath, mmap_mode='r'):
+    """Loads scores, either as a matrix of shape (n_sequences, sequence_length) from a .npy file, 
+    or as RaggedScores of variable-length sequences from a .npz file. 
+
+    Args:
+        filepath (str): Path to a .npy or .npz file.
+        mmap_mode (str, optional): Memory-map mode (see np.load). Defaults to 'r', i.e. scores are only read from disk when accessed.
+
+    Returns:
+        np.ndarray or RaggedScores: Scores (memory-mapped, if mmap_mode is not None).
+    """
+
+    if str(filepath).endswith('.npz'):
+        return RaggedScores.load(filepath, mmap_mode=mmap_mode)
+    return np.load(filepath, mmap_mode=mmap_mode)
+
+# %%
+def iter_records(fasta, chunk_size=1000, start=0, stop=None):
+    """Yields lists of (up to) chunk_size consecutive FASTA records, of records start to stop (exclusive, None for all)."""
+
+    records = itertools.islice(SeqIO.parse(fasta, 'fasta'), start, stop)
+    while True:
+        chunk_records = list(itertools.islice(records, chunk_size))
+        if len(chunk_records) == 0:
+            return
+        yield chunk_records
+
+def iter_record_chunks(fasta, chunks):
+    """Yields lists of FASTA records of chunks (start, stop) of consecutive records (in order, e.g. of varying size)."""
+
+    records = itertools.islice(SeqIO.parse(fasta, 'fasta'), chunks[0][0] if len(chunks) > 0 else 0, None)
+    for chunk_start, chunk_stop in chunks:
+        chunk_records = list(itertools.islice(records, chunk_stop - chunk_start))
+        if len(chunk_records) == 0:
+            return
+        yield chunk_records
+
+def iter_chunks(fasta, scores, chunk_size=1000):
+    """Yields chunks of FASTA records alongside the matching rows of the score matrix.
+
+    Only the rows of the current chunk are read into memory, such that memory is bounded by chunk_size
+    (and not by the number of sequences) if scores are memory-mapped (see load_scores).
+
+    Args:
+        fasta (str): Path to FASTA file.
+        scores (np.ndarray or RaggedScores): Score matrix of shape (n_sequences, sequence_length) or ragged scores.
+        chunk_size (int, optional): Number of sequences per chunk. Defaults to 1000.
+
+    Yields:
+        tuple: List of records and their scores, either as np.ndarray of shape (len(records), sequence_length) 
+            or, for ragged scores, as list of 1D np.ndarrays.
+    """
+
+    for chunk_start, chunk_records in zip(range(0, len(scores), chunk_size), iter_records(fasta, chunk_size)):
+        chunk_records = chunk_records[:(len(scores) - chunk_start)]
+        chunk_scores = scores[chunk_start:(chunk_start + len(chunk_records))]
+        if isinstance(chunk_scores, RaggedScores):
+            yield chunk_records, [np.asarray(scores_, dtype=np.float64) for scores_ in chunk_scores]
+        else:
+            yield chunk_records, np.asarray(chunk_scores, dtype=np.float64)
+
+def encode_fasta(fasta, sigma='ACGT'):
+    """Encodes all sequences of a FASTA file into one contiguous array (see metamotif.utils.encode_sequences).
+
+    Returns:
+        tuple: List of record ids, np.uint8 array of concatenated indices into sigma and CSR-style offsets.
+    """
+
+    ids, sequences = [], []
+    for record in SeqIO.parse(fasta, 'fasta'):
+        ids.append(record.id)
+        sequences.append(str(record.seq))
+    return (ids, *encode_sequences(sequences, sigma))
+
+# %%
+# dtypes of numeric hit columns
+HIT_COLUMN_DTYPES = {'seq_index': np.int64, 'start': np.int64, 'stop': np.int64, 'score': np.float64}
+
+def kmer_sequences(records, hits):
+    """Returns the sequences of hits (see search_batch) as a list of str, where hit indices refer to records."""
+
+    sequences = [str(record.seq) for record in records]
+    return [sequences[index][start:stop] for index, start, stop in zip(hits['index'].tolist(), hits['start'].tolist(), hits['stop'].tolist())]
+
+class TSVHitWriter:
+    """Writes hits as TSV rows (id, k-mer, score, start, stop, length), optionally gzip-compressed. 
+    
+    Rows are formatted per chunk and written in batches of (at least) flush_size rows. With append=True, rows are
+    appended to an existing file (e.g. when resuming a search, see tell).
+    """
+
+    def __init__(self, filepath, compress=False, flush_size=100_000, append=False):
+        mode = 'a' if append else 'w'
+        self.file = gzip.open(filepath, mode + 't') if compress else open(filepath, mode)
+        self.flush_size = flush_size
+        self._lines = []
+
+    def write(self, records, hits, index_offset=0):
+        for record_id, kmer_seq, kmer_score, kmer_start, kmer_stop in zip([records[index].id for index in hits['index']], kmer_sequences(records, hits), hits['score'].tolist(), hits['start'].tolist(), hits['stop'].tolist()):
+            self._lines.append(f'{record_id}\t{kmer_seq}\t{kmer_score:.4f}\t{kmer_start}\t{kmer_stop}\t{kmer_stop-kmer_start}\n')
+        if len(self._lines) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self._lines))
+        self._lines = []
+
+    def tell(self):
+        """Flushes all buffered rows to disk and returns the size of the file written so far."""
+
+        self.flush()
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ColumnarHitWriter:
+    """Buffers hits in typed columns (seq_index, start, stop, score, kmer) and writes them in batches of flush_size rows. 
+
+    Sequence ids are stored once per sequence (seq_ids), seq_index is the (global) index of a hit's sequence, 
+    i.e. writes are expected to pass consecutive chunks of records, with index_offset the index of the chunk's first record. 
+    The index of the first written record is kept as seq_ids_offset (non-zero for shards, see metamotif search --shard).
+    Subclasses implement _write_batch (and _close).
+    """
+
+    def __init__(self, filepath, flush_size=1_000_000):
+        self.filepath = filepath
+        self.flush_size = flush_size
+        self.seq_ids = []
+        self.seq_ids_offset = None
+        self._columns = collections.defaultdict(list)
+        self._n_buffered = 0
+
+    def write(self, records, hits, index_offset=0):
+        if self.seq_ids_offset is None:
+            self.seq_ids_offset = index_offset
+        self.seq_ids.extend(record.id for record in records)
+        self._columns['seq_index'].append(hits['index'] + index_offset)
+        for name in ['start', 'stop', 'score']:
+            self._columns[name].append(hits[name])
+        self._columns['kmer'].append(np.array(kmer_sequences(records, hits), dtype=np.bytes_))
+        self._n_buffered += len(hits)
+        if self._n_buffered >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self._n_buffered == 0:
+            return
+        self._write_batch({name: np.concatenate(arrays) for name, arrays in self._columns.items()})
+        self._columns.clear()
+        self._n_buffered = 0
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _write_npy_member(zf, key, dtype, length, blocks):
+    """Writes a 1-d array of dtype and length, given as an iterable of blocks, as member key.npy of an (uncompressed) .npz file, as np.savez."""
+
+    dtype = np.dtype(dtype)
+    with zf.open(key + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (length,)})
+        for block in blocks:
+            f.write(np.ascontiguousarray(block, dtype=dtype).tobytes())
+
+class NPZHitWriter(ColumnarHitWriter):
+    """Writes hits to an (uncompressed, memory-mappable) .npz file, with arrays seq_ids, seq_ids_offset, seq_index, start, stop, score and kmer. 
+    
+    Since .npz files cannot be appended to, batches are spooled to temporary files (one per column, next to filepath), 
+    which are copied into the .npz file when the writer is closed. Memory is thus bounded by flush_size hits (plus the 
+    ids of sequences). 
+    """
+
+    def __init__(self, filepath, flush_size=1_000_000):
+        super().__init__(filepath, flush_size=flush_size)
+        self._spool = tempfile.TemporaryDirectory(prefix='.npz-hits-', dir=os.path.dirname(os.path.abspath(filepath)))
+        self._spool_files = {name: open(os.path.join(self._spool.name, name), 'w+b') for name in ['seq_index', 'start', 'stop', 'score', 'kmer']}
+        # number of hits and width of (fixed-width) k-mers of each batch
+        self._batch_shapes = []
+
+    def _write_batch(self, columns):
+        for name in ['seq_index', 'start', 'stop', 'score']:
+            self._spool_files[name].write(np.ascontiguousarray(columns[name], dtype=HIT_COLUMN_DTYPES[name]).tobytes())
+        self._spool_files['kmer'].write(np.ascontiguousarray(columns['kmer']).tobytes())
+        self._batch_shapes.append((len(columns['kmer']), columns['kmer'].dtype.itemsize))
+
+    def _iter_spool(self, name, dtype, block_size=2**20):
+        spool = self._spool_files[name]
+        spool.seek(0)
+        while True:
+            block = spool.read(block_size * np.dtype(dtype).itemsize)
+            if len(block) == 0:
+                break
+            yield np.frombuffer(block, dtype=dtype)
+
+    def _iter_spooled_kmers(self, dtype):
+        # batches of k-mers are padded to the max. width of all batches
+        spool = self._spool_files['kmer']
+        spool.seek(0)
+        for n, width in self._batch_shapes:
+            yield np.frombuffer(spool.read(n * width), dtype=f'S{width}').astype(dtype)
+
+    def _close(self):
+        n_hits = sum(n for n, _ in self._batch_shapes)
+        kmer_dtype = np.dtype(f'S{max([width for _, width in self._batch_shapes], default=1)}')
+        try:
+            with zipfile.ZipFile(self.filepath, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for key, value in [('seq_ids', np.array(self.seq_ids, dtype=np.str_)), ('seq_ids_offset', np.int64(self.seq_ids_offset or 0))]:
+                    with zf.open(key + '.npy', 'w', force_zip64=True) as f:
+                        np.lib.format.write_array(f, np.asanyarray(value), allow_pickle=False)
+                for name in ['seq_index', 'start', 'stop', 'score']:
+                    _write_npy_member(zf, name, HIT_COLUMN_DTYPES[name], n_hits, self._iter_spool(name, HIT_COLUMN_DTYPES[name]))
+                _write_npy_member(zf, 'kmer', kmer_dtype, n_hits, self._iter_spooled_kmers(kmer_dtype))
+        finally:
+            for spool in self._spool_files.values():
+                spool.close()
+            self._spool.cleanup()
+
+class ParquetHitWriter(ColumnarHitWriter):
+    """Writes hits to a Parquet file (one row group per batch), with columns seq_index, seq_id, start, stop, score and kmer."""
+
+    def __init__(self, filepath, flush_size=1_000_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow is required for parquet output')
+
+        super().__init__(filepath, flush_size=flush_size)
+        self._pa = pa
+        self._schema = pa.schema([('seq_index', pa.int64()), ('seq_id', pa.string()), ('start', pa.int64()), ('stop', pa.int64()), ('score', pa.float64()), ('kmer', pa.string())])
+        self._writer = pq.ParquetWriter(filepath, self._schema)
+
+    def _write_batch(self, columns):
+        pa = self._pa
+        seq_ids = np.array(self.seq_ids, dtype=object)[columns['seq_index'] - self.seq_ids_offset]
+        arrays = [pa.array(columns['seq_index']), pa.array(seq_ids, type=pa.string()), pa.array(columns['start']), pa.array(columns['stop']), pa.array(columns['score']), pa.array(columns['kmer'].astype(np.str_), type=pa.string())]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+
+# output formats of metamotif search
+HIT_WRITERS = {
+    'tsv': TSVHitWriter,
+    'tsv.gz': lambda filepath, **kwargs: TSVHitWriter(filepath, compress=True, **kwargs),
+    'npz': NPZHitWriter,
+    'parquet': ParquetHitWriter,
+}
+
+def open_hit_writer(filepath, output_format='tsv', **kwargs):
+    """Opens a writer of search hits, see HIT_WRITERS for available output formats. Keyword arguments are passed to the writer."""
+
+    if output_format not in HIT_WRITERS:
+        raise ValueError(f'Unknown output format: {output_format}')
+    return HIT_WRITERS[output_format](filepath, **kwargs)
+
+def infer_hit_format(filepath):
+    """Infers the output format (see HIT_WRITERS) of a file written by metamotif search from its extension."""
+
+    filepath = str(filepath)
+    for output_format in ['tsv.gz', 'npz', 'parquet']:
+        if filepath.endswith('.' + output_format):
+            return output_format
+    return 'tsv'
+
+# %%
+def merge_hits(filepaths, output, output_format='tsv'):
+    """Merges hits of shards (see metamotif search --shard), given in shard order, into one file.
+
+    TSV files (and gzip members) are concatenated as bytes. For .npz and Parquet, shards are checked to cover 
+    consecutive sequences, such that the merged file is identical to the output of an unsharded search.
+    """
+
+    if output_format in ('tsv', 'tsv.gz'):
+        with open(output, 'wb') as f_out:
+            for filepath in filepaths:
+                with open(filepath, 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+    elif output_format == 'npz':
+        _merge_npz_hits(filepaths, output)
+    elif output_format == 'parquet':
+        _merge_parquet_hits(filepaths, output)
+    else:
+        raise ValueError(f'Unknown output format: {output_format}')
+
+def _merge_npz_hits(filepaths, output, block_size=2**20):
+    # columns of hits are memory-mapped and copied in blocks (see NPZHitWriter)
+    seq_ids, seq_ids_offsets = [], []
+    for filepath in filepaths:
+        with np.load(filepath) as npz:
+            seq_ids.append(npz['seq_ids'])
+            seq_ids_offsets.append(int(npz['seq_ids_offset']) if 'seq_ids_offset' in npz.files else 0)
+    for previous_offset, previous_seq_ids, offset in zip(seq_ids_offsets[:-1], seq_ids[:-1], seq_ids_offsets[1:]):
+        if offset != previous_offset + len(previous_seq_ids):
+            raise ValueError('Shards do not cover consecutive sequences, expected shards in order.')
+
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for key, value in [('seq_ids', np.concatenate(seq_ids) if len(seq_ids) > 0 else np.zeros(0, dtype=np.str_)), ('seq_ids_offset', np.int64(seq_ids_offsets[0] if len(seq_ids_offsets) > 0 else 0))]:
+            with zf.open(key + '.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asanyarray(value), allow_pickle=False)
+        for name in ['seq_index', 'start', 'stop', 'score', 'kmer']:
+            columns = [load_npz_array(filepath, name) for filepath in filepaths]
+            dtype = np.result_type(*[column.dtype for column in columns]) if len(columns) > 0 else (np.dtype('S1') if name == 'kmer' else HIT_COLUMN_DTYPES[name])
+            blocks = (column[block_start:(block_start + block_size)] for column in columns for block_start in range(0, len(column), block_size))
+            _write_npy_member(zf, name, dtype, sum(len(column) for column in columns), blocks)
+
+def _merge_parquet_hits(filepaths, output):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('pyarrow is required for parquet output')
+
+    writer, last_seq_index = None, -1
+    try:
+        for filepath in filepaths:
+            parquet_file = pq.ParquetFile(filepath)
+            if writer is None:
+                writer = pq.ParquetWriter(output, parquet_file.schema_arrow)
+            for i in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(i)
+                seq_index = table.column('seq_index').to_numpy()
+                if len(seq_index) > 0:
+                    if seq_index[0] < last_seq_index:
+                        raise ValueError('Shards do not cover consecutive sequences, expected shards in order.')
+                    last_seq_index = seq_index[-1]
+                writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
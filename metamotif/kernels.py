@@ -0,0 +1,83 @@
+# %%
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# %%
+def _jit(fn):
+    # compiled (and cached on disk) if numba is installed, otherwise plain Python
+    return numba.njit(cache=True, nogil=True)(fn) if numba is not None else fn
+
+@_jit
+def _window_sum(scores_cumsum, masked, start, stop):
+    # sum of scores[start:stop], -inf if the window is masked or out of bounds (see search._batch_window_sums)
+    if start < 0 or stop > len(masked):
+        return -np.inf
+    for position in range(start, stop):
+        if masked[position]:
+            return -np.inf
+    return scores_cumsum[stop] - scores_cumsum[start]
+
+@_jit
+def search_row(scores_cpy, scores_cumsum, masked, seed_order, thresholds, j_start, seed_size, extend_flanks, legacy, kmer_starts, kmer_stops, n_kmers, seed_counts):
+    """Greedy seed-extend-mask search of one sequence, as in search.search_batch, from the seed of rank j_start on.
+
+    Masks are applied to scores_cpy (-inf) and masked in place, and discovered k-mers written to kmer_starts and kmer_stops
+    from index n_kmers on. seed_counts (skipped, visited) are incremented in place. Since thresholds are computed lazily
+    (in Python), the search stops at the first seed that requires a threshold which is still missing (NaN), such that
+    it can be resumed from this seed once the threshold is computed.
+
+    Returns:
+        tuple: Rank of the seed and index of the k-mer size of the missing threshold (-1 if the search is complete), and the number of k-mers.
+    """
+
+    length = len(scores_cpy)
+    for j in range(j_start, len(seed_order)):
+        i = seed_order[j]
+        if legacy:
+            current_kmer_score = scores_cpy[i] + scores_cpy[i+1]
+        else:
+            current_kmer_score = _window_sum(scores_cumsum, masked, i, i + seed_size)
+        seed_score = current_kmer_score
+
+        extend_size = 0
+        current_kmer_sig = False
+        for k in range(len(thresholds)):
+            if np.isnan(thresholds[k]):
+                return j, k, n_kmers
+            if not (thresholds[k] < current_kmer_score):
+                break
+            current_kmer_sig = True
+            extend_size += 1
+            if legacy:
+                # mean over the (possibly truncated) window [i+extend_size, i+2+extend_size)
+                left = i + extend_size
+                if left + 1 < length:
+                    current_kmer_score = (scores_cpy[left] + scores_cpy[left+1]) / 2
+                elif left < length:
+                    current_kmer_score = scores_cpy[left]
+                else:
+                    current_kmer_score = np.nan
+            else:
+                current_kmer_score = _window_sum(scores_cumsum, masked, i - extend_size, i + seed_size + extend_size)
+
+        # seeds overlapping masked positions score -inf, i.e. are never significant (counted once completed, i.e. not again when resumed)
+        seed_counts[0 if seed_score == -np.inf else 1] += 1
+
+        if current_kmer_sig:
+            kmer_start = max(0, i - extend_size + 1 - extend_flanks)
+            if legacy:
+                kmer_stop = min(i + seed_size + extend_size + 2 - 1 + extend_flanks, length)
+            else:
+                kmer_stop = min(i + seed_size + extend_size - 1 + extend_flanks, length)
+            for position in range(kmer_start, kmer_stop):
+                scores_cpy[position] = -np.inf
+                masked[position] = True
+            kmer_starts[n_kmers] = kmer_start
+            kmer_stops[n_kmers] = kmer_stop
+            n_kmers += 1
+
+    return len(seed_order), -1, n_kmers
@@ -0,0 +1,267 @@
+# %%
+import collections
+import gzip
+
+import numpy as np
+
+from metamotif.utils import _lookup_table, pack_kmers, unpack_kmers
+
+# %%
+def aggregate_kmers(kmers, scores=None):
+    """Collapses identical k-mers into distinct k-mers with counts and summed scores.
+
+    Args:
+        kmers (iterable): K-mer sequences (str).
+        scores (iterable, optional): Scores of k-mers. Defaults to None.
+
+    Returns:
+        tuple: List of distinct k-mers (in order of first occurrence), np.ndarray of their counts 
+            and np.ndarray of their summed scores (None, if scores is None).
+    """
+
+    index, counts, score_sums = {}, [], []
+    for kmer, score in zip(kmers, (scores if scores is not None else iter(lambda: 0.0, None))):
+        i = index.get(kmer)
+        if i is None:
+            i = index[kmer] = len(counts)
+            counts.append(0)
+            score_sums.append(0.0)
+        counts[i] += 1
+        score_sums[i] += float(score)
+
+    return list(index), np.array(counts, dtype=np.int64), (np.array(score_sums, dtype=np.float64) if scores is not None else None)
+
+class KmerAggregator:
+    """Streaming version of aggregate_kmers, for k-mers of hits (with scores) that arrive in chunks.
+
+    Distinct k-mers are ordered as if all hits were sorted by score (descending, stable) before aggregation, 
+    i.e. by their max. score, with ties broken by the first hit of max. score. The (distinct) k-mer and score of 
+    each hit are kept (12 bytes per hit), for the order of all hits (see aggregate).
+    """
+
+    def __init__(self):
+        # k-mer -> index, in order of first occurrence
+        self._index = {}
+        self._indices, self._scores = [], []
+        self.total = 0
+
+    def update(self, kmers, scores):
+        """Adds a chunk of k-mers (list of str) and their scores."""
+
+        if len(kmers) == 0:
+            return
+        distinct, inverse = np.unique(np.asarray(kmers, dtype=np.str_), return_inverse=True)
+        indices = np.array([self._index.setdefault(kmer, len(self._index)) for kmer in distinct.tolist()], dtype=np.int32)
+        self._indices.append(indices[np.reshape(inverse, -1)])
+        self._scores.append(np.asarray(scores, dtype=np.float64))
+        self.total += len(kmers)
+
+    def aggregate(self, return_order=False):
+        """Returns the distinct k-mers (in order, see above), their counts and summed scores (see aggregate_kmers).
+
+        Args:
+            return_order (bool, optional): Also return the indices of (distinct) k-mers of all hits, sorted by score 
+                (descending, stable), e.g. for find_variable_length_motifs. Defaults to False.
+        """
+
+        indices = np.concatenate(self._indices) if len(self._indices) > 0 else np.zeros(0, dtype=np.int32)
+        scores = np.concatenate(self._scores) if len(self._scores) > 0 else np.zeros(0)
+        hit_order = np.argsort(-scores, kind='stable')
+        indices, scores = indices[hit_order], scores[hit_order]
+
+        # distinct k-mers in order of their first hit (by score)
+        _, first = np.unique(indices, return_index=True)
+        distinct_order = np.argsort(first, kind='stable')
+        all_kmers = list(self._index)
+        kmers = [all_kmers[i] for i in distinct_order.tolist()]
+        counts = np.bincount(indices, minlength=len(all_kmers))[distinct_order].astype(np.int64)
+        score_sums = np.bincount(indices, weights=scores, minlength=len(all_kmers))[distinct_order]
+        if not return_order:
+            return kmers, counts, score_sums
+        rank = np.empty(len(all_kmers), dtype=np.int64)
+        rank[distinct_order] = np.arange(len(all_kmers))
+        return kmers, counts, score_sums, rank[indices]
+
+# %%
+def iter_hit_kmers(filepath, chunk_size=1_000_000):
+    """Yields the k-mers of hits written by metamotif search (TSV, TSV.gz, npz or parquet, see metamotif.io.HIT_WRITERS) in chunks.
+
+    Yields:
+        tuple: Buffer of characters (np.uint8) and start positions and lengths of k-mers in the buffer.
+    """
+
+    filepath = str(filepath)
+    if filepath.endswith('.npz'):
+        from metamotif.io import load_npz_array
+        kmers = load_npz_array(filepath, 'kmer')
+        for chunk_start in range(0, len(kmers), chunk_size):
+            yield _bytes_buffer(np.asarray(kmers[chunk_start:(chunk_start + chunk_size)]))
+    elif filepath.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=chunk_size, columns=['kmer']):
+            yield _bytes_buffer(np.array(batch.column(0).to_pylist(), dtype=np.bytes_))
+    else:
+        yield from _iter_tsv_kmers(filepath, block_size=(64 * chunk_size))
+
+def _bytes_buffer(kmers):
+    # buffer, starts and lengths of a np.ndarray of (fixed-width) bytes
+    kmers = np.ascontiguousarray(kmers, dtype=np.bytes_)
+    return kmers.view(np.uint8), np.arange(len(kmers), dtype=np.int64) * kmers.dtype.itemsize, np.char.str_len(kmers)
+
+def _has_tabs_per_line(tabs, line_ends):
+    # whether the i-th row of tabs lies within the i-th line, i.e. (given as many rows as lines) each line has exactly that many tabs
+    return bool(np.all(tabs[:, -1] < line_ends) and np.all(tabs[1:, 0] > line_ends[:-1]))
+
+def _iter_tsv_kmers(filepath, block_size=2**26):
+    # reads the second column of a (gzip-compressed) TSV in blocks of bytes, split at line ends, via array operations on the raw bytes
+    with (gzip.open(filepath, 'rb') if filepath.endswith('.gz') else open(filepath, 'rb')) as f:
+        remainder = b''
+        while True:
+            block = f.read(block_size)
+            if len(block) > 0:
+                data = remainder + block
+                end = data.rfind(b'\n') + 1
+                data, remainder = data[:end], data[end:]
+            elif len(remainder) > 0:
+                # last line, without a trailing newline
+                data, remainder = remainder + b'\n', b''
+            else:
+                return
+            if len(data) == 0:
+                continue
+
+            chars = np.frombuffer(data, dtype=np.uint8)
+            line_ends = np.flatnonzero(chars == ord('\n'))
+            tabs = np.flatnonzero(chars == ord('\t'))
+            # the k-mer of each line is between its first and second tab
+            if len(tabs) == 5 * len(line_ends) and _has_tabs_per_line(tabs.reshape(-1, 5), line_ends):
+                # (fast path) all lines have the 6 columns written by metamotif search
+                tabs = tabs.reshape(-1, 5)
+                starts, stops = tabs[:, 0] + 1, tabs[:, 1]
+            else:
+                # skip lines with less than two tabs (e.g. empty lines)
+                line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+                first_tab = np.searchsorted(tabs, line_starts)
+                has_kmer = (first_tab + 1 < len(tabs))
+                has_kmer[has_kmer] = tabs[first_tab[has_kmer] + 1] < line_ends[has_kmer]
+                first_tab = first_tab[has_kmer]
+                starts, stops = tabs[first_tab] + 1, tabs[first_tab + 1]
+            yield chars, starts, stops - starts
+
+class KmerCounter:
+    """Counts k-mers, encoded as 2-bit packed integers per k-mer length (see metamotif.utils.pack_kmers).
+
+    Counts are accumulated per chunk via np.unique and merged (by length) once enough partial counts are buffered. 
+    K-mers that can not be packed (longer than 32, or with characters other than ACGT) are counted in a dict. 
+    Alongside counts, the position of the first occurrence of each k-mer is recorded, such that k-mers of equal counts 
+    are ordered as first seen (see most_common). 
+    """
+
+    def __init__(self, max_buffered=2**24):
+        self.max_buffered = max_buffered
+        self.total = 0
+        self._partial = collections.defaultdict(list)
+        self._n_buffered = 0
+        self._unpackable = collections.Counter()
+        self._unpackable_first = {}
+
+    def update(self, kmers):
+        """Counts k-mers, given as an iterable of str or np.ndarray of bytes."""
+
+        self.update_buffer(*_bytes_buffer(np.asarray(kmers, dtype=np.bytes_)))
+
+    def update_buffer(self, chars, starts, lengths):
+        """Counts k-mers, given as buffer of characters (np.uint8) and start positions and lengths of k-mers (see iter_hit_kmers)."""
+
+        positions = self.total + np.arange(len(starts), dtype=np.int64)
+        self.total += len(starts)
+        if len(starts) == 0:
+            return
+        table = _lookup_table('ACGT')
+        for k in np.unique(lengths).tolist():
+            is_k = (lengths == k)
+            k_starts, k_positions = starts[is_k], positions[is_k]
+            k_chars = chars[k_starts[:, None] + np.arange(k)[None, :]]
+            k_codes = table[k_chars]
+            packable = np.all(k_codes < 4, axis=1) if k <= 32 else np.zeros(len(k_codes), dtype=bool)
+            if not np.all(packable):
+                for kmer, position in zip(k_chars[~packable], k_positions[~packable].tolist()):
+                    kmer = kmer.tobytes().decode('ascii')
+                    self._unpackable[kmer] += 1
+                    self._unpackable_first.setdefault(kmer, position)
+            if np.any(packable):
+                codes, index, counts = np.unique(pack_kmers(k_codes[packable]), return_index=True, return_counts=True)
+                self.update_packed(k, codes, counts, first_positions=k_positions[packable][index], count_total=False)
+
+    def update_packed(self, k, codes, counts, first_positions=None, count_total=True):
+        """Adds counts of packed k-mers of length k, first seen at first_positions (defaults to after all k-mers counted so far)."""
+
+        if first_positions is None:
+            first_positions = np.full(len(codes), self.total, dtype=np.int64)
+        if count_total:
+            self.total += int(np.sum(counts))
+        self._partial[k].append((np.asarray(codes, dtype=np.uint64), np.asarray(counts, dtype=np.int64), np.asarray(first_positions, dtype=np.int64)))
+        self._n_buffered += len(codes)
+        if self._n_buffered >= self.max_buffered:
+            self._merge()
+
+    def merge(self, other):
+        """Adds the counts of another KmerCounter (e.g. of another file or shard), whose k-mers occur after those counted so far."""
+
+        self._merge()
+        other._merge()
+        for k, partial in other._partial.items():
+            for codes, counts, first_positions in partial:
+                self.update_packed(k, codes, counts, first_positions=(self.total + first_positions), count_total=False)
+        for kmer, count in other._unpackable.items():
+            self._unpackable[kmer] += count
+            self._unpackable_first.setdefault(kmer, self.total + other._unpackable_first[kmer])
+        self.total += other.total
+
+    def _merge(self):
+        for k, partial in self._partial.items():
+            if len(partial) > 1:
+                codes, inverse = np.unique(np.concatenate([codes for codes, _, _ in partial]), return_inverse=True)
+                counts = np.bincount(inverse, weights=np.concatenate([counts for _, counts, _ in partial]), minlength=len(codes)).astype(np.int64)
+                first_positions = np.full(len(codes), np.iinfo(np.int64).max, dtype=np.int64)
+                np.minimum.at(first_positions, inverse, np.concatenate([first_positions for _, _, first_positions in partial]))
+                partial[:] = [(codes, counts, first_positions)]
+        self._n_buffered = sum(len(partial[0][0]) for partial in self._partial.values() if len(partial) > 0)
+
+    def packed_counts(self):
+        """Returns a dict of k-mer length -> (sorted packed k-mers, counts)."""
+
+        self._merge()
+        return {k: partial[0][:2] for k, partial in self._partial.items() if len(partial) > 0}
+
+    def most_common(self, min_count=1):
+        """Returns a list of (k-mer, count) with count >= min_count, sorted by count (descending), and k-mers of equal count in order of their first occurrence."""
+
+        self._merge()
+        kmers, counts, first_positions = [], [], []
+        for k, partial in self._partial.items():
+            if len(partial) == 0:
+                continue
+            codes, k_counts, k_first_positions = partial[0]
+            selected = k_counts >= min_count
+            kmers += unpack_kmers(codes[selected], k)
+            counts.append(k_counts[selected])
+            first_positions.append(k_first_positions[selected])
+        for kmer, count in self._unpackable.items():
+            if count >= min_count:
+                kmers.append(kmer)
+                counts.append(np.array([count]))
+                first_positions.append(np.array([self._unpackable_first[kmer]]))
+        counts = np.concatenate(counts) if len(counts) > 0 else np.zeros(0, dtype=np.int64)
+        first_positions = np.concatenate(first_positions) if len(first_positions) > 0 else np.zeros(0, dtype=np.int64)
+        order = np.lexsort((first_positions, -counts))
+        return [(kmers[i], int(counts[i])) for i in order]
+
+def count_kmers(filepaths, chunk_size=1_000_000):
+    """Counts the k-mers of hits across one or more outputs of metamotif search (see iter_hit_kmers and KmerCounter)."""
+
+    counter = KmerCounter()
+    for filepath in filepaths:
+        for chars, starts, lengths in iter_hit_kmers(filepath, chunk_size=chunk_size):
+            counter.update_buffer(chars, starts, lengths)
+    return counter
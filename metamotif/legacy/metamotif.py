@@ -8,35 +8,56 @@ from sklearn.cluster import DBSCAN
 from umap import UMAP
 
 # %%
+def _best_windows(importances, k):
+    # start of the window of size k with max. total importance (first, if tied) of each sequence (N, L, depth), via cumulative sums
+    position_sums = np.sum(importances, axis=2, dtype=np.float64)
+    cumsum = np.concatenate([np.zeros((len(position_sums), 1)), np.cumsum(position_sums, axis=1)], axis=1)
+    return np.argmax(cumsum[:, k:] - cumsum[:, :-k], axis=1)
+
+def _motifs_dtype(importances):
+    return importances.dtype if np.issubdtype(importances.dtype, np.floating) else np.float64
+
 def extract_motif(importances, k=7, norm=True):
-    importances = np.array(importances)
+    importances = np.asarray(importances)
     if len(importances.shape) != 2:
         raise ValueError(f'Expected matrix with ndim=2, got ndim={len(importances.shape)}.')
 
-    best_i = -1
-    best_score = -np.inf
+    return extract_motifs(importances[np.newaxis], k=k, norm=norm)[0]
 
-    for i in range(0, importances.shape[0] - k + 1):
-        importances_i = importances[i:(i+k), :]
-        score = np.sum(importances_i)
+# %%
+def extract_motifs(importances, k=7, norm=True, chunk_size=10_000, out=None):
+    """Extracts the window of size k with the max. total importance from each sequence.
 
-        if score > best_score:
-            best_i = i
-            best_score = score
+    Importances are processed in chunks of chunk_size sequences, such that they can be memory-mapped (e.g. np.load(..., mmap_mode='r')).
 
-    motif = importances[best_i:(best_i + k), :]
-    if norm:
-        motif = motif / np.sum(motif)
+    Args:
+        importances (np.ndarray): Importances of shape (N, L, depth).
+        k (int, optional): Motif size. Defaults to 7.
+        norm (bool, optional): Whether to normalize motifs to sum to 1. Defaults to True.
+        chunk_size (int, optional): Number of sequences processed at once. Defaults to 10_000.
+        out (np.ndarray, optional): Output array of shape (N, k, depth), e.g. a np.memmap. Defaults to None.
 
-    return motif
+    Returns:
+        np.ndarray: Motifs of shape (N, k, depth).
+    """
 
-# %%
-def extract_motifs(importances, k=7, norm=True):
-    importances = np.array(importances)
+    if not isinstance(importances, np.ndarray):
+        importances = np.asarray(importances)
     if len(importances.shape) != 3:
         raise ValueError(f'Expected matrix with ndim=3, got ndim={len(importances.shape)}.')
-    
-    return np.stack([extract_motif(x, k=k, norm=norm) for x in importances])
+    if importances.shape[1] < k:
+        raise ValueError(f'Expected sequences of length >= k={k}, got length {importances.shape[1]}.')
+
+    if out is None:
+        out = np.empty((importances.shape[0], k, importances.shape[2]), dtype=_motifs_dtype(importances))
+    for chunk_start in range(0, len(importances), chunk_size):
+        chunk = np.asarray(importances[chunk_start:(chunk_start + chunk_size)])
+        starts = _best_windows(chunk, k)
+        motifs = chunk[np.arange(len(chunk))[:, np.newaxis], starts[:, np.newaxis] + np.arange(k)[np.newaxis, :]]
+        if norm:
+            motifs = motifs / np.sum(motifs, axis=(1, 2), keepdims=True)
+        out[chunk_start:(chunk_start + len(chunk))] = motifs
+    return out
 
 # %%
 def motifs_flatten(motifs_3d):
@@ -52,27 +73,89 @@ def motifs_cluster(motifs_2d, clust_fn = lambda x: DBSCAN().fit(x).labels_):
     return clust_fn(motifs_2d)
 
 # %%
-def extract_meta_motifs(importances, k=7, embed_fn=None, clust_fn=None):
-    if embed_fn is None:
-        embed_fn = lambda x: UMAP().fit_transform(x)
-    if clust_fn is None:
-        clust_fn = lambda x: DBSCAN().fit(x).labels_
+class ClusterMeans:
+    """Streaming accumulator of the mean motif (flattened) of each cluster label."""
+
+    def __init__(self):
+        self.sums, self.counts = {}, {}
+
+    def update(self, motifs_2d, labels):
+        labels_unique, labels_inverse = np.unique(labels, return_inverse=True)
+        sums = np.zeros((len(labels_unique), motifs_2d.shape[1]))
+        np.add.at(sums, labels_inverse, motifs_2d)
+        for label, label_sum, count in zip(labels_unique.tolist(), sums, np.bincount(labels_inverse).tolist()):
+            self.sums[label] = self.sums.get(label, 0) + label_sum
+            self.counts[label] = self.counts.get(label, 0) + count
 
-    motifs = extract_motifs(importances, k=k, norm=True)
+    def means(self):
+        """Returns the sorted labels and their mean motifs (flattened)."""
 
-    motifs_n, motifs_len, motifs_depth = motifs.shape
+        labels = sorted(self.sums)
+        return np.array(labels), np.array([self.sums[label] / self.counts[label] for label in labels])
 
-    motifs_flattened = motifs_flatten(motifs)
-    motifs_embedding = motifs_embed(motifs_flattened, embed_fn)
-    motifs_clustering = motifs_cluster(motifs_embedding, clust_fn)
+def assign_to_centroids(motifs_2d, centroids, radii=None):
+    """Assigns motifs (flattened) to the nearest (euclidean) centroid, or to noise (-1) if farther than the centroid's radius."""
 
-    motifs_df = pd.DataFrame(motifs_flattened)
-    motifs_df['cluster'] = motifs_clustering
+    distances = np.sum(motifs_2d**2, axis=1)[:, np.newaxis] - 2 * motifs_2d @ centroids.T + np.sum(centroids**2, axis=1)[np.newaxis, :]
+    nearest = np.argmin(distances, axis=1)
+    if radii is None:
+        return nearest
+    nearest_distances = np.sqrt(np.maximum(distances[np.arange(len(nearest)), nearest], 0))
+    return np.where(nearest_distances <= radii[nearest], nearest, -1)
 
-    motifs_metaclusters = motifs_df.groupby(['cluster']).mean()
-    motifs_metaclusters = np.array(motifs_metaclusters).reshape(len(motifs_metaclusters), motifs_len, motifs_depth)
+# %%
+def extract_meta_motifs(importances, k=7, embed_fn=None, clust_fn=None, chunk_size=10_000, sample_size=None, radius_quantile=1.0, seed=0):
+    """Extracts motifs (see extract_motifs), clusters them and returns the mean motif of each cluster (incl. noise, label -1).
+
+    If sample_size is given, embedding and clustering are fit on a random sample of sample_size motifs only. All other motifs are 
+    assigned to the nearest cluster centroid (in motif space), or to noise if farther than the radius_quantile of distances of the
+    cluster's sampled motifs to its centroid. Motifs are extracted in chunks and cluster means accumulated on the fly, such that
+    memory is bounded by sample_size and chunk_size (not by the number of sequences).
+
+    Note that, unlike the full fit (in which only clust_fn labels noise), motifs assigned to noise beyond the radius_quantile
+    add to the noise cluster (-1), i.e. the sampled fit may return a noise meta-motif even if clust_fn labels no motif as noise
+    (with radius_quantile=1.0, this only affects motifs farther from their centroid than any sampled motif of its cluster).
+
+    Returns:
+        np.ndarray: Meta-motifs of shape (n_clusters, k, depth), ordered by cluster label.
+    """
+
+    if embed_fn is None:
+        embed_fn = lambda x: UMAP().fit_transform(x)
+    if clust_fn is None:
+        clust_fn = lambda x: DBSCAN().fit(x).labels_
 
-    return motifs_metaclusters
+    n, depth = len(importances), importances.shape[2]
+    cluster_means = ClusterMeans()
+    if sample_size is None or sample_size >= n:
+        motifs_flattened = motifs_flatten(extract_motifs(importances, k=k, norm=True, chunk_size=chunk_size))
+        motifs_clustering = motifs_cluster(motifs_embed(motifs_flattened, embed_fn), clust_fn)
+        cluster_means.update(motifs_flattened, motifs_clustering)
+    else:
+        # fit embedding and clustering on a sample
+        sample = np.sort(np.random.default_rng(seed).choice(n, size=sample_size, replace=False))
+        sample_motifs = motifs_flatten(extract_motifs(importances[sample], k=k, norm=True, chunk_size=chunk_size))
+        sample_clustering = np.asarray(motifs_cluster(motifs_embed(sample_motifs, embed_fn), clust_fn))
+
+        # centroids and radii of (non-noise) clusters
+        clusters = np.unique(sample_clustering[sample_clustering != -1])
+        centroids = np.array([sample_motifs[sample_clustering == c].mean(axis=0) for c in clusters]).reshape(len(clusters), -1)
+        radii = np.array([np.quantile(np.linalg.norm(sample_motifs[sample_clustering == c] - centroid, axis=1), radius_quantile) for c, centroid in zip(clusters, centroids)])
+
+        # assign all motifs (in chunks), keeping the labels of the sample
+        for chunk_start in range(0, n, chunk_size):
+            motifs_chunk = motifs_flatten(extract_motifs(importances[chunk_start:(chunk_start + chunk_size)], k=k, norm=True, chunk_size=chunk_size))
+            if len(clusters) > 0:
+                labels = assign_to_centroids(motifs_chunk, centroids, radii)
+                labels = np.where(labels == -1, -1, clusters[labels])
+            else:
+                labels = np.full(len(motifs_chunk), -1)
+            in_chunk = (sample >= chunk_start) & (sample < chunk_start + len(motifs_chunk))
+            labels[sample[in_chunk] - chunk_start] = sample_clustering[in_chunk]
+            cluster_means.update(motifs_chunk, labels)
+
+    _, means = cluster_means.means()
+    return means.reshape(len(means), k, depth)
 
 # %%
 def plot_motif(motif_2d, sigma=['A', 'C', 'G', 'T'], title=''):
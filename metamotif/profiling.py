@@ -0,0 +1,80 @@
+# %%
+import collections
+import contextlib
+import json
+import time
+
+# %%
+class Profiler:
+    """Low-overhead timers and counters for the stages of a search run.
+
+    While disabled (the default), timers and counters are no-ops. Timers accumulate seconds and calls per name,
+    and may be nested (e.g. 'thresholds' is measured within 'search').
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.counters = collections.defaultdict(int)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - t
+            self.calls[name] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += int(n)
+
+    def timed(self, iterable, name):
+        """Wraps an iterable, such that the time spent producing each item is measured by timer name."""
+
+        iterator = iter(iterable)
+        while True:
+            with self.timer(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def stats(self):
+        return {'seconds': dict(self.seconds), 'calls': dict(self.calls), 'counters': dict(self.counters)}
+
+    def pop_stats(self):
+        stats = self.stats()
+        self.reset()
+        return stats
+
+    def merge(self, stats):
+        """Adds the stats of another profiler (e.g. of a worker process)."""
+
+        for name, seconds in stats['seconds'].items():
+            self.seconds[name] += seconds
+        for name, calls in stats['calls'].items():
+            self.calls[name] += calls
+        for name, n in stats['counters'].items():
+            self.counters[name] += n
+
+    def dump(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.stats(), f, indent=2)
+
+# module-level profiler, used by search and the metamotif CLI
+profiler = Profiler()
+
+def get_stats():
+    """Returns the timers (seconds and calls) and counters recorded by the module-level profiler."""
+
+    return profiler.stats()
@@ -1,61 +1,585 @@
 # %%
-import copy
+import collections
+import hashlib
+import inspect
+import warnings
 
 import gin
 import numpy as np
 
+from metamotif.profiling import profiler
 from metamotif.utils import running_mean
 
 # %%
-def find_significance_threshold(scores, size=2, n=1000, sig_p=0.05):
+def find_significance_threshold(scores, size=2, n=1000, sig_p=0.05, rng=None):
     assert (n-1) * sig_p > 1.0, 'p-value too small, increase number of samples'
+    rng = np.random if rng is None else rng
 
-    null_samples = []
-    for _ in range(n):
-        null_samples.append(np.sum(np.random.choice(scores, size=size)))
+    # draw all n null samples of the sum of size scores at once
+    null_samples = np.sum(rng.choice(scores, size=(n, size)), axis=1)
     return np.sort(null_samples, kind='mergesort')[int((1-sig_p)*n)]
 
+@gin.configurable(denylist=['scores', 'sizes', 'sig_p'])
+def exact_significance_thresholds(scores, sizes, sig_p=0.05, n_bins=1024, chunk_size=2**24):
+    """Computes significance thresholds from the exact distribution of the sum of size scores (drawn with replacement). 
+
+    Scores are binned into a histogram of n_bins equally spaced bins, whose k-fold convolution (the distribution of 
+    the sum of k scores) is computed for all sizes from a single FFT of the histogram. Thresholds are thus deterministic 
+    and valid for arbitrarily small sig_p, up to a binning error of at most size * bin width / 2. Fewer scores than n_bins 
+    (e.g. of a single sequence) are binned into as many bins as there are scores, as the cost of the FFT grows with the 
+    number of bins. Still, per-sequence thresholds are several times slower to compute than via sampling (but exact). 
+
+    Args:
+        scores (np.ndarray): Scores, of any shape and possibly memory-mapped (binned chunk_size values at a time).
+        sizes (list): K-mer sizes to compute thresholds for.
+        sig_p (float, optional): Significance level. Defaults to 0.05.
+        n_bins (int, optional): Maximum number of histogram bins. Defaults to 1024.
+
+    Returns:
+        dict: Mapping of k-mer size to significance threshold, i.e. the (1 - sig_p) quantile of the sum of size scores.
+    """
+    assert 0.0 < sig_p < 1.0, 'p-value must be in (0, 1)'
+
+    sizes = list(sizes)
+    if len(sizes) == 0:
+        return {}
+    scores = np.reshape(scores, -1)
+    chunks = [np.asarray(scores[i:(i + chunk_size)], dtype=np.float64) for i in range(0, len(scores), chunk_size)]
+    chunks = [chunk[np.isfinite(chunk)] for chunk in chunks]
+    if all(len(chunk) == 0 for chunk in chunks):
+        # no (finite) scores, i.e. nothing is significant
+        return {size: np.nan for size in sizes}
+    score_min = min(np.min(chunk) for chunk in chunks if len(chunk) > 0)
+    score_max = max(np.max(chunk) for chunk in chunks if len(chunk) > 0)
+    if score_min == score_max:
+        return {size: size * score_min for size in sizes}
+
+    # histogram of scores, with bin centers score_min + j * bin_width
+    n_bins = min(n_bins, sum(len(chunk) for chunk in chunks))
+    bin_width = (score_max - score_min) / (n_bins - 1)
+    pmf = np.zeros(n_bins)
+    for chunk in chunks:
+        pmf += np.bincount(np.rint((chunk - score_min) / bin_width).astype(np.int64), minlength=n_bins)
+    pmf /= np.sum(pmf)
+
+    # the sum of k scores has support k * score_min + j * bin_width, j = 0, ..., k * (n_bins - 1)
+    fft_size = 1 << int(np.ceil(np.log2(max(sizes) * (n_bins - 1) + 1)))
+    pmf_fft = np.fft.rfft(pmf, n=fft_size)
+
+    # (all sizes at once)
+    pmf_sizes = np.clip(np.fft.irfft(pmf_fft[None, :] ** np.array(sizes)[:, None], n=fft_size, axis=1), 0, None)
+
+    thresholds = {}
+    for size, pmf_size in zip(sizes, pmf_sizes):
+        pmf_size = pmf_size[:(size * (n_bins - 1) + 1)]
+        cdf = np.cumsum(pmf_size) / np.sum(pmf_size)
+        j = min(np.searchsorted(cdf, (1 - sig_p) - 1e-12), len(cdf) - 1)
+        thresholds[size] = size * score_min + j * bin_width
+    return thresholds
+
+def significance_thresholds(scores, sizes, n=1000, sig_p=0.05, method='sampling', rng=None):
+    """Computes significance thresholds for all sizes, via Monte-Carlo sampling (method='sampling', see find_significance_threshold) 
+    or exactly (method='exact', see exact_significance_thresholds). 
+
+    Returns:
+        dict: Mapping of k-mer size to significance threshold.
+    """
+
+    if method == 'sampling':
+        return {size: find_significance_threshold(scores, size=size, n=n, sig_p=sig_p, rng=rng) for size in sizes}
+    elif method == 'exact':
+        return exact_significance_thresholds(scores, sizes, sig_p=sig_p)
+    else:
+        raise ValueError(f'Unknown threshold method: {method}')
+
+def background_thresholds(scores, sizes, n=1000, sig_p=0.05, seed=None, method='sampling'):
+    """Computes significance thresholds from a dataset-global background, i.e. from the scores of all sequences. 
+
+    Args:
+        scores (np.ndarray): Scores of shape (n_sequences, sequence_length), may be memory-mapped. 
+        sizes (list): K-mer sizes to compute thresholds for.
+        seed (int, optional): Seed of the null sampling RNG. Defaults to None (global numpy RNG).
+        method (str, optional): Threshold method, 'sampling' or 'exact' (see significance_thresholds). Defaults to 'sampling'.
+
+    Returns:
+        dict: Mapping of k-mer size to significance threshold.
+    """
+
+    if method == 'exact':
+        return exact_significance_thresholds(scores, sizes, sig_p=sig_p)
+    elif method != 'sampling':
+        raise ValueError(f'Unknown threshold method: {method}')
+    assert (n-1) * sig_p > 1.0, 'p-value too small, increase number of samples'
+
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    scores = np.reshape(scores, -1)
+    thresholds = {}
+    for size in sizes:
+        null_samples = np.sum(scores[rng.choice(len(scores), size=(n, size))], axis=1)
+        thresholds[size] = np.sort(null_samples, kind='mergesort')[int((1-sig_p)*n)]
+    return thresholds
+
+# %%
+class ThresholdCache:
+    """Bounded LRU cache of significance thresholds, keyed by (scores fingerprint, size, sig_p, n, method). 
+    
+    Identical score vectors (e.g. duplicated or padded sequences) thus share their null samples. If a seed is set, 
+    the null samples of each key are drawn from an RNG seeded by (seed, key), such that thresholds do not depend on 
+    the order (or process) in which they are computed. 
+    """
+
+    def __init__(self, maxsize=100_000, seed=None):
+        self.maxsize = maxsize
+        self.seed = seed
+        self.hits, self.misses = 0, 0
+        self._thresholds = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._thresholds)
+
+    @staticmethod
+    def fingerprint(scores):
+        scores = np.ascontiguousarray(scores)
+        return hashlib.blake2b(scores.tobytes(), digest_size=16, person=str(scores.dtype).encode()).hexdigest()
+
+    def clear(self):
+        self._thresholds.clear()
+        self.hits, self.misses = 0, 0
+
+    def thresholds(self, scores, sizes, n=1000, sig_p=0.05, method='sampling', fingerprint=None):
+        """Returns a dict of significance thresholds for sizes (see significance_thresholds), computing only those not in the cache."""
+
+        if fingerprint is None:
+            fingerprint = self.fingerprint(scores)
+        keys = {size: (fingerprint, size, sig_p, n, method, self.seed) for size in sizes}
+
+        thresholds = {}
+        for size, key in keys.items():
+            if key in self._thresholds:
+                self.hits += 1
+                profiler.count('thresholds_cached')
+                self._thresholds.move_to_end(key)
+                thresholds[size] = self._thresholds[key]
+
+        missing_sizes = [size for size in keys if size not in thresholds]
+        if len(missing_sizes) > 0:
+            self.misses += len(missing_sizes)
+            profiler.count('thresholds_computed', len(missing_sizes))
+            if method == 'sampling':
+                for size in missing_sizes:
+                    rng = None
+                    if self.seed is not None:
+                        rng = np.random.default_rng([self.seed, int(fingerprint, 16), size, n, int(np.float64(sig_p).view(np.uint64))])
+                    thresholds[size] = find_significance_threshold(scores, size=size, n=n, sig_p=sig_p, rng=rng)
+            else:
+                thresholds.update(significance_thresholds(scores, missing_sizes, n=n, sig_p=sig_p, method=method))
+
+            for size in missing_sizes:
+                self._thresholds[keys[size]] = thresholds[size]
+            while len(self._thresholds) > self.maxsize:
+                self._thresholds.popitem(last=False)
+
+        return thresholds
+
+# module-level cache shared by search and search_batch
+threshold_cache = ThresholdCache()
+
+# %%
+class _MaskedScores:
+    """Scores with masked (already discovered) positions, supporting O(1) window sums and mask queries via prefix sums."""
+
+    def __init__(self, scores):
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.cumsum = np.concatenate([[0.0], np.cumsum(self.scores)])
+        self.masked = np.zeros(len(self.scores), dtype=bool)
+        self.masked_cumsum = np.zeros(len(self.scores) + 1, dtype=np.int64)
+
+    def is_masked(self, start, stop):
+        return self.masked_cumsum[stop] > self.masked_cumsum[start]
+
+    def window_sum(self, start, stop):
+        """Sum of scores[start:stop], -inf if the window is masked or out of bounds."""
+        if start < 0 or stop > len(self.scores) or self.is_masked(start, stop):
+            return -np.inf
+        return self.cumsum[stop] - self.cumsum[start]
+
+    def mask(self, start, stop):
+        newly_masked = ~self.masked[start:stop]
+        self.masked[start:stop] = True
+        self.masked_cumsum[(start+1):(stop+1)] += np.cumsum(newly_masked)
+        self.masked_cumsum[(stop+1):] += np.sum(newly_masked)
+
+def _legacy_window_score(masked_scores, start, reduce):
+    """Score of the 2-mer window at start as computed by the original search, i.e. the sum (seed) or mean (extension) of 
+    scores[start:start+2] (truncated at the sequence end), -inf if masked and nan if empty."""
+    
+    length = len(masked_scores.scores)
+    stop = min(start + 2, length)
+    if stop <= start:
+        return np.nan
+    if masked_scores.is_masked(start, stop):
+        return -np.inf
+    if stop - start == 1:
+        return masked_scores.scores[start]
+    window_sum = masked_scores.scores[start] + masked_scores.scores[start+1]
+    return window_sum if reduce == 'sum' else window_sum / 2
+
 # %%
-@gin.configurable(denylist=['scores'])
-def search(scores, sig_p=0.01, seed_size=2, max_size=20, extend_flanks=0):
-    scores_cpy = copy.deepcopy(scores) # create copy for masking
+@gin.configurable(denylist=['scores', 'thresholds'])
+def search(scores, sig_p=0.01, seed_size=2, max_size=20, extend_flanks=0, threshold_method='sampling', extension='legacy', thresholds=None, backend='numpy'):
+    """Searches a score vector for significant k-mers. 
+
+    Starting from 2-mer seeds (ranked by running_mean of scores), k-mers are extended by one position to each side for as long 
+    as they remain significant, after which they are masked. With extension='legacy', k-mers are scored as in previous versions 
+    (i.e. by the mean of a 2-mer window shifted by the extension). With extension='window', the k-mer of size seed_size + 2 * extension, 
+    centered on the seed, is scored by the sum of its scores. Window sums and masks are O(1) lookups into prefix sums, and seeds 
+    overlapping already masked positions are skipped without scoring. 
+
+    Note that seeds are ranked by the 2-mer running mean (at their start) with either extension, i.e. with extension='window' 
+    and seed_size > 2, seeds are not ranked by the sum of the seed_size window they are scored by. search_batch (and the compiled 
+    kernel) rank seeds identically. 
+
+    Discovered k-mers are not merged. Masking keeps seeds from overlapping earlier k-mers, but k-mers may still overlap in 
+    positions that are not scored, i.e. in their flanks (extend_flanks) or, with extension='legacy', left of the shifted window. 
 
-    # dict of 
-    kmer_sig_p_thresholds = {}
+    This is the reference implementation. With backend='numba', the search runs in a compiled kernel instead (see search_batch).
+
+    Returns:
+        list: List of (start, stop) tuples of discovered k-mers.
+    """
+
+    if extension not in ('legacy', 'window'):
+        raise ValueError(f'Unknown extension mode: {extension}')
+    if resolve_backend(backend) == 'numba':
+        hits = search_batch(np.asarray(scores, dtype=np.float64).reshape(1, -1), sig_p=sig_p, seed_size=seed_size, max_size=max_size, extend_flanks=extend_flanks, threshold_method=threshold_method, extension=extension, thresholds=thresholds, backend=backend)
+        return list(zip(hits['start'].tolist(), hits['stop'].tolist()))
+    masked_scores = _MaskedScores(scores)
+    length = len(masked_scores.scores)
+    seed_window_size = 2 if extension == 'legacy' else seed_size
+
+    # dict of kmer size -> significance threshold (pre-computed, e.g. from a global background, or lazily computed)
+    kmer_sig_p_thresholds = dict(thresholds) if thresholds is not None else {}
+    scores_fingerprint = None
 
     discovered_kmers = []
 
     # from most to least important 2-mer
     for i in np.argsort(running_mean(scores, k=2)):
-        # print('i:', i)
+        # skip seeds invalidated by earlier masking (their score is -inf, i.e. never significant)
+        if i + seed_window_size > length or masked_scores.is_masked(i, i + seed_window_size):
+            profiler.count('seeds_skipped')
+            continue
+        profiler.count('seeds_visited')
+
         extend_size = 0
         current_kmer_size = seed_size + 2*extend_size
-        current_kmer_score = np.sum(scores_cpy[(i+extend_size):(i+2+extend_size)])
+        if extension == 'legacy':
+            current_kmer_score = _legacy_window_score(masked_scores, i, reduce='sum')
+        else:
+            current_kmer_score = masked_scores.window_sum(i, i + seed_size)
         current_kmer_sig = False
         while current_kmer_size <= max_size:
-            # print(f'{current_kmer_score=}')
             # lazy compute significance thresholds for kmer size
             if current_kmer_size not in kmer_sig_p_thresholds:
-                kmer_sig_p_thresholds[current_kmer_size] = find_significance_threshold(scores, size=current_kmer_size, sig_p=sig_p)
+                # (the exact method computes all sizes in one pass)
+                if scores_fingerprint is None:
+                    scores_fingerprint = threshold_cache.fingerprint(scores)
+                sizes = [current_kmer_size] if threshold_method == 'sampling' else range(seed_size, max_size + 1, 2)
+                with profiler.timer('thresholds'):
+                    kmer_sig_p_thresholds.update(threshold_cache.thresholds(scores, sizes, sig_p=sig_p, method=threshold_method, fingerprint=scores_fingerprint))
 
-            # p = compute_p(scores, np.sum(scores[(i+extend_size):(i+2+extend_size)]), size=(size + 2*extend_size))
-            # print(f'p={p}, range={(i-extend_size, i+extend_size+2)}')
             # check if kmer still significant
             if kmer_sig_p_thresholds[current_kmer_size] < current_kmer_score:
                 current_kmer_sig = True
                 extend_size += 1
                 current_kmer_size = seed_size + 2*extend_size
-                current_kmer_score = np.mean(scores_cpy[(i+extend_size):(i+2+extend_size)]) # or np.sum?
+                if extension == 'legacy':
+                    current_kmer_score = _legacy_window_score(masked_scores, i + extend_size, reduce='mean')
+                else:
+                    current_kmer_score = masked_scores.window_sum(i - extend_size, i + seed_size + extend_size)
             else:
                 break
         
         if current_kmer_sig: # only if kmer was significant
-            kmer_start, kmer_stop = max(0, i-extend_size+1-extend_flanks), min(i+seed_size+extend_size+2-1+extend_flanks, len(scores)) # get kmer range
-            scores_cpy[kmer_start:kmer_stop] = -np.inf # mask kmer
-            # print('size:', current_kmer_size)
-            # print((kmer_start, kmer_stop))
+            # get kmer range
+            if extension == 'legacy':
+                kmer_start, kmer_stop = max(0, i-extend_size+1-extend_flanks), min(i+seed_size+extend_size+2-1+extend_flanks, length)
+            else:
+                # last significant window, i.e. of extend_size - 1
+                kmer_start, kmer_stop = max(0, i-extend_size+1-extend_flanks), min(i+seed_size+extend_size-1+extend_flanks, length)
+            masked_scores.mask(kmer_start, kmer_stop) # mask kmer
             discovered_kmers.append((kmer_start, kmer_stop))
 
-    # TODO: merge overlapping kmers
+    profiler.count('kmers_emitted', len(discovered_kmers))
+    return discovered_kmers
+
+# %%
+# structured dtype of k-mers returned by `search_batch`
+HIT_DTYPE = np.dtype([('index', np.int64), ('start', np.int64), ('stop', np.int64), ('score', np.float64)])
+
+def resolve_backend(backend):
+    """Returns the search backend to use, i.e. 'numpy', or 'numba' if numba is installed (falling back to 'numpy' otherwise)."""
+
+    if backend == 'numba':
+        from metamotif.kernels import numba
+        if numba is None:
+            warnings.warn("numba is not installed, falling back to search.backend = 'numpy'")
+            return 'numpy'
+    elif backend != 'numpy':
+        raise ValueError(f'Unknown search backend: {backend}')
+    return backend
+
+def search_config(**kwargs):
+    """Returns the effective hyperparameters of `search`, i.e. its defaults, overridden by gin bindings and (non-None) kwargs."""
+
+    params = {name: p.default for name, p in inspect.signature(search).parameters.items() if p.default is not inspect.Parameter.empty}
+    params.update(gin.get_bindings(search))
+    params.update({name: value for name, value in kwargs.items() if value is not None})
+    return params
+
+def _kmer_scores(scores, index, start, stop):
+    """Sums scores[index, start:stop] for all k-mers, grouped by k-mer length (bit-identical to np.sum on each slice)."""
+
+    kmer_scores = np.zeros(len(index), dtype=np.float64)
+    lengths = stop - start
+    for length in np.unique(lengths):
+        is_length = (lengths == length)
+        positions = start[is_length, None] + np.arange(length)
+        kmer_scores[is_length] = np.sum(scores[index[is_length, None], positions], axis=1)
+    return kmer_scores
+
+def _batch_window_sums(scores_cumsum, masked_cumsum, rows, start, stop):
+    """Sums of scores[rows, start:stop] via prefix sums, -inf for masked or out-of-bounds windows."""
+
+    length = scores_cumsum.shape[1] - 1
+    start_clipped, stop_clipped = np.clip(start, 0, length), np.clip(stop, 0, length)
+    valid = (start >= 0) & (stop <= length) & (masked_cumsum[rows, stop_clipped] == masked_cumsum[rows, start_clipped])
+    return np.where(valid, scores_cumsum[rows, stop_clipped] - scores_cumsum[rows, start_clipped], -np.inf)
+
+def search_batch(scores, sig_p=None, seed_size=None, max_size=None, extend_flanks=None, threshold_method=None, extension=None, thresholds=None, backend=None):
+    """Runs `search` on all rows of a score matrix at once. 
+
+    The greedy seed-extend-mask procedure is sequential within a sequence, but independent across sequences. 
+    Hence, the j-th ranked seed of all sequences is processed in lock-step, such that seed ranking, window scoring 
+    and masking are array operations over the whole batch. With backend='numba', each row is instead searched by 
+    a compiled kernel (see metamotif.kernels.search_row), with identical results. Hyperparameters default to those of `search`. 
+
+    Args:
+        scores (np.ndarray): Scores of shape (n_sequences, sequence_length).
+        thresholds (dict, optional): Significance thresholds per k-mer size shared by all rows (see background_thresholds). 
+            Defaults to None (per-row thresholds).
+
+    Returns:
+        np.ndarray: Structured array (see HIT_DTYPE) of discovered k-mers, where index is the row of the k-mer and score 
+            the sum of its scores. K-mers are grouped by row and, within a row, ordered as returned by `search`. 
+    """
+
+    params = search_config(sig_p=sig_p, seed_size=seed_size, max_size=max_size, extend_flanks=extend_flanks, threshold_method=threshold_method, extension=extension, backend=backend)
+    sig_p, seed_size, max_size, extend_flanks, threshold_method, extension, backend = [params[name] for name in ['sig_p', 'seed_size', 'max_size', 'extend_flanks', 'threshold_method', 'extension', 'backend']]
+    if extension not in ('legacy', 'window'):
+        raise ValueError(f'Unknown extension mode: {extension}')
+    backend = resolve_backend(backend)
+
+    scores = np.asarray(scores, dtype=np.float64)
+    assert scores.ndim == 2, f'Expected scores with ndim=2, got ndim={scores.ndim}.'
+    n, length = scores.shape
+    rows = np.arange(n)
+    scores_cpy = scores.copy() # create copy for masking
+    if extension == 'window':
+        # prefix sums of scores and of masked positions, for O(1) window sums
+        scores_cumsum = np.concatenate([np.zeros((n, 1)), np.cumsum(scores, axis=1)], axis=1)
+        masked = np.zeros((n, length), dtype=bool)
+        masked_cumsum = np.zeros((n, length + 1), dtype=np.int64)
+
+    # significance thresholds of all k-mer sizes reachable by extension, shape (n, n_sizes), lazily computed (i.e. nan 
+    # if missing, such that nan thresholds, e.g. of all-nan scores, are stored as inf, which are equally never exceeded)
+    kmer_sizes = list(range(seed_size, max_size + 1, 2))
+    kmer_sig_p_thresholds = np.full((n, len(kmer_sizes)), np.nan)
+    if thresholds is not None:
+        kmer_sig_p_thresholds[:] = np.nan_to_num([thresholds[size] for size in kmer_sizes], nan=np.inf, posinf=np.inf, neginf=-np.inf)
+    scores_fingerprints = [None] * n
+
+    def compute_thresholds(r, k):
+        # thresholds of row r for the k-th k-mer size (or, for the exact method, all sizes)
+        if scores_fingerprints[r] is None:
+            scores_fingerprints[r] = threshold_cache.fingerprint(scores[r])
+        if threshold_method == 'sampling':
+            threshold = threshold_cache.thresholds(scores[r], [kmer_sizes[k]], sig_p=sig_p, fingerprint=scores_fingerprints[r])[kmer_sizes[k]]
+            kmer_sig_p_thresholds[r, k] = np.inf if np.isnan(threshold) else threshold
+        else:
+            row_thresholds = threshold_cache.thresholds(scores[r], kmer_sizes, sig_p=sig_p, method=threshold_method, fingerprint=scores_fingerprints[r])
+            kmer_sig_p_thresholds[r] = np.nan_to_num([row_thresholds[size] for size in kmer_sizes], nan=np.inf, posinf=np.inf, neginf=-np.inf)
+
+    # per-row seed ranking (same order as in search)
+    seed_order = np.argsort(running_mean(scores, k=2, axis=1), axis=1)
+    if backend == 'numba':
+        return _search_rows_compiled(scores, seed_order, kmer_sig_p_thresholds, compute_thresholds, seed_size, extend_flanks, extension)
+
+    discovered_kmers = []
+    for j in range(seed_order.shape[1]):
+        i = seed_order[:, j]
+        extend_size = np.zeros(n, dtype=np.int64)
+        if extension == 'legacy':
+            current_kmer_score = scores_cpy[rows, i] + scores_cpy[rows, i+1]
+        else:
+            current_kmer_score = _batch_window_sums(scores_cumsum, masked_cumsum, rows, i, i + seed_size)
+        current_kmer_sig = np.zeros(n, dtype=bool)
+        active = np.ones(n, dtype=bool)
+        if profiler.enabled:
+            # seeds overlapping masked positions score -inf, i.e. are never significant
+            seeds_skipped = np.count_nonzero(np.isneginf(current_kmer_score))
+            profiler.count('seeds_skipped', seeds_skipped)
+            profiler.count('seeds_visited', n - seeds_skipped)
+        for k in range(len(kmer_sizes)):
+            missing_rows = np.flatnonzero(active & np.isnan(kmer_sig_p_thresholds[:, k]))
+            if len(missing_rows) > 0:
+                with profiler.timer('thresholds'):
+                    for r in missing_rows:
+                        compute_thresholds(r, k)
+
+            # extend all rows in which the current kmer is still significant
+            active = active & (kmer_sig_p_thresholds[:, k] < current_kmer_score)
+            if not active.any():
+                break
+            current_kmer_sig |= active
+            extend_size[active] += 1
+
+            if extension == 'legacy':
+                # mean over the (possibly truncated) window [i+extend_size, i+2+extend_size)
+                left = i[active] + extend_size[active]
+                right = left + 1
+                left_score = scores_cpy[rows[active], np.minimum(left, length-1)]
+                right_score = scores_cpy[rows[active], np.minimum(right, length-1)]
+                with np.errstate(invalid='ignore'):
+                    current_kmer_score[active] = np.where(right < length, (left_score + right_score) / 2, np.where(left < length, left_score, np.nan))
+            else:
+                # sum over the window [i-extend_size, i+seed_size+extend_size)
+                current_kmer_score[active] = _batch_window_sums(scores_cumsum, masked_cumsum, rows[active], i[active] - extend_size[active], i[active] + seed_size + extend_size[active])
+
+        if not current_kmer_sig.any():
+            continue
+
+        # get kmer ranges of significant rows and mask them
+        sig_rows, i, extend_size = rows[current_kmer_sig], i[current_kmer_sig], extend_size[current_kmer_sig]
+        kmer_start = np.maximum(0, i-extend_size+1-extend_flanks)
+        if extension == 'legacy':
+            kmer_stop = np.minimum(i+seed_size+extend_size+2-1+extend_flanks, length)
+        else:
+            kmer_stop = np.minimum(i+seed_size+extend_size-1+extend_flanks, length)
+        positions = kmer_start[:, None] + np.arange(np.max(kmer_stop - kmer_start))
+        in_kmer = positions < kmer_stop[:, None]
+        scores_cpy[np.broadcast_to(sig_rows[:, None], positions.shape)[in_kmer], positions[in_kmer]] = -np.inf
+        if extension == 'window':
+            masked[np.broadcast_to(sig_rows[:, None], positions.shape)[in_kmer], positions[in_kmer]] = True
+            masked_cumsum[sig_rows, 1:] = np.cumsum(masked[sig_rows], axis=1)
+
+        discovered_kmers.append((sig_rows, kmer_start, kmer_stop))
+
+    hits = np.zeros(sum(len(index) for index, *_ in discovered_kmers), dtype=HIT_DTYPE)
+    if len(hits) == 0:
+        return hits
+    for field, values in zip(['index', 'start', 'stop'], zip(*discovered_kmers)):
+        hits[field] = np.concatenate(values)
+    hits = hits[np.argsort(hits['index'], kind='stable')]
+    hits['score'] = _kmer_scores(scores, hits['index'], hits['start'], hits['stop'])
+
+    profiler.count('kmers_emitted', len(hits))
+    return hits
+
+def _search_rows_compiled(scores, seed_order, kmer_sig_p_thresholds, compute_thresholds, seed_size, extend_flanks, extension):
+    """Searches each row of scores with the compiled kernel (see metamotif.kernels.search_row), resuming it after computing missing thresholds."""
+
+    from metamotif.kernels import search_row
+
+    n, length = scores.shape
+    scores_cpy = scores.copy()
+    scores_cumsum = np.concatenate([np.zeros((n, 1)), np.cumsum(scores, axis=1)], axis=1)
+    masked = np.zeros(length, dtype=bool)
+    # each k-mer masks at least one new position, i.e. there are at most length k-mers per row
+    kmer_starts, kmer_stops = np.zeros(length, dtype=np.int64), np.zeros(length, dtype=np.int64)
+    seed_counts = np.zeros(2, dtype=np.int64)
+
+    hits = []
+    for r in range(n):
+        masked[:] = False
+        j, n_kmers = 0, 0
+        while True:
+            j, k, n_kmers = search_row(scores_cpy[r], scores_cumsum[r], masked, seed_order[r], kmer_sig_p_thresholds[r], j, seed_size, extend_flanks, extension == 'legacy', kmer_starts, kmer_stops, n_kmers, seed_counts)
+            if k < 0:
+                break
+            with profiler.timer('thresholds'):
+                compute_thresholds(r, k)
+        row_hits = np.zeros(n_kmers, dtype=HIT_DTYPE)
+        row_hits['index'], row_hits['start'], row_hits['stop'] = r, kmer_starts[:n_kmers], kmer_stops[:n_kmers]
+        hits.append(row_hits)
+
+    hits = np.concatenate(hits) if len(hits) > 0 else np.zeros(0, dtype=HIT_DTYPE)
+    hits['score'] = _kmer_scores(scores, hits['index'], hits['start'], hits['stop'])
+    profiler.count('seeds_skipped', seed_counts[0])
+    profiler.count('seeds_visited', seed_counts[1])
+    profiler.count('kmers_emitted', len(hits))
+    return hits
+
+def search_segments(segments, **kwargs):
+    """Runs `search` on a list of (variable-length) score vectors, without padding them. 
+    
+    Segments of equal length are searched together via search_batch, kwargs are passed on to search_batch. 
+
+    Returns:
+        np.ndarray: Structured array (see HIT_DTYPE) of discovered k-mers, where index is the position of the k-mer's segment in segments. 
+    """
+
+    lengths = np.array([len(segment) for segment in segments], dtype=np.int64)
+    hits = [np.zeros(0, dtype=HIT_DTYPE)]
+    for length in np.unique(lengths):
+        index = np.flatnonzero(lengths == length)
+        hits_length = search_batch(np.stack([segments[i] for i in index]).reshape(len(index), length), **kwargs)
+        hits_length['index'] = index[hits_length['index']]
+        hits.append(hits_length)
+    hits = np.concatenate(hits)
+
+    return hits[np.argsort(hits['index'], kind='stable')]
+
+# %%
+def window_tiles(lengths, window_size, overlap):
+    """Tiles sequences of the given lengths into overlapping windows.
+
+    The cores [i*window_size, (i+1)*window_size) of each sequence partition it, and each window extends its core by 
+    overlap positions to both sides (clipped to the sequence). 
+
+    Returns:
+        np.ndarray: Tiles of shape (n_tiles, 5), with columns index (of the sequence), start, stop, core_start and core_stop.
+    """
+
+    tiles = []
+    for index, length in enumerate(np.asarray(lengths, dtype=np.int64).tolist()):
+        core_start = np.arange(0, length, window_size)
+        core_stop = np.minimum(core_start + window_size, length)
+        tiles.append(np.stack([np.full(len(core_start), index), np.maximum(core_start - overlap, 0), np.minimum(core_stop + overlap, length), core_start, core_stop], axis=1))
+    return np.concatenate(tiles).astype(np.int64) if len(tiles) > 0 else np.zeros((0, 5), dtype=np.int64)
+
+def search_tiles(scores, tiles, **kwargs):
+    """Searches windows of sequences (see window_tiles) independently, and stitches their hits.
+
+    Each hit is kept only by the tile whose core contains its center, such that hits in the overlap of two windows are 
+    not duplicated. Hits equal those of searching whole sequences (with the same thresholds) if the overlap is at least 
+    max_size + extend_flanks and masks do not chain across core boundaries, i.e. as long as the greedy search in a window 
+    is not affected by hits beyond its ends (otherwise, hits near core boundaries may differ, e.g. be lost, in dense regions). 
+    Windows are searched via search_segments, kwargs are passed on to search_batch (thresholds should be shared, e.g. 
+    from background_thresholds).
+
+    Args:
+        scores (np.ndarray or RaggedScores): Scores, indexable by sequence.
+        tiles (np.ndarray): Tiles of shape (n_tiles, 5), see window_tiles.
+
+    Returns:
+        np.ndarray: Structured array (see HIT_DTYPE) of discovered k-mers, with index, start and stop of the sequence.
+    """
 
-    return discovered_kmers
\ No newline at end of file
+    hits = search_segments([np.asarray(scores[index][start:stop], dtype=np.float64) for index, start, stop, _, _ in tiles.tolist()], **kwargs)
+    hits_tiles = tiles[hits['index']]
+    hits['index'] = hits_tiles[:, 0]
+    hits['start'] += hits_tiles[:, 1]
+    hits['stop'] += hits_tiles[:, 1]
+    center = (hits['start'] + hits['stop']) // 2
+    return hits[(center >= hits_tiles[:, 3]) & (center < hits_tiles[:, 4])]
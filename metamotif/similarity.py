@@ -0,0 +1,112 @@
+# %%
+import collections
+
+import numpy as np
+
+# %%
+def _prepare_pwms(pwms, eps):
+    # group PWMs by length, with per-PWM terms needed for the JSD: clipped probabilities and p * log2(p), and rows present (row-sum != 0)
+    groups = collections.defaultdict(list)
+    for i, pwm in enumerate(pwms):
+        groups[len(pwm)].append(i)
+
+    prepared = {}
+    for length, indices in groups.items():
+        p = np.stack([np.asarray(pwms[i], dtype=np.float64) for i in indices]) if length > 0 else np.zeros((len(indices), 0, 4))
+        p_clipped = np.clip(p, eps, 1)
+        prepared[length] = (np.array(indices), p, p_clipped, np.sum(p_clipped * np.log2(p_clipped), axis=-1), np.sum(p, axis=-1) != 0)
+    return prepared
+
+def _position_similarity(p_a, p_b, p_a_clipped, p_b_clipped, plogp_a, plogp_b, eps):
+    # 1 - JSD (log-basis 2) between all positions of PWMs a (n_a, la, 4) and b (n_b, lb, 4), of shape (n_a, n_b, la, lb)
+    m = np.clip((p_a[:, None, :, None] + p_b[None, :, None, :]) / 2, eps, 1)
+    log_m = np.log2(m)
+    cross_a = np.einsum('aic,abijc->abij', p_a_clipped, log_m)
+    cross_b = np.einsum('bjc,abijc->abij', p_b_clipped, log_m)
+    return 1 - ((plogp_a[:, None, :, None] - cross_a) + (plogp_b[None, :, None, :] - cross_b)) / 2
+
+def _group_similarity(group_a, group_b, min_size, eps, max_block_size):
+    # similarities between two groups of equal-length PWMs (as prepared by _prepare_pwms, without indices), of shape (n_a, n_b)
+    p_a, p_a_clipped, plogp_a, present_a = group_a
+    p_b, p_b_clipped, plogp_b, present_b = group_b
+    la, lb = p_a.shape[1], p_b.shape[1]
+    similarities = np.full((len(p_a), len(p_b)), np.nan)
+    if min(la, lb) < min_size or min_size < 1 or len(p_a) == 0 or len(p_b) == 0:
+        return similarities
+
+    # offsets k of position j of b relative to position i of a (k = j - i) with an overlap of at least min_size
+    offsets = range(-(la - min_size), (lb - min_size) + 1)
+    # blocks of (block_size_a, block_size_b) PWM pairs, such that both large and small groups are split
+    n_pairs = max(1, max_block_size // (la * lb * 4))
+    block_size_b = min(len(p_b), n_pairs)
+    block_size_a = max(1, n_pairs // block_size_b)
+    for block_start_a in range(0, len(p_a), block_size_a):
+        block_a = slice(block_start_a, block_start_a + block_size_a)
+        for block_start_b in range(0, len(p_b), block_size_b):
+            block_b = slice(block_start_b, block_start_b + block_size_b)
+            position_similarity = _position_similarity(p_a[block_a], p_b[block_b], p_a_clipped[block_a], p_b_clipped[block_b], plogp_a[block_a], plogp_b[block_b], eps)
+            present = present_a[block_a][:, None, :, None] & present_b[block_b][None, :, None, :]
+            position_similarity[~present] = 0
+
+            # mean similarity of present positions along each diagonal (offset), reduced by max. over offsets
+            sums = np.stack([np.trace(position_similarity, offset=k, axis1=2, axis2=3) for k in offsets], axis=-1)
+            counts = np.stack([np.trace(present, offset=k, axis1=2, axis2=3) for k in offsets], axis=-1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                offset_similarities = sums / counts
+            offset_similarities[counts == 0] = -np.inf
+            block_similarities = offset_similarities.max(axis=-1)
+            block_similarities[np.isneginf(block_similarities)] = np.nan
+            similarities[block_a, block_b] = block_similarities
+    return similarities
+
+def similarity_matrix(pwms_a, pwms_b=None, min_size=3, eps=1e-7, max_block_size=2**22):
+    """Computes the offset-aware JSD similarity between all pairs of two lists of position-weight matrices (PWMs).
+
+    For each pair, the PWMs are shifted along each other at all offsets with an overlap of at least min_size positions.
+    At each offset, the similarity is the mean 1 - JSD (log-basis 2) of overlapping positions that are present (row-sum != 0)
+    in both PWMs, and the similarity of the pair is the max. over offsets (see legacy.similarity.motif_similarity).
+
+    PWMs are grouped by length, and similarities of each pair of groups are computed in blocks of bounded memory.
+
+    Args:
+        pwms_a (list): PWMs of shape (length, 4).
+        pwms_b (list, optional): PWMs of shape (length, 4). Defaults to None, i.e. pwms_a.
+        min_size (int, optional): Minimum overlap size. Defaults to 3.
+        eps (float, optional): Probabilities are clipped to [eps, 1]. Defaults to 1e-7.
+        max_block_size (int, optional): Max. number of position pairs (times 4) per block of PWM pairs. Defaults to 2**22.
+
+    Returns:
+        np.ndarray: Similarities of shape (len(pwms_a), len(pwms_b)), in range [0, 1]. NaN for pairs without any valid offset.
+    """
+
+    groups_a = _prepare_pwms(pwms_a, eps)
+    groups_b = groups_a if pwms_b is None else _prepare_pwms(pwms_b, eps)
+    similarities = np.full((len(pwms_a), len(pwms_a) if pwms_b is None else len(pwms_b)), np.nan)
+
+    for la, (indices_a, *group_a) in groups_a.items():
+        for lb, (indices_b, *group_b) in groups_b.items():
+            if pwms_b is None and la > lb:
+                # similarities are symmetric, see below
+                continue
+            similarities[np.ix_(indices_a, indices_b)] = _group_similarity(group_a, group_b, min_size, eps, max_block_size)
+
+    if pwms_b is None:
+        for la, (indices_a, *_) in groups_a.items():
+            for lb, (indices_b, *_) in groups_a.items():
+                if la > lb:
+                    similarities[np.ix_(indices_a, indices_b)] = similarities[np.ix_(indices_b, indices_a)].T
+
+    return similarities
+
+# %%
+def motif_similarity(pwm_1, pwm_2, min_size=3):
+    """Computes the offset-aware JSD similarity between two PWMs (see similarity_matrix)."""
+
+    return similarity_matrix([pwm_1], [pwm_2], min_size=min_size)[0, 0]
+
+def motif_similarity_to_reference(pwm, reference, min_size=3):
+    """Computes the max. similarity between a PWM and a (list of) reference PWMs (see similarity_matrix)."""
+
+    if not isinstance(reference, list):
+        reference = [reference]
+    return np.nanmax(similarity_matrix([pwm], reference, min_size=min_size))
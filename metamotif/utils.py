@@ -1,4 +1,6 @@
 # %%
+import functools
+
 import numpy as np
 
 # %%
@@ -7,23 +9,100 @@ base2int = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
 def sequence2int(sequence):
     return [base2int.get(base, 999) for base in sequence]
 
+@functools.lru_cache(maxsize=None)
+def _lookup_table(sigma='ACGT'):
+    # maps (ASCII) bytes to their index in sigma, and all other bytes to len(sigma)
+    table = np.full(256, len(sigma), dtype=np.uint8)
+    table[np.frombuffer(sigma.encode('ascii'), dtype=np.uint8)] = np.arange(len(sigma), dtype=np.uint8)
+    return table
+
+def _sequence_bytes(sequence):
+    # one byte per character of a str, Bio.Seq.Seq or list (or array) of characters, where non-ASCII characters are unknown
+    if isinstance(sequence, (list, tuple, np.ndarray)):
+        sequence = ''.join(sequence)
+    return str(sequence).encode('ascii', errors='replace')
+
+def sequence2index(sequence, sigma='ACGT'):
+    """Encodes a sequence (str, Bio.Seq.Seq or list of characters) as an np.uint8 array of indices into sigma, where unknown characters are encoded as len(sigma)."""
+
+    return _lookup_table(sigma)[np.frombuffer(_sequence_bytes(sequence), dtype=np.uint8)]
+
 def sequence2onehot(sequence, sigma='ACGT'):
-    try:
-        import tensorflow as tf
-    except ImportError:
-        raise ImportError('tensorflow is required for onehot encoding')
+    """One-hot encodes a sequence as an np.float32 array of shape (len(sequence), len(sigma)), where unknown characters are all-zero."""
+
+    return np.eye(len(sigma) + 1, len(sigma), dtype=np.float32)[sequence2index(sequence, sigma)]
+
+def encode_sequences(sequences, sigma='ACGT'):
+    """Encodes sequences into one contiguous array of indices into sigma (see sequence2index).
+
+    Args:
+        sequences (iterable): Sequences (str, Bio.Seq.Seq or lists of characters).
+        sigma (str, optional): Alphabet. Defaults to 'ACGT'.
+
+    Returns:
+        tuple: np.uint8 array of concatenated indices and CSR-style offsets, such that the i-th sequence is 
+            indices[offsets[i]:offsets[i+1]].
+    """
+
+    sequences = [_sequence_bytes(sequence) for sequence in sequences]
+    offsets = np.cumsum([0] + [len(sequence) for sequence in sequences], dtype=np.int64)
+    return _lookup_table(sigma)[np.frombuffer(b''.join(sequences), dtype=np.uint8)], offsets
+
+def sequences2onehot(sequences, sigma='ACGT'):
+    """One-hot encodes equal-length sequences into one np.float32 array of shape (n_sequences, sequence_length, len(sigma))."""
+
+    indices, offsets = encode_sequences(sequences, sigma)
+    lengths = np.diff(offsets)
+    assert np.all(lengths == lengths[:1]), 'Sequences must be of equal length.'
+    return np.eye(len(sigma) + 1, len(sigma), dtype=np.float32)[indices].reshape(len(lengths), (lengths[0] if len(lengths) > 0 else 0), len(sigma))
+
+# %%
+def pack_kmers(kmers, sigma='ACGT'):
+    """Packs equal-length k-mers (of up to 32 nucleotides) into np.uint64 codes with 2 bits per nucleotide. 
 
-    _sigma_to_int = dict(zip(sigma, range(len(sigma))))
-    return tf.one_hot([_sigma_to_int.get(x, -1) for x in sequence], depth=len(sigma)).numpy()
+    Codes preserve the lexicographic order (w.r.t. sigma) of k-mers.
+
+    Args:
+        kmers (iterable or np.ndarray): K-mer sequences (str), or indices (see sequence2index) of shape (n_kmers, k).
+        sigma (str, optional): Alphabet of size 4. Defaults to 'ACGT'.
+
+    Returns:
+        np.ndarray: Packed k-mers of shape (n_kmers, ).
+    """
+
+    assert len(sigma) == 4
+    if isinstance(kmers, np.ndarray):
+        indices = kmers
+    else:
+        indices, offsets = encode_sequences(kmers, sigma)
+        lengths = np.diff(offsets)
+        assert np.all(lengths == lengths[:1]), 'K-mers must be of equal length.'
+        indices = indices.reshape(len(lengths), (lengths[0] if len(lengths) > 0 else 0))
+    assert indices.shape[1] <= 32, 'K-mers of more than 32 nucleotides can not be packed.'
+    if np.any(indices >= len(sigma)):
+        raise ValueError(f'K-mers contain characters not in {sigma}.')
+
+    shifts = 2 * np.arange(indices.shape[1] - 1, -1, -1, dtype=np.uint64)
+    return np.bitwise_or.reduce(indices.astype(np.uint64) << shifts, axis=1)
+
+def unpack_kmers(codes, k, sigma='ACGT'):
+    """Unpacks k-mers packed by pack_kmers into a list of str."""
+
+    shifts = 2 * np.arange(k - 1, -1, -1, dtype=np.uint64)
+    indices = (np.asarray(codes, dtype=np.uint64)[:, None] >> shifts) & np.uint64(3)
+    chars = np.frombuffer(sigma.encode('ascii'), dtype=np.uint8)[indices]
+    return [kmer.decode('ascii') for kmer in np.ascontiguousarray(chars).view(f'S{k}').ravel()] if k > 0 else [''] * len(chars)
 
 def onehot2sequence(onehot, sigma='ACGT'):
     assert onehot.shape[1] == len(sigma)
     return ''.join([(sigma[np.argmax(col)]) if np.max(col) > 0 else '0' for col in onehot])
 
 # %%
-def running_mean(x, k):
-    cumsum = np.cumsum(np.insert(x, 0, 0)) 
-    return (cumsum[k:] - cumsum[:-k]) / float(k)
+def running_mean(x, k, axis=-1):
+    x = np.asarray(x)
+    cumsum = np.cumsum(np.insert(x, 0, 0, axis=axis), axis=axis)
+    n = cumsum.shape[axis]
+    return (np.take(cumsum, np.arange(k, n), axis=axis) - np.take(cumsum, np.arange(0, n-k), axis=axis)) / float(k)
 
 # %%
 def matrix_to_transfac(mtrx, id=None, alphabet='ACGT'):
@@ -42,12 +121,56 @@ def matrix_to_transfac(mtrx, id=None, alphabet='ACGT'):
     return transfac
 
 # %%
+def meme_header(alphabet='ACGT'):
+    """Returns the header of a (minimal) MEME motif file, to be followed by motifs (see matrix_to_meme)."""
+
+    return f'MEME version 4\n\nALPHABET= {alphabet}\n\nstrands: + -\n\nBackground letter frequencies\n' + ' '.join(f'{x} {1/len(alphabet):.3f}' for x in alphabet) + '\n\n'
+
 def matrix_to_meme(mtrx, id=None, alphabet='ACGT'):
-    raise NotImplementedError
+    """Converts a count (or probability) matrix into a MEME motif, i.e. a letter-probability matrix (see meme_header)."""
+
+    assert len(alphabet) == mtrx.shape[1]
+    mtrx = np.array(mtrx, dtype=np.float64)
+    nsites = int(round(np.max(np.sum(mtrx, axis=1)))) if len(mtrx) > 0 else 0
+    row_sums = np.sum(mtrx, axis=1, keepdims=True)
+    mtrx = np.divide(mtrx, row_sums, out=np.zeros_like(mtrx), where=(row_sums != 0))
+
+    meme = f'MOTIF {id if id is not None else "motif"}\n'
+    meme += f'letter-probability matrix: alength= {len(alphabet)} w= {mtrx.shape[0]} nsites= {nsites} E= 0\n'
+    for i in range(mtrx.shape[0]):
+        meme += ' ' + '  '.join([f'{x:.6f}' for x in mtrx[i]]) + '\n'
+    meme += '\n'
+
+    return meme
 
 # %%
-def transfac_to_matrix(transfac_string):
-    raise NotImplementedError
+def transfac_to_matrix(transfac_string, alphabet='ACGT'):
+    """Parses the count matrix of a TRANSFAC motif (see matrix_to_transfac), with columns ordered as in alphabet.
+
+    Args:
+        transfac_string (str): TRANSFAC record (up to and including '//').
+        alphabet (str, optional): Alphabet. Defaults to 'ACGT'. Columns of the P0 line not in alphabet are dropped.
+
+    Returns:
+        np.ndarray: Count matrix of shape (length, len(alphabet)).
+    """
+
+    columns, rows = None, []
+    for line in transfac_string.splitlines():
+        fields = line.split()
+        if len(fields) == 0:
+            continue
+        if fields[0] == '//':
+            break
+        if fields[0] in ('P0', 'PO'):
+            columns = [x.upper().replace('U', 'T') for x in fields[1:]]
+        elif columns is not None and fields[0].isdigit():
+            rows.append([float(x) for x in fields[1:(len(columns) + 1)]])
+    if columns is None:
+        raise ValueError('TRANSFAC record without P0 line.')
+
+    mtrx = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    return mtrx[:, [columns.index(x.upper().replace('U', 'T')) for x in alphabet]]
 
 # %%
 def write_motif_tsv(motif_array, filepath, sigma=['A', 'C', 'G', 'U'], meta_info={}):
@@ -59,24 +182,40 @@ def write_motif_tsv(motif_array, filepath, sigma=['A', 'C', 'G', 'U'], meta_info
         for row in motif_array:
             print('\t'.join(map(str, row)), file=f)
 
+def read_motif_tsv(filepath):
+    """Reads a motif written by write_motif_tsv.
+
+    Returns:
+        tuple: Motif array of shape (length, len(sigma)), sigma (list) and meta info (dict).
+    """
+
+    meta_info, sigma, rows = {}, None, []
+    with open(filepath) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith('#'):
+                key, _, value = line[1:].partition('=')
+                meta_info[key] = value
+            elif sigma is None:
+                sigma = line.split('\t')
+            elif len(line) > 0:
+                rows.append([float(x) for x in line.split('\t')])
+    return np.array(rows, dtype=np.float64).reshape(len(rows), len(sigma)), sigma, meta_info
+
 # %%
 def pad_matrix(matrix, padding_left=0, padding_right=0):
-    """Pads the input position-weight matrix. 
+    """Pads the input position-weight matrix with zero rows. 
 
     Args:
-        matrix (tf.Tensor): Input matrix.
-        padding (int, optional): Padding size. Defaults to 0.
+        matrix (np.ndarray): Input matrix.
+        padding_left (int, optional): Number of rows added on the left. Defaults to 0.
+        padding_right (int, optional): Number of rows added on the right. Defaults to 0.
 
     Returns:
-        tf.Tensor: Padded PWM. 
+        np.ndarray: Padded PWM. 
     """
 
-    try:
-        import tensorflow as tf
-    except ImportError:
-        raise ImportError('tensorflow is required for padding')
-
-    return tf.pad(matrix, [[padding_left, padding_right,], [0, 0]], 'CONSTANT').numpy()
+    return np.pad(np.asarray(matrix), [[padding_left, padding_right], [0, 0]], mode='constant')
 
 def remove_padding(matrix, padding_value=0):
     """Removes padding from the input matrix. 
@@ -0,0 +1,17 @@
+import click
+
+from metamotif.kmers import count_kmers
+
+# %%
+@click.command()
+@click.argument('kmers', metavar='<kmers.tsv>', nargs=-1, required=True)
+@click.option('--min-count', type=int, default=1)
+def main(kmers, min_count):
+    # see also: metamotif kmers
+    counter = count_kmers(kmers)
+    for kmer, count in counter.most_common(min_count=min_count):
+        print(f'{kmer}\t{count}\t{count / counter.total:.6g}')
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,9 @@
 import argparse
 from pathlib import Path
 
-from tqdm import tqdm
-
-from metamotif.alignment import SeededMotifAlignment
-from metamotif.utils import sequence2onehot, write_motif_tsv
+from metamotif.alignment import find_seeded_motifs
+from metamotif.kmers import aggregate_kmers
+from metamotif.utils import sequence2onehot, sequences2onehot, write_motif_tsv
 from metamotif.visualize import plot_motif
 
 # %%
@@ -20,17 +19,6 @@ def load_kmers(tsv, to_onehot=True):
             kmers.append((kmer, score))
     return kmers
 
-def find_motifs(kmers):
-    seeded_alignments = [SeededMotifAlignment(kmers[0][0])]
-    for kmer, score in tqdm(kmers, total=len(kmers)):
-        for alignment in seeded_alignments:
-            success = alignment.align(kmer)
-            if success:
-                break
-        else:
-            seeded_alignments.append(SeededMotifAlignment(kmer))
-    return seeded_alignments
-
 # %%
 def main():
     parser = argparse.ArgumentParser()
@@ -42,15 +30,15 @@ def main():
     parser.add_argument('-o', '--output-directory')
     args = parser.parse_args()
 
-    # set total support
-    total_support = len(load_kmers(args.kmer_csv, to_onehot=False))
-    
-    # load kmers
-    kmers = load_kmers(args.kmer_csv)
+    # load kmers, and collapse duplicates (in order of first occurrence)
+    kmers = load_kmers(args.kmer_csv, to_onehot=False)
+    total_support = len(kmers)
     kmers = sorted(kmers, key = lambda x: x[1], reverse=True)
+    kmers, counts, _ = aggregate_kmers([kmer for kmer, score in kmers])
+    kmers = sequences2onehot(kmers)
     
     # find motifs
-    motifs = find_motifs(kmers)
+    motifs = find_seeded_motifs(kmers, counts)
     
     # save/plot motifs
     output_path = Path(args.output_directory) / 'motif-{i}'
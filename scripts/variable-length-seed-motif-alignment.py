@@ -2,9 +2,8 @@
 import argparse
 from pathlib import Path
 
-from tqdm import tqdm
-
-from metamotif.alignment import VariableLengthSeededMotifAlignment
+from metamotif.alignment import find_variable_length_motifs
+from metamotif.kmers import aggregate_kmers
 from metamotif.utils import sequence2onehot, write_motif_tsv
 from metamotif.visualize import plot_motif
 
@@ -22,19 +21,6 @@ def load_kmers(tsv, to_onehot=True):
             kmers.append((kmer, score))
     return kmers
 
-def find_motifs(kmers, min_agreement = 3, min_frac_agreement = .5):
-    seeded_alignments = [VariableLengthSeededMotifAlignment(kmers[0])]
-    for kmer in tqdm(kmers[1:], total=len(kmers)-1):
-        if len(kmer) < 2:
-            print(kmer)
-        for alignment in seeded_alignments:
-            score_threshold = max(min_agreement, min_frac_agreement * min(len(kmer), len(alignment.seed)))
-            if alignment.align(kmer, min_score = score_threshold):
-                break
-        else:
-            seeded_alignments.append(VariableLengthSeededMotifAlignment(kmer))
-    return seeded_alignments
-
 # %%
 def main():
     parser = argparse.ArgumentParser()
@@ -46,16 +32,17 @@ def main():
     parser.add_argument('-o', '--output-directory')
     args = parser.parse_args()
 
-    # set total support
-    total_support = len(load_kmers(args.kmer_csv, to_onehot=False))
-    
-    # load kmers
-    kmers = load_kmers(args.kmer_csv)
-    kmers = sorted(kmers, key = lambda x: x[1], reverse=True)
-    kmers = [kmer for kmer, score in kmers]
+    # load kmers, and collapse duplicates (in order of first occurrence), keeping the order of all kmers
+    kmers = load_kmers(args.kmer_csv, to_onehot=False)
+    total_support = len(kmers)
+    kmers = [kmer for kmer, score in sorted(kmers, key = lambda x: x[1], reverse=True)]
+    distinct_kmers, _, _ = aggregate_kmers(kmers)
+    index = {kmer: i for i, kmer in enumerate(distinct_kmers)}
+    order = [index[kmer] for kmer in kmers]
+    distinct_kmers = [sequence2onehot(kmer) for kmer in distinct_kmers]
     
     # find motifs
-    motifs = find_motifs(kmers, min_agreement = args.min_alignment_agreement, min_frac_agreement = args.min_alignment_agreement_frac)
+    motifs = find_variable_length_motifs(distinct_kmers, order=order, min_agreement = args.min_alignment_agreement, min_frac_agreement = args.min_alignment_agreement_frac)
     
     # save/plot motifs
     output_path = Path(args.output_directory) / 'motif-{i}'
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # random sequences, with high scores at (shifted, noisy copies of) a planted motif
+    rng = np.random.default_rng(0)
+    n_sequences, length = 60, 120
+    sequences = [list(rng.choice(list('ACGT'), size=length)) for _ in range(n_sequences)]
+    scores = rng.normal(0, .1, size=(n_sequences, length)).astype(np.float32)
+    for sequence, row in zip(sequences, scores):
+        for start in rng.choice(length - 10, size=2, replace=False):
+            sequence[start:(start + 6)] = list('GATTAC')
+            row[start:(start + 6)] += rng.uniform(1, 2)
+    with open(tmp_path / 'seqs.fasta', 'w') as f:
+        for i, sequence in enumerate(sequences):
+            print(f'>seq{i}\n{"".join(sequence)}', file=f)
+    np.save(tmp_path / 'scores.npy', scores)
+    return tmp_path
@@ -0,0 +1,140 @@
+import copy
+
+import numpy as np
+import pytest
+
+from metamotif.alignment import VariableLengthSeededMotifAlignment, find_seeded_motifs, find_variable_length_motifs
+from metamotif.kmers import aggregate_kmers
+from metamotif.utils import sequence2onehot
+
+
+# transcriptions of the original (unbatched) alignments, which the current implementation must reproduce
+class BaselineSeededMotifAlignment:
+    def __init__(self, seed, min_agreement=3):
+        self.size = len(seed)
+        self.min_agreement = min_agreement
+        self.padding = self.size - self.min_agreement
+        self.extended_size = self.size + 2 * self.padding
+        self.padded_seed = np.zeros(shape=(self.extended_size, 4), dtype=np.float32)
+        self.padded_seed[self.padding:(-self.padding)] = seed
+        self.pam = self.padded_seed.copy()
+        self.support = 1
+
+    def align(self, kmer):
+        agreement_max_idx, agreement_max_val = None, 0
+        for i in range(self.extended_size - self.size + 1):
+            agreement_i_val = np.sum(kmer * self.padded_seed[i:(i+self.size)])
+            if agreement_i_val > agreement_max_val:
+                agreement_max_val, agreement_max_idx = agreement_i_val, i
+        if agreement_max_val < self.min_agreement:
+            return False
+        self.pam[agreement_max_idx:(agreement_max_idx + self.size)] += kmer
+        self.support += 1
+        return True
+
+
+class BaselineVariableLengthSeededMotifAlignment:
+    def __init__(self, seed):
+        self.seed = copy.deepcopy(seed)
+        self.pfm = self.seed
+        self.pfm_seed_offset = 0
+        self.support = 1
+
+    def align(self, motif, min_score=None):
+        motif_long, motif_short = (motif, self.seed) if len(motif) > len(self.seed) else (self.seed, motif)
+        padding_length = len(motif_short) - 1
+        motif_long = np.pad(motif_long, [[padding_length, padding_length], [0, 0]])
+        max_score, max_score_offset = -np.inf, None
+        for i in range(len(motif_long) - len(motif_short) + 1):
+            alignment_score = np.sum(motif_long[i:(i+len(motif_short))] * motif_short)
+            if alignment_score > max_score:
+                max_score, max_score_offset = alignment_score, i
+        if min_score is not None and max_score < min_score:
+            return False
+        if len(motif) > len(self.seed):
+            offset_to_seed = -max_score_offset + padding_length
+        else:
+            offset_to_seed = max_score_offset - padding_length
+        if (self.pfm_seed_offset + offset_to_seed) < 0:
+            self.pfm = np.pad(self.pfm, [[-(self.pfm_seed_offset + offset_to_seed), 0], [0, 0]])
+            self.pfm_seed_offset += -(self.pfm_seed_offset + offset_to_seed)
+        if (len(self.pfm) - self.pfm_seed_offset - offset_to_seed) < len(motif):
+            self.pfm = np.pad(self.pfm, [[0, len(motif) - (len(self.pfm) - self.pfm_seed_offset - offset_to_seed)], [0, 0]])
+        self.pfm[(self.pfm_seed_offset + offset_to_seed):(self.pfm_seed_offset + offset_to_seed + len(motif))] += motif
+        self.support += 1
+        return max_score
+
+
+def _random_kmers(rng, n, sizes, n_distinct):
+    # few distinct k-mers, such that there are many duplicates (in random order)
+    distinct = [''.join(rng.choice(list('ACGT'), size=rng.choice(sizes))) for _ in range(n_distinct)]
+    return [distinct[i] for i in rng.integers(0, n_distinct, size=n)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_seeded_motifs_match_baseline(seed):
+    kmers = _random_kmers(np.random.default_rng(seed), 500, [7], 40)
+
+    baseline = [BaselineSeededMotifAlignment(sequence2onehot(kmers[0]))]
+    for kmer in kmers:
+        for alignment in baseline:
+            if alignment.align(sequence2onehot(kmer)):
+                break
+        else:
+            baseline.append(BaselineSeededMotifAlignment(sequence2onehot(kmer)))
+
+    distinct_kmers, counts, _ = aggregate_kmers(kmers)
+    motifs = find_seeded_motifs(np.array([sequence2onehot(kmer) for kmer in distinct_kmers]), counts)
+    assert [motif.support for motif in motifs] == [alignment.support for alignment in baseline]
+    for motif, alignment in zip(motifs, baseline):
+        np.testing.assert_array_equal(motif.pwm, alignment.pam / alignment.support)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_variable_length_motifs_match_baseline(seed):
+    kmers = _random_kmers(np.random.default_rng(seed), 500, [4, 5, 6, 7, 8, 9], 60)
+    min_agreement, min_frac_agreement = 3, .5
+
+    baseline = [BaselineVariableLengthSeededMotifAlignment(sequence2onehot(kmers[0]))]
+    for kmer in kmers[1:]:
+        kmer = sequence2onehot(kmer)
+        for alignment in baseline:
+            score_threshold = max(min_agreement, min_frac_agreement * min(len(kmer), len(alignment.seed)))
+            if alignment.align(kmer, min_score=score_threshold):
+                break
+        else:
+            baseline.append(BaselineVariableLengthSeededMotifAlignment(kmer))
+
+    distinct_kmers, _, _ = aggregate_kmers(kmers)
+    index = {kmer: i for i, kmer in enumerate(distinct_kmers)}
+    motifs = find_variable_length_motifs([sequence2onehot(kmer) for kmer in distinct_kmers], order=[index[kmer] for kmer in kmers],
+                                         min_agreement=min_agreement, min_frac_agreement=min_frac_agreement)
+    assert [motif.support for motif in motifs] == [alignment.support for alignment in baseline]
+    for motif, alignment in zip(motifs, baseline):
+        np.testing.assert_array_equal(motif.seed, alignment.seed)
+        np.testing.assert_array_equal(motif.pfm, alignment.pfm)
+
+
+def test_variable_length_weight_is_repeated_alignment():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        seed, motif = (sequence2onehot(kmer) for kmer in _random_kmers(rng, 2, [3, 4, 5, 6], 2))
+        weight = int(rng.integers(1, 6))
+        weighted, repeated = VariableLengthSeededMotifAlignment(seed), VariableLengthSeededMotifAlignment(seed)
+        accepted = weighted.align(motif, min_score=2, weight=weight)
+        assert accepted == repeated.align(motif, min_score=2)
+        for _ in range(weight - 1 if accepted is not False else 0):
+            assert repeated.align(motif, min_score=2) is not False
+        assert weighted.support == repeated.support
+        np.testing.assert_array_equal(weighted.seed, repeated.seed)
+        np.testing.assert_array_equal(weighted.pfm, repeated.pfm)
+
+
+def test_variable_length_seed_is_aliased_until_extended():
+    alignment = VariableLengthSeededMotifAlignment(sequence2onehot('ACGT'))
+    alignment.align(sequence2onehot('ACGT'))
+    assert alignment.seed_aliased
+    np.testing.assert_array_equal(alignment.seed, 2 * sequence2onehot('ACGT'))
+    alignment.align(sequence2onehot('ACGTAA'))
+    assert not alignment.seed_aliased
+    np.testing.assert_array_equal(alignment.seed, 2 * sequence2onehot('ACGT'))
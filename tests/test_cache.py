@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+import metamotif.bin.search
+from metamotif.bin.search import main as search
+from metamotif.cache import ResultCache, parse_size
+from metamotif.io import RaggedScores
+from metamotif.search import HIT_DTYPE
+
+
+def _hits(n, index=0):
+    hits = np.zeros(n, dtype=HIT_DTYPE)
+    hits['index'], hits['start'], hits['stop'], hits['score'] = index, np.arange(n), np.arange(n) + 4, np.arange(n) / 2
+    return hits
+
+
+def test_parse_size():
+    assert parse_size('100') == 100 and parse_size('2K') == 2048 and parse_size('1.5MB') == 3 * 2**19 and parse_size('1g') == 2**30
+
+
+def test_chunk_key():
+    scores, sequences, params = np.arange(12, dtype=np.float32).reshape(3, 4), ['ACGT', 'CCGT', 'ACGA'], {'search': {'sig_p': .01}, 'seed': 0}
+    key = ResultCache.chunk_key(scores, sequences, params)
+    assert key == ResultCache.chunk_key(scores.copy(), list(sequences), dict(params))
+    changed_scores = scores.copy()
+    changed_scores[1, 2] += 1
+    assert ResultCache.chunk_key(changed_scores, sequences, params) != key
+    assert ResultCache.chunk_key(scores.astype(np.float64), sequences, params) != key
+    assert ResultCache.chunk_key(scores, ['ACGT', 'CCGT', 'ACGG'], params) != key
+    assert ResultCache.chunk_key(scores, sequences, {'search': {'sig_p': .05}, 'seed': 0}) != key
+    # ragged scores are keyed by their lengths, too
+    assert ResultCache.chunk_key(RaggedScores(scores.reshape(-1), [0, 4, 8, 12]), sequences, params) != ResultCache.chunk_key(RaggedScores(scores.reshape(-1), [0, 2, 8, 12]), sequences, params)
+
+
+def test_put_get_evict(tmp_path):
+    cache = ResultCache(tmp_path)
+    assert 'a' not in cache and cache.get('a') is None
+    cache.put('a', _hits(3))
+    assert 'a' in cache
+    np.testing.assert_array_equal(cache.get('a'), _hits(3))
+
+    # least recently used entries are evicted first
+    size = os.path.getsize(tmp_path / 'a.npy')
+    cache.put('b', _hits(3))
+    cache.put('c', _hits(3))
+    os.utime(tmp_path / 'a.npy', (0, 0))
+    os.utime(tmp_path / 'b.npy', (1, 1))
+    assert 'b' in cache
+    cache.evict(2 * size)
+    assert sorted(path.name for path in tmp_path.glob('*.npy')) == ['b.npy', 'c.npy']
+
+
+def test_iter_cached_computes_only_misses(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put('k1', _hits(2, index=1))
+    computed = []
+    def compute(chunks):
+        chunks = list(chunks)
+        computed.append(chunks)
+        return [_hits(1, index=chunk) for chunk in chunks]
+
+    hits = list(cache.iter_cached([0, 1, 2], ['k0', 'k1', 'k2'], compute))
+    assert computed == [[0, 2]]
+    for chunk, expected in zip([0, 1, 2], [_hits(1, 0), _hits(2, 1), _hits(1, 2)]):
+        np.testing.assert_array_equal(hits[chunk], expected)
+    assert all(key in cache for key in ['k0', 'k1', 'k2'])
+
+
+def test_iter_cached_computes_keys_lazily(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put('k0', _hits(2, index=0))
+    keys_computed = []
+    def iter_keys():
+        for chunk in range(4):
+            keys_computed.append(chunk)
+            yield f'k{chunk}'
+
+    # keys are computed as chunks are reached by (serial) compute, i.e. up to the next missing chunk
+    hits = cache.iter_cached(range(4), iter_keys(), lambda chunks: (_hits(1, index=chunk) for chunk in chunks))
+    np.testing.assert_array_equal(next(hits), _hits(2, index=0))
+    assert keys_computed == [0, 1]
+    np.testing.assert_array_equal(next(hits), _hits(1, index=1))
+    assert keys_computed == [0, 1]
+    assert len(list(hits)) == 2 and keys_computed == [0, 1, 2, 3]
+
+
+def test_cached_search_matches_uncached(dataset, monkeypatch):
+    def run(output, *args):
+        result = CliRunner().invoke(search, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(output), '--seed', '0', '--batch-size', '16', *args])
+        assert result.exit_code == 0, result.output
+
+    run(dataset / 'hits.tsv')
+    run(dataset / 'cached-0.tsv', '--cache-dir', str(dataset / 'cache'))
+    assert len(list((dataset / 'cache').glob('*.npy'))) == 4
+
+    # the second run is served from the cache only
+    def fail(*args, **kwargs):
+        raise AssertionError('searched although cached')
+    monkeypatch.setattr(metamotif.bin.search, 'search_chunks', fail)
+    run(dataset / 'cached-1.tsv', '--cache-dir', str(dataset / 'cache'))
+    assert (dataset / 'cached-0.tsv').read_bytes() == (dataset / 'hits.tsv').read_bytes()
+    assert (dataset / 'cached-1.tsv').read_bytes() == (dataset / 'hits.tsv').read_bytes()
@@ -0,0 +1,43 @@
+import numpy as np
+
+from metamotif.database import MotifDatabase, information_content, normalize_pwm
+from metamotif.similarity import similarity_matrix
+
+
+def _count_matrices(rng, n, lengths):
+    return [rng.integers(0, 20, size=(rng.choice(lengths), 4)).astype(np.float64) for _ in range(n)]
+
+
+def test_normalize_pwm():
+    pwm = normalize_pwm([[1, 1, 2, 0], [0, 0, 0, 0], [0, 3, 0, 0]])
+    np.testing.assert_array_equal(pwm, [[.25, .25, .5, 0], [0, 0, 0, 0], [0, 1, 0, 0]])
+
+
+def test_match_normalizes_queries():
+    rng = np.random.default_rng(0)
+    database = MotifDatabase.from_matrices([f'm{i}' for i in range(40)], _count_matrices(rng, 40, [5, 6, 8]))
+    # unnormalized queries, e.g. count matrices or PWMs of alignments (i.e. PFMs divided by the total support)
+    queries = _count_matrices(rng, 10, [4, 6, 7])
+    queries[0][2] = 0
+
+    matches, similarities = database.match(queries, top_k=3)
+    matches_normalized, similarities_normalized = database.match([normalize_pwm(query) for query in queries], top_k=3)
+    np.testing.assert_array_equal(matches, matches_normalized)
+    np.testing.assert_allclose(similarities, similarities_normalized)
+
+    expected = similarity_matrix([normalize_pwm(query) for query in queries], [database[i] for i in range(len(database))])
+    np.testing.assert_allclose(similarities, -np.sort(-expected, axis=1)[:, :3])
+
+
+def test_match_prefilters_normalized_queries():
+    rng = np.random.default_rng(1)
+    database = MotifDatabase.from_matrices([f'm{i}' for i in range(40)], _count_matrices(rng, 40, [6]))
+    queries = _count_matrices(rng, 10, [6])
+    max_ic_difference = .1
+
+    matches, _ = database.match(queries, top_k=40, max_ic_difference=max_ic_difference)
+    query_ic = [np.mean(information_content(normalize_pwm(query))) for query in queries]
+    database_ic = database.information_content
+    for i, query_matches in enumerate(matches):
+        expected = np.flatnonzero(np.abs(database_ic - query_ic[i]) <= max_ic_difference)
+        assert sorted(query_matches[query_matches >= 0].tolist()) == expected.tolist()
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from metamotif.io import HIT_COLUMN_DTYPES, load_npz_array, merge_hits, open_hit_writer
+from metamotif.kmers import iter_hit_kmers
+from metamotif.search import HIT_DTYPE
+
+
+def _chunks(n_chunks=5, chunk_size=7, seed=0):
+    # chunks of records and hits (see search_batch), with k-mers of varying lengths
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for c in range(n_chunks):
+        records = [SeqRecord(Seq(''.join(rng.choice(list('ACGT'), size=40))), id=f'seq{c * chunk_size + i}') for i in range(chunk_size)]
+        n_hits = int(rng.integers(0, 10))
+        hits = np.zeros(n_hits, dtype=HIT_DTYPE)
+        hits['index'] = np.sort(rng.integers(0, chunk_size, size=n_hits))
+        hits['start'] = rng.integers(0, 20, size=n_hits)
+        hits['stop'] = hits['start'] + rng.integers(2, 3 + 3 * c, size=n_hits)
+        hits['score'] = rng.normal(size=n_hits)
+        chunks.append((c * chunk_size, records, hits))
+    return chunks
+
+
+def _expected_columns(chunks):
+    columns = {'seq_ids': [], 'seq_index': [], 'start': [], 'stop': [], 'score': [], 'kmer': []}
+    for chunk_start, records, hits in chunks:
+        columns['seq_ids'] += [record.id for record in records]
+        columns['seq_index'] += (hits['index'] + chunk_start).tolist()
+        for name in ['start', 'stop', 'score']:
+            columns[name] += hits[name].tolist()
+        columns['kmer'] += [str(records[i].seq)[start:stop] for i, start, stop in zip(hits['index'], hits['start'], hits['stop'])]
+    return columns
+
+
+def _write(filepath, output_format, chunks, **kwargs):
+    with open_hit_writer(str(filepath), output_format, **kwargs) as writer:
+        for chunk_start, records, hits in chunks:
+            writer.write(records, hits, index_offset=chunk_start)
+
+
+def _read_kmers(filepath):
+    kmers = []
+    for chars, starts, lengths in iter_hit_kmers(str(filepath)):
+        kmers.extend(chars[start:(start + length)].tobytes().decode() for start, length in zip(starts.tolist(), lengths.tolist()))
+    return kmers
+
+
+@pytest.mark.parametrize('flush_size', [1, 10, 1_000_000])
+def test_npz_writer(tmp_path, flush_size):
+    chunks = _chunks()
+    _write(tmp_path / 'hits.npz', 'npz', chunks, flush_size=flush_size)
+    expected = _expected_columns(chunks)
+
+    with np.load(tmp_path / 'hits.npz') as npz:
+        assert npz['seq_ids'].tolist() == expected['seq_ids']
+        assert int(npz['seq_ids_offset']) == 0
+        assert npz['kmer'].dtype == np.dtype(f'S{max(map(len, expected["kmer"]))}')
+        assert npz['kmer'].astype(np.str_).tolist() == expected['kmer']
+        for name in ['seq_index', 'start', 'stop', 'score']:
+            assert npz[name].dtype == HIT_COLUMN_DTYPES[name]
+            assert npz[name].tolist() == expected[name]
+    # columns are memory-mappable
+    assert isinstance(load_npz_array(tmp_path / 'hits.npz', 'score'), np.memmap)
+    # no spooled files are left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['hits.npz']
+
+
+def test_npz_writer_empty(tmp_path):
+    _write(tmp_path / 'hits.npz', 'npz', [])
+    with np.load(tmp_path / 'hits.npz') as npz:
+        assert len(npz['seq_ids']) == 0 and len(npz['kmer']) == 0 and npz['kmer'].dtype == np.dtype('S1')
+
+
+@pytest.mark.parametrize('output_format', ['tsv', 'tsv.gz', 'npz', 'parquet'])
+def test_hit_formats(tmp_path, output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    chunks = _chunks()
+    filepath = tmp_path / f'hits.{output_format}'
+    _write(filepath, output_format, chunks, flush_size=4)
+    assert _read_kmers(filepath) == _expected_columns(chunks)['kmer']
+
+
+@pytest.mark.parametrize('output_format', ['tsv', 'tsv.gz', 'npz', 'parquet'])
+def test_merge_hits(tmp_path, output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    chunks = _chunks()
+    _write(tmp_path / f'hits.{output_format}', output_format, chunks)
+    shards = [chunks[:2], chunks[2:3], chunks[3:]]
+    for i, shard in enumerate(shards):
+        _write(tmp_path / f'shard-{i}.{output_format}', output_format, shard)
+    merge_hits([tmp_path / f'shard-{i}.{output_format}' for i in range(len(shards))], tmp_path / f'merged.{output_format}', output_format)
+
+    if output_format == 'npz':
+        with np.load(tmp_path / 'hits.npz') as npz, np.load(tmp_path / 'merged.npz') as merged:
+            assert npz.files == merged.files
+            for key in npz.files:
+                np.testing.assert_array_equal(merged[key], npz[key])
+                assert merged[key].dtype == npz[key].dtype
+    elif output_format == 'parquet':
+        import pyarrow.parquet as pq
+        assert pq.read_table(tmp_path / 'merged.parquet').equals(pq.read_table(tmp_path / 'hits.parquet'))
+    else:
+        assert (tmp_path / f'merged.{output_format}').read_bytes() == (tmp_path / f'hits.{output_format}').read_bytes() or output_format == 'tsv.gz'
+        assert _read_kmers(tmp_path / f'merged.{output_format}') == _read_kmers(tmp_path / f'hits.{output_format}')
+
+
+def test_merge_npz_hits_requires_consecutive_shards(tmp_path):
+    chunks = _chunks()
+    _write(tmp_path / 'shard-0.npz', 'npz', chunks[:2])
+    _write(tmp_path / 'shard-1.npz', 'npz', chunks[3:])
+    with pytest.raises(ValueError, match='consecutive'):
+        merge_hits([tmp_path / 'shard-0.npz', tmp_path / 'shard-1.npz'], tmp_path / 'merged.npz', 'npz')
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pytest
+from Bio import SeqIO
+from click.testing import CliRunner
+
+from metamotif.bin.search import main as search
+from metamotif.io import RaggedScores
+
+
+@pytest.fixture
+def ragged_dataset(dataset):
+    # the sequences of dataset, truncated to varying lengths, with ragged scores (.npz)
+    lengths = np.random.default_rng(1).integers(20, 121, size=60)
+    scores = np.load(dataset / 'scores.npy')
+    RaggedScores.from_list([row[:length] for row, length in zip(scores, lengths)]).save(dataset / 'scores-ragged.npz')
+    with open(dataset / 'seqs-ragged.fasta', 'w') as f:
+        for record, length in zip(SeqIO.parse(dataset / 'seqs.fasta', 'fasta'), lengths):
+            print(f'>{record.id}\n{str(record.seq)[:length]}', file=f)
+    return dataset
+
+
+def _search(fasta, scores, output, *args):
+    result = CliRunner().invoke(search, [str(fasta), str(scores), '-o', str(output), '--seed', '0', '--batch-size', '7', *args])
+    assert result.exit_code == 0, result.output
+
+
+@pytest.mark.parametrize('ragged', [False, True])
+def test_jobs_output_matches_single_process(ragged_dataset, ragged):
+    fasta, scores = ('seqs-ragged.fasta', 'scores-ragged.npz') if ragged else ('seqs.fasta', 'scores.npy')
+    _search(ragged_dataset / fasta, ragged_dataset / scores, ragged_dataset / 'hits-1.tsv')
+    _search(ragged_dataset / fasta, ragged_dataset / scores, ragged_dataset / 'hits-3.tsv', '--jobs', '3')
+    assert len((ragged_dataset / 'hits-1.tsv').read_bytes()) > 0
+    assert (ragged_dataset / 'hits-3.tsv').read_bytes() == (ragged_dataset / 'hits-1.tsv').read_bytes()
+
+
+def test_jobs_profile_counters_match_single_process(dataset):
+    # counters of worker processes are merged into the profile of the main process (see Profiler.pop_stats and merge)
+    profiles = []
+    for jobs in ['1', '2']:
+        _search(dataset / 'seqs.fasta', dataset / 'scores.npy', dataset / f'hits-{jobs}.tsv', '--jobs', jobs, '--profile', str(dataset / f'profile-{jobs}.json'))
+        with open(dataset / f'profile-{jobs}.json') as f:
+            profiles.append(json.load(f))
+    assert profiles[0]['counters']['kmers_emitted'] > 0 and profiles[0]['counters']['sequences'] == 60
+    assert profiles[1]['counters'] == profiles[0]['counters']
+    assert profiles[1]['calls']['thresholds'] == profiles[0]['calls']['thresholds']
@@ -0,0 +1,73 @@
+import collections
+import gzip
+
+import numpy as np
+import pytest
+
+from metamotif.kmers import count_kmers, iter_hit_kmers
+
+
+def _kmers(filepath, chunk_size=1_000_000):
+    kmers = []
+    for chars, starts, lengths in iter_hit_kmers(str(filepath), chunk_size=chunk_size):
+        kmers.extend(chars[start:(start + length)].tobytes().decode() for start, length in zip(starts.tolist(), lengths.tolist()))
+    return kmers
+
+
+LINES = ['seq0\tACGT\t1.0000\t0\t4\t4', 'seq0\tCCA\t0.5000\t7\t10\t3', 'seq1\tACGT\t0.2500\t2\t6\t4']
+
+
+@pytest.mark.parametrize('trailing_newline', [True, False])
+@pytest.mark.parametrize('chunk_size', [1, 1_000_000])
+def test_tsv_trailing_newline(tmp_path, trailing_newline, chunk_size):
+    filepath = tmp_path / 'hits.tsv'
+    filepath.write_text('\n'.join(LINES) + ('\n' if trailing_newline else ''))
+    assert _kmers(filepath, chunk_size=chunk_size) == ['ACGT', 'CCA', 'ACGT']
+
+
+def test_tsv_gz_without_trailing_newline(tmp_path):
+    filepath = tmp_path / 'hits.tsv.gz'
+    with gzip.open(filepath, 'wt') as f:
+        f.write('\n'.join(LINES))
+    assert _kmers(filepath) == ['ACGT', 'CCA', 'ACGT']
+
+
+def test_empty_tsv(tmp_path):
+    filepath = tmp_path / 'hits.tsv'
+    filepath.write_text('')
+    assert _kmers(filepath) == []
+    assert count_kmers([str(filepath)]).total == 0
+
+
+def test_tsv_empty_lines(tmp_path):
+    filepath = tmp_path / 'hits.tsv'
+    filepath.write_text('\n' + LINES[0] + '\n\n' + LINES[1] + '\n')
+    assert _kmers(filepath) == ['ACGT', 'CCA']
+
+
+def test_tsv_lines_with_other_numbers_of_columns(tmp_path):
+    # a 5-column and a 7-column line have as many tabs as two 6-column lines
+    filepath = tmp_path / 'hits.tsv'
+    filepath.write_text('seq0\tACGT\t1.0000\t0\t4\nseq1\tCCA\t0.5000\t7\t10\t3\textra\n')
+    assert _kmers(filepath) == ['ACGT', 'CCA']
+
+
+def test_count_kmers_matches_counter(tmp_path):
+    rng = np.random.default_rng(0)
+    kmers = [''.join(rng.choice(list('ACGTN'), size=rng.integers(1, 40))) for _ in range(500)]
+    filepath = tmp_path / 'hits.tsv'
+    filepath.write_text(''.join(f'seq{i}\t{kmer}\t1.0\t0\t{len(kmer)}\t{len(kmer)}\n' for i, kmer in enumerate(kmers)))
+    counter = count_kmers([str(filepath)], chunk_size=64)
+    assert counter.total == len(kmers)
+    assert dict(counter.most_common()) == dict(collections.Counter(kmers))
+
+
+def test_most_common_orders_ties_by_first_occurrence(tmp_path):
+    # (as previous versions, which sorted k-mers in order of first occurrence by count)
+    rng = np.random.default_rng(0)
+    kmers = [''.join(rng.choice(list('ACGTN'), size=rng.integers(1, 4))) for _ in range(500)]
+    filepaths = [tmp_path / f'hits-{i}.tsv' for i in range(2)]
+    for filepath, file_kmers in zip(filepaths, [kmers[:200], kmers[200:]]):
+        filepath.write_text(''.join(f'seq{i}\t{kmer}\t1.0\t0\t{len(kmer)}\t{len(kmer)}\n' for i, kmer in enumerate(file_kmers)))
+    counter = count_kmers(list(map(str, filepaths)), chunk_size=16)
+    assert counter.most_common() == sorted(collections.Counter(kmers).items(), key=lambda x: x[1], reverse=True)
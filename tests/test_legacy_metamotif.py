@@ -0,0 +1,103 @@
+import importlib
+import importlib.util
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def legacy_metamotif(monkeypatch):
+    pytest.importorskip('logomaker')
+    pytest.importorskip('sklearn')
+    if importlib.util.find_spec('umap') is None:
+        # (embeddings are passed explicitly, via embed_fn)
+        monkeypatch.setitem(sys.modules, 'umap', types.SimpleNamespace(UMAP=None))
+    return importlib.import_module('metamotif.legacy.metamotif')
+
+
+# transcription of the original (per-row) extract_motif, which extract_motifs must reproduce
+def baseline_extract_motif(importances, k=7, norm=True):
+    best_i, best_score = -1, -np.inf
+    for i in range(0, importances.shape[0] - k + 1):
+        score = np.sum(importances[i:(i+k), :])
+        if score > best_score:
+            best_i, best_score = i, score
+    motif = importances[best_i:(best_i + k), :]
+    return motif / np.sum(motif) if norm else motif
+
+
+def _importances(n, length=30, depth=4, seed=0):
+    # one-hot importances, with a planted high-importance k-mer (of one of two types) in most sequences
+    rng = np.random.default_rng(seed)
+    importances = np.zeros((n, length, depth))
+    importances[np.arange(n)[:, None], np.arange(length)[None, :], rng.integers(0, depth, size=(n, length))] = rng.uniform(0, .2, size=(n, length))
+    types = rng.choice([0, 1, -1], size=n, p=[.45, .45, .1])
+    for i, t in enumerate(types):
+        if t >= 0:
+            start = rng.integers(0, length - 5)
+            importances[i, start:(start + 5)] = 0
+            importances[i, start:(start + 5), t] = rng.uniform(1, 2, size=5)
+    return importances, types
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 10_000])
+@pytest.mark.parametrize('norm', [True, False])
+def test_extract_motifs_matches_baseline(legacy_metamotif, tmp_path, chunk_size, norm):
+    importances, _ = _importances(50)
+    expected = np.stack([baseline_extract_motif(x, k=5, norm=norm) for x in importances])
+    np.testing.assert_allclose(legacy_metamotif.extract_motifs(importances, k=5, norm=norm, chunk_size=chunk_size), expected, rtol=1e-12)
+
+    # (memory-mapped) output
+    out = np.lib.format.open_memmap(tmp_path / 'motifs.npy', mode='w+', dtype=np.float64, shape=expected.shape)
+    assert legacy_metamotif.extract_motifs(importances, k=5, norm=norm, chunk_size=chunk_size, out=out) is out
+    np.testing.assert_allclose(np.load(tmp_path / 'motifs.npy'), expected, rtol=1e-12)
+
+
+def _clust_fn(motifs_2d):
+    # clusters motifs (k=5, depth 4) by the base of the max. mean importance, i.e. never labels motifs as noise
+    return np.argmax(motifs_2d.reshape(len(motifs_2d), 5, 4).mean(axis=1)[:, :2], axis=1)
+
+
+@pytest.mark.parametrize('radius_quantile', [1.0, .5])
+def test_extract_meta_motifs_sampled(legacy_metamotif, monkeypatch, radius_quantile):
+    importances, types = _importances(200)
+    n, sample_size = len(importances), 60
+
+    # record the labels of all motifs
+    recorded = []
+    class RecordingClusterMeans(legacy_metamotif.ClusterMeans):
+        def update(self, motifs_2d, chunk_labels):
+            recorded.extend(np.asarray(chunk_labels).tolist())
+            super().update(motifs_2d, chunk_labels)
+    monkeypatch.setattr(legacy_metamotif, 'ClusterMeans', RecordingClusterMeans)
+
+    meta_motifs = legacy_metamotif.extract_meta_motifs(importances, k=5, embed_fn=lambda x: x, clust_fn=_clust_fn, chunk_size=32, sample_size=sample_size, radius_quantile=radius_quantile, seed=0)
+    labels = np.array(recorded)
+    assert len(labels) == n
+
+    # sampled motifs keep their labels, and all others are assigned to the nearest centroid (within its radius)
+    motifs = legacy_metamotif.motifs_flatten(legacy_metamotif.extract_motifs(importances, k=5))
+    sample = np.sort(np.random.default_rng(0).choice(n, size=sample_size, replace=False))
+    np.testing.assert_array_equal(labels[sample], _clust_fn(motifs[sample]))
+    centroids = np.array([motifs[sample][_clust_fn(motifs[sample]) == c].mean(axis=0) for c in [0, 1]])
+    radii = np.array([np.quantile(np.linalg.norm(motifs[sample][_clust_fn(motifs[sample]) == c] - centroids[c], axis=1), radius_quantile) for c in [0, 1]])
+    not_sampled = np.setdiff1d(np.arange(n), sample)
+    np.testing.assert_array_equal(labels[not_sampled], legacy_metamotif.assign_to_centroids(motifs[not_sampled], centroids, radii))
+    is_planted = (types >= 0) & (labels != -1)
+    np.testing.assert_array_equal(labels[is_planted], types[is_planted])
+
+    # motifs beyond the radius_quantile of their cluster (e.g. without a planted k-mer) are noise (-1), which the full fit
+    # (via clust_fn) never labels
+    assert np.sum(labels == -1) > 0
+    full_meta_motifs = legacy_metamotif.extract_meta_motifs(importances, k=5, embed_fn=lambda x: x, clust_fn=_clust_fn)
+    assert len(full_meta_motifs) == 2
+
+    # meta-motifs are the mean motifs of each label, ordered by label (as computed by the original extract_meta_motifs)
+    motifs_df = pd.DataFrame(motifs)
+    motifs_df['cluster'] = labels
+    expected = np.array(motifs_df.groupby(['cluster']).mean()).reshape(-1, 5, 4)
+    assert meta_motifs.shape == expected.shape == (len(np.unique(labels)), 5, 4)
+    np.testing.assert_allclose(meta_motifs, expected, rtol=1e-12)
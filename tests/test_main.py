@@ -0,0 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# runs the metamotif CLI with the given arguments in a fresh interpreter, and prints the heavy modules it imported
+SCRIPT = '''
+import json, sys
+from metamotif.__main__ import main
+try:
+    main(sys.argv[1:])
+except SystemExit:
+    pass
+print(json.dumps(sorted(name for name in ['numpy', 'tensorflow', 'gin'] if name in sys.modules)))
+'''
+
+
+@pytest.mark.parametrize('args', [['--help'], ['--version']])
+def test_main_does_not_import_heavy_modules(args):
+    result = subprocess.run([sys.executable, '-c', SCRIPT, *args], capture_output=True, text=True, check=True, env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
+    output = result.stdout.strip().splitlines()
+    assert 'metamotif' in result.stdout
+    assert json.loads(output[-1]) == []
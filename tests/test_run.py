@@ -0,0 +1,46 @@
+import numpy as np
+from click.testing import CliRunner
+
+from metamotif.alignment import find_variable_length_motifs
+from metamotif.bin.run import main as run
+from metamotif.kmers import KmerAggregator, aggregate_kmers
+from metamotif.utils import read_motif_tsv, sequence2onehot
+
+
+def test_kmer_aggregator_matches_aggregate_kmers():
+    rng = np.random.default_rng(0)
+    kmers = [''.join(rng.choice(list('ACG'), size=3)) for _ in range(1000)]
+    scores = np.round(rng.uniform(size=1000), 2)
+
+    aggregator = KmerAggregator()
+    for chunk_start in range(0, 1000, 128):
+        aggregator.update(kmers[chunk_start:(chunk_start + 128)], scores[chunk_start:(chunk_start + 128)])
+    distinct, counts, score_sums, order = aggregator.aggregate(return_order=True)
+
+    hit_order = sorted(range(1000), key=lambda i: -scores[i])
+    expected = aggregate_kmers([kmers[i] for i in hit_order], scores[hit_order])
+    assert distinct == expected[0]
+    np.testing.assert_array_equal(counts, expected[1])
+    np.testing.assert_allclose(score_sums, expected[2])
+    assert [distinct[i] for i in order] == [kmers[i] for i in hit_order]
+
+
+def test_run_aligns_hits_in_score_order(dataset):
+    result = CliRunner().invoke(run, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(dataset / 'motifs'), '--hits', str(dataset / 'hits.npz'),
+                                      '--hits-format', 'npz', '--seed', '0', '--min-support', '1', '--max-motifs', '1000', '--no-logos'])
+    assert result.exit_code == 0, result.output
+
+    # align the hits written by run, sorted by score (as numbers)
+    hits = np.load(dataset / 'hits.npz')
+    kmers, scores = hits['kmer'].astype(np.str_).tolist(), hits['score']
+    kmers = [kmers[i] for i in np.argsort(-scores, kind='stable')]
+    distinct, _, _ = aggregate_kmers(kmers)
+    index = {kmer: i for i, kmer in enumerate(distinct)}
+    motifs = find_variable_length_motifs([sequence2onehot(kmer) for kmer in distinct], order=[index[kmer] for kmer in kmers])
+    motifs = sorted(motifs, key=lambda x: x.support, reverse=True)
+
+    assert len(list((dataset / 'motifs').glob('motif-*.tsv'))) == len(motifs)
+    for i, motif in enumerate(motifs):
+        pwm, _, meta_info = read_motif_tsv(dataset / 'motifs' / f'motif-{i}.tsv')
+        assert int(meta_info['support']) == motif.support
+        np.testing.assert_allclose(pwm, motif.pwm)
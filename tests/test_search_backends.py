@@ -0,0 +1,117 @@
+import importlib.util
+
+import numpy as np
+import pytest
+
+from metamotif import search as search_module
+from metamotif.search import search, search_batch, threshold_cache
+
+requires_numba = pytest.mark.skipif(importlib.util.find_spec('numba') is None, reason='numba is not installed')
+
+
+@pytest.fixture(autouse=True)
+def seeded_thresholds():
+    # thresholds independent of the order in which they are computed (see ThresholdCache)
+    seed = threshold_cache.seed
+    threshold_cache.clear()
+    threshold_cache.seed = 0
+    yield
+    threshold_cache.clear()
+    threshold_cache.seed = seed
+
+
+def _scores(n=20, length=150, seed=0):
+    # noise with planted high-scoring regions, such that k-mers are extended and masked
+    rng = np.random.default_rng(seed)
+    scores = rng.normal(0, 1, size=(n, length))
+    for row in scores:
+        for start in rng.choice(length - 12, size=3, replace=False):
+            row[start:(start + rng.integers(2, 12))] += rng.uniform(2, 4)
+    return scores
+
+
+def _assert_hits_equal(actual, desired):
+    # (scores of k-mers with nan scores are nan)
+    for field in ['index', 'start', 'stop', 'score']:
+        np.testing.assert_array_equal(actual[field], desired[field])
+
+
+def _search_backend(scores, backend, **kwargs):
+    threshold_cache.clear()
+    return search_batch(scores, backend=backend, **kwargs)
+
+
+def _assert_rows_match_search(hits, scores, **kwargs):
+    threshold_cache.clear()
+    for index, row in enumerate(scores):
+        row_hits = hits[hits['index'] == index]
+        assert search(row, **kwargs) == list(zip(row_hits['start'].tolist(), row_hits['stop'].tolist()))
+
+
+@pytest.mark.parametrize('extension', ['legacy', 'window'])
+@pytest.mark.parametrize('threshold_method', ['sampling', 'exact'])
+@pytest.mark.parametrize('extend_flanks', [0, 2])
+@pytest.mark.parametrize('seed_size', [2, 4])
+def test_numpy_matches_search(extension, threshold_method, extend_flanks, seed_size):
+    scores = _scores()
+    kwargs = dict(sig_p=.05, seed_size=seed_size, max_size=12, extend_flanks=extend_flanks, threshold_method=threshold_method, extension=extension)
+    hits = _search_backend(scores, 'numpy', **kwargs)
+    assert len(hits) > 0
+    _assert_rows_match_search(hits, scores, **kwargs)
+
+
+@pytest.mark.parametrize('extension', ['legacy', 'window'])
+def test_numpy_matches_search_with_shared_thresholds(extension):
+    scores = _scores()
+    kwargs = dict(sig_p=.05, max_size=12, extension=extension, thresholds=search_module.background_thresholds(scores, range(2, 13, 2), sig_p=.05, seed=0))
+    hits = _search_backend(scores, 'numpy', **kwargs)
+    assert len(hits) > 0
+    _assert_rows_match_search(hits, scores, **kwargs)
+
+
+@requires_numba
+@pytest.mark.parametrize('extension', ['legacy', 'window'])
+@pytest.mark.parametrize('threshold_method', ['sampling', 'exact'])
+@pytest.mark.parametrize('extend_flanks', [0, 2])
+@pytest.mark.parametrize('seed_size', [2, 4])
+def test_numba_matches_numpy(extension, threshold_method, extend_flanks, seed_size):
+    scores = _scores()
+    kwargs = dict(sig_p=.05, seed_size=seed_size, max_size=12, extend_flanks=extend_flanks, threshold_method=threshold_method, extension=extension)
+    hits_numpy = _search_backend(scores, 'numpy', **kwargs)
+    hits_numba = _search_backend(scores, 'numba', **kwargs)
+    assert len(hits_numpy) > 0
+    _assert_hits_equal(hits_numba, hits_numpy)
+
+
+@requires_numba
+def test_numba_matches_numpy_with_shared_thresholds():
+    scores = _scores()
+    thresholds = search_module.background_thresholds(scores, range(2, 13, 2), sig_p=.05, seed=0)
+    for extension in ['legacy', 'window']:
+        kwargs = dict(sig_p=.05, max_size=12, extension=extension, thresholds=thresholds)
+        _assert_hits_equal(_search_backend(scores, 'numba', **kwargs), _search_backend(scores, 'numpy', **kwargs))
+
+
+@requires_numba
+@pytest.mark.parametrize('extension', ['legacy', 'window'])
+@pytest.mark.parametrize('threshold_method', ['sampling', 'exact'])
+@pytest.mark.parametrize('case', ['length-0', 'length-1', 'length-2', 'all-nan', 'some-nan', 'constant'])
+def test_numba_matches_numpy_edge_cases(extension, threshold_method, case):
+    rng = np.random.default_rng(0)
+    scores = {
+        'length-0': np.zeros((3, 0)),
+        'length-1': rng.normal(size=(3, 1)),
+        'length-2': rng.normal(size=(3, 2)),
+        'all-nan': np.full((3, 30), np.nan),
+        'some-nan': np.where(np.arange(30) % 5 == 0, np.nan, _scores(3, 30)),
+        'constant': np.full((3, 30), .5),
+    }[case]
+    kwargs = dict(sig_p=.05, max_size=8, threshold_method=threshold_method, extension=extension)
+    _assert_hits_equal(_search_backend(scores, 'numba', **kwargs), _search_backend(scores, 'numpy', **kwargs))
+
+
+def test_numba_fallback(monkeypatch):
+    import metamotif.kernels
+    monkeypatch.setattr(metamotif.kernels, 'numba', None)
+    with pytest.warns(UserWarning, match='numba is not installed'):
+        assert search_module.resolve_backend('numba') == 'numpy'
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import gin
+
+from metamotif.search import search_config
+
+
+def test_search_config_bindings():
+    gin.clear_config()
+    try:
+        gin.parse_config('search.max_size = 8')
+        params = search_config(sig_p=.05)
+    finally:
+        gin.clear_config()
+    assert params['max_size'] == 8 and params['sig_p'] == .05 and params['seed_size'] == 2
+
+
+def test_search_config_with_other_search_configurable():
+    # (in a subprocess, as configurables cannot be unregistered)
+    code = textwrap.dedent('''
+        import gin
+        from metamotif.search import search_config
+
+        @gin.configurable('search', module='other')
+        def other_search(max_size=None):
+            pass
+
+        gin.parse_config('metamotif.search.search.max_size = 8')
+        assert search_config()['max_size'] == 8
+    ''')
+    subprocess.run([sys.executable, '-c', code], check=True, env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from metamotif.bin.search import main as search
+from metamotif.io import RaggedScores
+from metamotif.search import background_thresholds, search_segments, search_tiles, window_tiles
+
+
+def _ragged_scores(lengths, n_peaks, seed=0):
+    # low noise, with (sparse or dense) planted peaks
+    rng = np.random.default_rng(seed)
+    scores = []
+    for length in lengths:
+        row = rng.normal(0, .1, size=length)
+        for start in rng.choice(length - 10, size=n_peaks, replace=False):
+            row[start:(start + rng.integers(2, 8))] += rng.uniform(1, 3)
+        scores.append(row)
+    return RaggedScores.from_list(scores)
+
+
+def test_window_tiles_partition_sequences():
+    lengths = [0, 1, 99, 100, 101, 350]
+    tiles = window_tiles(lengths, 100, 25)
+    for index, length in enumerate(lengths):
+        index_tiles = tiles[tiles[:, 0] == index]
+        # cores partition the sequence, and windows extend them by the overlap (clipped)
+        assert np.concatenate([np.arange(core_start, core_stop) for _, _, _, core_start, core_stop in index_tiles] + [np.zeros(0, dtype=np.int64)]).tolist() == list(range(length))
+        np.testing.assert_array_equal(index_tiles[:, 1], np.maximum(index_tiles[:, 3] - 25, 0))
+        np.testing.assert_array_equal(index_tiles[:, 2], np.minimum(index_tiles[:, 4] + 25, length))
+
+
+@pytest.mark.parametrize('extension', ['legacy', 'window'])
+@pytest.mark.parametrize('extend_flanks', [0, 2])
+@pytest.mark.parametrize('window_size', [50, 128, 1000])
+def test_search_tiles_matches_whole_sequences(extension, extend_flanks, window_size):
+    scores = _ragged_scores([3000, 1234, 40], n_peaks=8)
+    max_size = 10
+    kwargs = dict(sig_p=.01, max_size=max_size, extend_flanks=extend_flanks, extension=extension)
+    kwargs['thresholds'] = background_thresholds(scores.values, range(2, max_size + 1, 2), sig_p=.01, seed=0)
+
+    # (within a sequence, hits are ordered by window)
+    hits = np.sort(search_segments([scores[i] for i in range(len(scores.lengths))], **kwargs), order=['index', 'start', 'stop'])
+    hits_tiles = np.sort(search_tiles(scores, window_tiles(scores.lengths, window_size, max_size + extend_flanks), **kwargs), order=['index', 'start', 'stop'])
+    assert len(hits) > 0
+    np.testing.assert_array_equal(hits_tiles[['index', 'start', 'stop']], hits[['index', 'start', 'stop']])
+    np.testing.assert_allclose(hits_tiles['score'], hits['score'])
+
+
+@pytest.mark.parametrize('extend_flanks', [0, 2])
+def test_search_tiles_does_not_duplicate_hits(extend_flanks):
+    # dense hits, i.e. masks may chain across core boundaries
+    scores = _ragged_scores([2000, 2000], n_peaks=300, seed=1)
+    max_size = 10
+    kwargs = dict(sig_p=.05, max_size=max_size, extend_flanks=extend_flanks)
+    kwargs['thresholds'] = background_thresholds(scores.values, range(2, max_size + 1, 2), sig_p=.05, seed=0)
+
+    hits_tiles = search_tiles(scores, window_tiles(scores.lengths, 64, max_size + extend_flanks), **kwargs)
+    assert len(hits_tiles) > 0
+    assert len(np.unique(hits_tiles[['index', 'start', 'stop']])) == len(hits_tiles)
+
+
+@pytest.mark.parametrize('args, message', [(['--background', 'sequence'], 'global background'), (['--window-overlap', '3'], 'at least')])
+def test_window_rejects_invalid_options(dataset, args, message):
+    result = CliRunner().invoke(search, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(dataset / 'hits.tsv'), '--window', '50', *args])
+    assert result.exit_code == 2 and message in result.output
+    assert not (dataset / 'hits.tsv').exists()
+
+
+@pytest.mark.parametrize('window', [30, 50])
+def test_window_output_matches_whole_sequences(dataset, window):
+    args = [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '--seed', '0', '--background', 'global']
+    result = CliRunner().invoke(search, [*args, '-o', str(dataset / 'hits.tsv')])
+    assert result.exit_code == 0, result.output
+    result = CliRunner().invoke(search, [*args, '-o', str(dataset / 'hits-window.tsv'), '--window', str(window), '--batch-size', '16'])
+    assert result.exit_code == 0, result.output
+    assert (dataset / 'hits-window.tsv').read_bytes() == (dataset / 'hits.tsv').read_bytes()
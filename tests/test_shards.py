@@ -0,0 +1,71 @@
+import pytest
+from click.testing import CliRunner
+
+import metamotif.bin.search
+from metamotif.bin.merge import main as merge
+from metamotif.bin.search import main as search, shard_range
+
+
+def _search(dataset, output, *args):
+    result = CliRunner().invoke(search, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(output), '--seed', '0', '--batch-size', '7', *args])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_shard_range_partitions_sequences():
+    for n_sequences in [0, 1, 10, 101]:
+        for n in [1, 3, 8]:
+            ranges = [shard_range(n_sequences, i, n) for i in range(n)]
+            assert ranges[0][0] == 0 and ranges[-1][1] == n_sequences
+            assert all(stop == start for (_, stop), (start, _) in zip(ranges[:-1], ranges[1:]))
+
+
+@pytest.mark.parametrize('output_format', ['tsv', 'npz'])
+def test_merged_shards_match_single_run(dataset, output_format):
+    _search(dataset, dataset / f'hits.{output_format}', '--output-format', output_format)
+    shards = [dataset / f'hits-{i}.{output_format}' for i in range(3)]
+    for i, shard in enumerate(shards):
+        _search(dataset, shard, '--output-format', output_format, '--shard', f'{i}/3')
+    result = CliRunner().invoke(merge, [*map(str, shards), '-o', str(dataset / f'merged.{output_format}')])
+    assert result.exit_code == 0, result.output
+    assert (dataset / f'merged.{output_format}').read_bytes() == (dataset / f'hits.{output_format}').read_bytes()
+
+
+def test_resume_matches_uninterrupted_run(dataset, monkeypatch):
+    _search(dataset, dataset / 'hits.tsv')
+
+    # interrupt a run after 3 chunks
+    iter_search = metamotif.bin.search.iter_search
+    def interrupted_iter_search(*args, **kwargs):
+        for i, chunk in enumerate(iter_search(*args, **kwargs)):
+            if i == 3:
+                raise KeyboardInterrupt
+            yield chunk
+    monkeypatch.setattr(metamotif.bin.search, 'iter_search', interrupted_iter_search)
+    result = CliRunner().invoke(search, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(dataset / 'resumed.tsv'), '--seed', '0', '--batch-size', '7', '--checkpoint'])
+    assert result.exit_code != 0
+    assert (dataset / 'resumed.tsv.checkpoint').exists()
+    monkeypatch.setattr(metamotif.bin.search, 'iter_search', iter_search)
+
+    # rows written after the checkpoint are discarded
+    with open(dataset / 'resumed.tsv', 'a') as f:
+        f.write('partial\trow')
+    result = CliRunner().invoke(merge, [str(dataset / 'resumed.tsv'), '-o', str(dataset / 'merged.tsv')])
+    assert result.exit_code != 0 and 'incomplete' in result.output
+
+    _search(dataset, dataset / 'resumed.tsv', '--resume')
+    assert not (dataset / 'resumed.tsv.checkpoint').exists()
+    assert (dataset / 'resumed.tsv').read_bytes() == (dataset / 'hits.tsv').read_bytes()
+
+
+def test_resume_rejects_other_runs(dataset, monkeypatch):
+    iter_search = metamotif.bin.search.iter_search
+    def interrupted_iter_search(*args, **kwargs):
+        yield next(iter(iter_search(*args, **kwargs)))
+        raise KeyboardInterrupt
+    monkeypatch.setattr(metamotif.bin.search, 'iter_search', interrupted_iter_search)
+    CliRunner().invoke(search, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(dataset / 'hits.tsv'), '--seed', '0', '--checkpoint'])
+    monkeypatch.setattr(metamotif.bin.search, 'iter_search', iter_search)
+
+    result = CliRunner().invoke(search, [str(dataset / 'seqs.fasta'), str(dataset / 'scores.npy'), '-o', str(dataset / 'hits.tsv'), '--seed', '1', '--resume'])
+    assert result.exit_code != 0 and 'different run' in result.output
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from metamotif.similarity import motif_similarity, similarity_matrix
+
+
+# transcription of legacy.similarity.motif_similarity (without tensorflow), which similarity_matrix must reproduce
+def baseline_motif_similarity(pwm_1, pwm_2, min_size=3, eps=1e-7):
+    if len(pwm_1) < len(pwm_2):
+        pwm_1, pwm_2 = pwm_2, pwm_1
+    padding = len(pwm_2) - min_size
+    pwm_1_padded = np.pad(pwm_1, [[padding, padding], [0, 0]])
+    window_sims = []
+    for i in range(len(pwm_1_padded) - len(pwm_2) + 1):
+        window = pwm_1_padded[i:(i + len(pwm_2))]
+        mask = (window.sum(axis=1) != 0) & (pwm_2.sum(axis=1) != 0)
+        p, q = window[mask], pwm_2[mask]
+        m = np.clip((p + q) / 2, eps, 1)
+        p, q = np.clip(p, eps, 1), np.clip(q, eps, 1)
+        jsd = np.sum(p * np.log2(p / m), axis=-1) / 2 + np.sum(q * np.log2(q / m), axis=-1) / 2
+        window_sims.append(np.mean(1 - jsd) if mask.any() else np.nan)
+    return np.nanmax(window_sims)
+
+
+def _pwms(n, lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.dirichlet(np.ones(4) * .5, size=rng.choice(lengths)) for _ in range(n)]
+
+
+@pytest.mark.parametrize('max_block_size', [1, 2**10, 2**22])
+def test_similarity_matrix_matches_baseline(max_block_size):
+    pwms_a, pwms_b = _pwms(7, [3, 4, 6, 8]), _pwms(9, [3, 5, 8], seed=1)
+    # missing positions (row-sum = 0) are ignored
+    pwms_b[0][1] = 0
+
+    similarities = similarity_matrix(pwms_a, pwms_b, max_block_size=max_block_size)
+    expected = np.array([[baseline_motif_similarity(pwm_a, pwm_b) for pwm_b in pwms_b] for pwm_a in pwms_a])
+    np.testing.assert_allclose(similarities, expected, rtol=1e-10)
+
+    # symmetric case
+    np.testing.assert_allclose(similarity_matrix(pwms_a, max_block_size=max_block_size), similarity_matrix(pwms_a, pwms_a), rtol=1e-10)
+
+
+def test_similarity_matches_legacy():
+    pytest.importorskip('tensorflow')
+    from metamotif.legacy import similarity as legacy_similarity
+
+    pwms = _pwms(4, [3, 5, 7])
+    for pwm_1 in pwms:
+        for pwm_2 in pwms:
+            np.testing.assert_allclose(motif_similarity(pwm_1, pwm_2), float(legacy_similarity.motif_similarity(pwm_1, pwm_2)), rtol=1e-5)
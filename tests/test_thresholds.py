@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from metamotif.search import ThresholdCache, background_thresholds, exact_significance_thresholds
+
+
+@pytest.mark.parametrize('n_scores', [50, 200, 5000])
+def test_exact_thresholds_match_distribution(n_scores):
+    # the (1 - sig_p) quantile of the sum of size scores drawn with replacement, up to the binning error
+    rng = np.random.default_rng(0)
+    scores = rng.normal(size=n_scores)
+    sizes = [2, 6, 12]
+    thresholds = exact_significance_thresholds(scores, sizes, sig_p=.01)
+    for size in sizes:
+        null_samples = np.sum(rng.choice(scores, size=(200_000, size)), axis=1)
+        bin_width = np.ptp(scores) / (min(1024, n_scores) - 1)
+        assert abs(thresholds[size] - np.quantile(null_samples, .99)) < size * bin_width / 2 + .05 * np.sqrt(size)
+
+
+def test_exact_thresholds_edge_cases():
+    assert exact_significance_thresholds(np.full(10, .5), [2, 4]) == {2: 1., 4: 2.}
+    assert all(np.isnan(threshold) for threshold in exact_significance_thresholds(np.full(10, np.nan), [2, 4]).values())
+    assert exact_significance_thresholds(np.ones(10), []) == {}
+
+
+def test_threshold_cache_evicts_least_recently_used():
+    rng = np.random.default_rng(0)
+    cache = ThresholdCache(maxsize=2, seed=0)
+    a, b, c = (rng.normal(size=50) for _ in range(3))
+    cache.thresholds(a, [2])
+    cache.thresholds(b, [2])
+    cache.thresholds(a, [2])
+    assert (cache.hits, cache.misses) == (1, 2)
+    # b is the least recently used, i.e. evicted
+    cache.thresholds(c, [2])
+    assert len(cache) == 2
+    cache.thresholds(a, [2])
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache.thresholds(b, [2])
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_threshold_cache_is_order_independent():
+    # with a seed, the thresholds of each key are drawn from their own RNG
+    rng = np.random.default_rng(0)
+    scores = [rng.normal(size=100) for _ in range(5)]
+    requests = [(i, size) for i in range(5) for size in [2, 4, 6]]
+
+    thresholds = []
+    for order in [range(len(requests)), rng.permutation(len(requests))]:
+        cache = ThresholdCache(seed=0)
+        thresholds.append({requests[j]: cache.thresholds(scores[requests[j][0]], [requests[j][1]])[requests[j][1]] for j in order})
+    assert thresholds[0] == thresholds[1]
+    # (and in a single request, with a cold cache)
+    assert ThresholdCache(seed=0).thresholds(scores[3], [2, 4, 6]) == {size: thresholds[0][(3, size)] for size in [2, 4, 6]}
+    assert ThresholdCache(seed=1).thresholds(scores[3], [2, 4, 6]) != ThresholdCache(seed=0).thresholds(scores[3], [2, 4, 6])
+
+
+@pytest.mark.parametrize('method', ['sampling', 'exact'])
+def test_background_thresholds(method):
+    rng = np.random.default_rng(0)
+    scores = rng.normal(size=(20, 50))
+    thresholds = background_thresholds(scores, [2, 6], n=20_000, sig_p=.05, seed=0, method=method)
+    assert thresholds == background_thresholds(scores, [2, 6], n=20_000, sig_p=.05, seed=0, method=method)
+    # the (1 - sig_p) quantile of the sum of size scores, drawn from all sequences (with replacement)
+    for size in [2, 6]:
+        null_samples = np.sum(rng.choice(scores.reshape(-1), size=(200_000, size)), axis=1)
+        assert abs(thresholds[size] - np.quantile(null_samples, .95)) < .05 * np.sqrt(size)
+    with pytest.raises(ValueError, match='Unknown threshold method'):
+        background_thresholds(scores, [2], method='other')
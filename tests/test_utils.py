@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from metamotif.utils import sequence2onehot, sequences2onehot
+
+
+def _onehot(sequence, sigma='ACGT'):
+    # as encoded by the original (tensorflow) implementation, i.e. unknown characters are all-zero
+    index = dict(zip(sigma, range(len(sigma))))
+    return np.array([[float(index.get(x, -1) == i) for i in range(len(sigma))] for x in sequence], dtype=np.float32).reshape(-1, len(sigma))
+
+
+@pytest.mark.parametrize('sequence', ['ACGTNacgt-', '', 'AÄC'])
+def test_sequence2onehot_types(sequence):
+    from Bio.Seq import Seq
+
+    expected = _onehot(sequence)
+    sequences = [sequence, list(sequence), tuple(sequence), np.array(list(sequence), dtype=np.str_)] + ([Seq(sequence)] if sequence.isascii() else [])
+    for sequence_ in sequences:
+        np.testing.assert_array_equal(sequence2onehot(sequence_), expected)
+    np.testing.assert_array_equal(sequence2onehot(sequence, sigma='ACGU'), _onehot(sequence, sigma='ACGU'))
+
+
+def test_sequences2onehot():
+    from Bio.Seq import Seq
+
+    sequences = ['ACGT', list('TTGN'), Seq('GGCA')]
+    np.testing.assert_array_equal(sequences2onehot(sequences), np.stack([_onehot(sequence) for sequence in sequences]))